@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Job, JobOffer
+from .models import Job, JobOffer, JobView
 
 
 @admin.register(JobOffer)
@@ -90,3 +90,11 @@ class JobAdmin(admin.ModelAdmin):
     list_filter = ('status', 'created_at')
     search_fields = ('title', 'company', 'description')
     readonly_fields = ('created_at',)
+
+
+@admin.register(JobView)
+class JobViewAdmin(admin.ModelAdmin):
+    list_display = ('job', 'telegram_id', 'viewed_at')
+    list_filter = ('viewed_at',)
+    search_fields = ('telegram_id', 'job__title')
+    readonly_fields = ('job', 'telegram_id', 'viewed_at')
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:43
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0002_joboffer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobView',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('telegram_id', models.CharField(blank=True, db_index=True, max_length=64)),
+                ('viewed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='views', to='jobs.joboffer')),
+            ],
+            options={
+                'verbose_name': 'Job View',
+                'verbose_name_plural': 'Job Views',
+                'ordering': ['-viewed_at'],
+                'indexes': [models.Index(fields=['job', 'viewed_at'], name='jobs_jobvie_job_id_d75b29_idx')],
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 class JobOffer(models.Model):
     """Modelo para ofertas laborales"""
@@ -56,6 +57,23 @@ class JobOffer(models.Model):
         return "No especificado"
 
 
+class JobView(models.Model):
+    """Visualización de una oferta por un usuario del bot (para analítica)"""
+    job = models.ForeignKey(JobOffer, on_delete=models.CASCADE, related_name='views')
+    # Relación genérica con TelegramUser, igual que created_by_user_id
+    telegram_id = models.CharField(max_length=64, blank=True, db_index=True)
+    viewed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-viewed_at']
+        indexes = [models.Index(fields=['job', 'viewed_at'])]
+        verbose_name = 'Job View'
+        verbose_name_plural = 'Job Views'
+
+    def __str__(self):
+        return f"{self.job_id} visto por {self.telegram_id}"
+
+
 class Job(models.Model):
     """Modelo legado para compatibilidad"""
     STATUS = (
@@ -0,0 +1,16 @@
+"""
+Señales para invalidar el snapshot de ofertas publicadas
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from apps.jobs.models import JobOffer
+from apps.jobs.snapshot import invalidate_jobs_snapshot
+
+
+@receiver([post_save, post_delete], sender=JobOffer)
+def invalidate_job_offers(sender, instance, update_fields=None, **kwargs):
+    """Cualquier cambio en una oferta invalida el snapshot (salvo el contador de vistas)"""
+    if update_fields and set(update_fields) <= {'views_count'}:
+        return
+    invalidate_jobs_snapshot()
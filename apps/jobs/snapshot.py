@@ -0,0 +1,91 @@
+"""
+Snapshot en memoria de las ofertas publicadas
+Se usa como contexto del prompt de Gemini sin consultar la BD en cada mensaje.
+Se reconstruye cuando cambia una JobOffer (señales) o cuando vence el TTL.
+"""
+import os
+import time
+import logging
+import threading
+from dotenv import load_dotenv
+
+from apps.jobs.models import JobOffer
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+JOBS_SNAPSHOT_TTL = int(os.getenv('JOBS_SNAPSHOT_TTL', '300'))  # segundos
+JOBS_SNAPSHOT_LIMIT = 5      # Ofertas guardadas en el snapshot
+JOBS_PROMPT_LIMIT = 3        # Ofertas que se incluyen en el prompt
+
+
+class JobsSnapshot:
+    """Foto inmutable de las ofertas publicadas"""
+
+    __slots__ = ('version', 'jobs', 'prompt_block', 'built_at')
+
+    def __init__(self, version: int, jobs: tuple, prompt_block: str):
+        self.version = version
+        self.jobs = jobs
+        self.prompt_block = prompt_block
+        self.built_at = time.monotonic()
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() - self.built_at < JOBS_SNAPSHOT_TTL
+
+
+_lock = threading.Lock()
+_snapshot = None
+_version = 0
+
+
+def render_jobs_prompt_block(jobs) -> str:
+    """Genera el bloque de ofertas que se pega en el prompt de Gemini"""
+    if not jobs:
+        return ''
+    block = "\n--- OFERTAS DISPONIBLES ---\n"
+    for job in jobs[:JOBS_PROMPT_LIMIT]:
+        block += f"• {job['title']} en {job['company']} - {job['location']}\n"
+    return block
+
+
+def get_cached_snapshot():
+    """Devuelve el snapshot actual si sigue vigente (nunca consulta la BD)"""
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.is_fresh():
+        return snapshot
+    return None
+
+
+def get_published_jobs_snapshot() -> JobsSnapshot:
+    """
+    Obtiene el snapshot de ofertas publicadas (sincrónico)
+
+    Solo consulta la BD si el snapshot fue invalidado o venció el TTL.
+    """
+    global _snapshot, _version
+
+    snapshot = get_cached_snapshot()
+    if snapshot is not None:
+        return snapshot
+
+    with _lock:
+        snapshot = get_cached_snapshot()
+        if snapshot is not None:
+            return snapshot
+
+        jobs = tuple(
+            JobOffer.objects.filter(status='published').values(
+                'title', 'company', 'location'
+            )[:JOBS_SNAPSHOT_LIMIT]
+        )
+        _version += 1
+        _snapshot = JobsSnapshot(_version, jobs, render_jobs_prompt_block(jobs))
+        logger.info(f"[JobsSnapshot] Reconstruido v{_version} ({len(jobs)} ofertas)")
+        return _snapshot
+
+
+def invalidate_jobs_snapshot():
+    """Marca el snapshot como obsoleto (se reconstruye en el próximo acceso)"""
+    global _snapshot
+    _snapshot = None
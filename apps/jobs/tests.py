@@ -0,0 +1,43 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from apps.jobs import view_counter as view_counter_module
+from apps.jobs.models import JobOffer, JobView
+from apps.jobs.view_counter import ViewCounter
+
+
+def _job(title: str) -> JobOffer:
+    return JobOffer.objects.create(title=title, company='Magneto', description='Oferta de prueba')
+
+
+class ViewCounterFlushTests(TestCase):
+    """Las vistas de ofertas eliminadas no bloquean los flushes"""
+
+    def test_views_of_deleted_job_are_dropped(self):
+        kept, deleted = _job('Ventas'), _job('Soporte')
+        counter = ViewCounter()
+        counter.record(kept.id, 1)
+        counter.record(kept.id, 2)
+        counter.record(deleted.id, 3)
+        deleted.delete()
+
+        self.assertEqual(counter.flush(), 2)
+
+        kept.refresh_from_db()
+        self.assertEqual(kept.views_count, 2)
+        self.assertEqual(JobView.objects.filter(job=kept).count(), 2)
+        self.assertEqual(counter.pending(), 0)
+
+    def test_pending_views_dropped_after_repeated_failures(self):
+        job = _job('Ventas')
+        counter = ViewCounter()
+        counter.record(job.id, 1)
+
+        with mock.patch.object(view_counter_module, 'write_views', side_effect=RuntimeError('BD caída')):
+            for _ in range(view_counter_module.JOB_VIEWS_MAX_FAILED_FLUSHES - 1):
+                counter.flush()
+                self.assertEqual(counter.pending(), 1)
+            counter.flush()
+
+        self.assertEqual(counter.pending(), 0)
@@ -0,0 +1,165 @@
+"""
+Contador de vistas de ofertas agregado en memoria
+El bot registra cada vista sin tocar la BD; periódicamente se suman los deltas
+con un único UPDATE atómico (F('views_count') + n) y se insertan los eventos
+JobView por usuario con bulk_create.
+"""
+import os
+import asyncio
+import logging
+import threading
+from collections import Counter
+from dotenv import load_dotenv
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from apps.jobs.models import JobOffer, JobView
+from apps.telegram_agent.db import run_db
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+JOB_VIEWS_FLUSH_INTERVAL = float(os.getenv('JOB_VIEWS_FLUSH_INTERVAL', '30'))  # segundos
+# Eventos pendientes máximos si la BD no responde (se descartan los más viejos)
+JOB_VIEWS_MAX_PENDING = int(os.getenv('JOB_VIEWS_MAX_PENDING', '50000'))
+# Flushes fallidos seguidos tras los que se descartan las vistas acumuladas
+JOB_VIEWS_MAX_FAILED_FLUSHES = int(os.getenv('JOB_VIEWS_MAX_FAILED_FLUSHES', '10'))
+
+
+def write_views(deltas: dict, events: list) -> int:
+    """
+    Suma las vistas y guarda los eventos en una transacción (sincrónico)
+
+    Las vistas de ofertas que ya no existen se descartan: su JobView fallaría
+    la FK y, al reintentarse, bloquearía todos los flushes siguientes.
+
+    Args:
+        deltas: {job_id: vistas nuevas}
+        events: JobView sin guardar
+
+    Returns:
+        Vistas descartadas por ofertas eliminadas
+    """
+    with transaction.atomic():
+        job_ids = set(deltas) | {event.job_id for event in events}
+        existing = set(JobOffer.objects.filter(id__in=job_ids).values_list('id', flat=True))
+        dropped = 0
+        if existing != job_ids:
+            dropped = sum(n for job_id, n in deltas.items() if job_id not in existing)
+            deltas = {job_id: n for job_id, n in deltas.items() if job_id in existing}
+            events = [event for event in events if event.job_id in existing]
+            logger.warning(
+                f"[ViewCounter] {dropped} vistas de {len(job_ids - existing)} ofertas eliminadas descartadas"
+            )
+        if deltas:
+            # Un solo UPDATE; queryset.update no dispara señales (el snapshot sigue válido)
+            JobOffer.objects.filter(id__in=deltas).update(
+                views_count=F('views_count') + Case(
+                    *[When(id=job_id, then=Value(n)) for job_id, n in deltas.items()],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+            )
+        if events:
+            JobView.objects.bulk_create(events)
+    return dropped
+
+
+class ViewCounter:
+    """Agregador thread-safe de vistas con flush periódico"""
+
+    def __init__(self, flush_interval: float = JOB_VIEWS_FLUSH_INTERVAL,
+                 max_pending: int = JOB_VIEWS_MAX_PENDING):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.flushed = 0
+        self.failed_flushes = 0
+        self._deltas = Counter()
+        self._events = []
+        self._lock = threading.Lock()
+        self._task = None
+
+    def record(self, job_id: int, telegram_id=None):
+        """Registra una vista (no bloquea ni consulta la BD)"""
+        event = JobView(job_id=job_id, telegram_id=str(telegram_id or ''), viewed_at=timezone.now())
+        with self._lock:
+            self._deltas[job_id] += 1
+            self._events.append(event)
+            if len(self._events) > self.max_pending:
+                del self._events[:len(self._events) - self.max_pending]
+
+    def pending(self) -> int:
+        """Vistas sin guardar (lo lee el gauge desde el hilo de /metrics)"""
+        with self._lock:
+            return sum(self._deltas.values())
+
+    def flush(self) -> int:
+        """
+        Escribe las vistas acumuladas (sincrónico)
+
+        Returns:
+            Número de vistas escritas
+        """
+        with self._lock:
+            deltas, self._deltas = self._deltas, Counter()
+            events, self._events = self._events, []
+        if not deltas:
+            return 0
+
+        try:
+            dropped = write_views(dict(deltas), events)
+        except Exception as e:
+            self.failed_flushes += 1
+            logger.error(f"[ViewCounter] Error guardando {sum(deltas.values())} vistas: {str(e)}")
+            if self.failed_flushes >= JOB_VIEWS_MAX_FAILED_FLUSHES:
+                # No acumular sin límite mientras la BD sigue fallando
+                logger.error(
+                    f"[ViewCounter] {self.failed_flushes} flushes fallidos seguidos: "
+                    f"se descartan {sum(deltas.values())} vistas"
+                )
+                self.failed_flushes = 0
+                return 0
+            # Devolver al acumulador para el próximo flush
+            with self._lock:
+                self._deltas.update(deltas)
+                self._events[:0] = events
+                if len(self._events) > self.max_pending:
+                    del self._events[:len(self._events) - self.max_pending]
+            return 0
+
+        self.failed_flushes = 0
+        total = sum(deltas.values()) - dropped
+        self.flushed += total
+        logger.debug(f"[ViewCounter] {total} vistas de {len(deltas)} ofertas guardadas")
+        return total
+
+    async def aflush(self) -> int:
+        return await run_db(self.flush)
+
+    async def _run(self):
+        """Loop de flush periódico"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.aflush()
+
+    def start(self):
+        """Inicia el flush periódico en el loop actual (al arrancar el bot)"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Detiene el loop y hace el flush final (al apagar el bot)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.aflush()
+        logger.info(f"[ViewCounter] Detenido: {self.flushed} vistas guardadas")
+
+
+# Contador compartido del proceso del bot
+view_counter = ViewCounter()
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from .models import (
-    TelegramUser, TelegramMessage, AIResponse, Broadcast, TelegramConfig,
+    TelegramUser, TelegramMessage, AIResponse, Broadcast, TelegramConfig, BotState, PendingUpdate,
     Survey, SurveyQuestion, SurveyOption, SurveyResponse, SurveyAnswer
 )
 
@@ -34,7 +34,7 @@ class TelegramMessageAdmin(admin.ModelAdmin):
     list_display = ('user', 'message_type', 'direction', 'content_preview', 'created_at')
     list_filter = ('message_type', 'direction', 'created_at')
     search_fields = ('user__username', 'content')
-    readonly_fields = ('user', 'telegram_message_id', 'created_at', 'content_display')
+    readonly_fields = ('user', 'chat_id', 'telegram_message_id', 'created_at', 'content_display')
     
     def content_preview(self, obj):
         return obj.content[:100] + '...' if len(obj.content) > 100 else obj.content
@@ -144,6 +144,22 @@ class TelegramConfigAdmin(admin.ModelAdmin):
     value_preview.short_description = 'Valor'
 
 
+@admin.register(BotState)
+class BotStateAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'key', 'updated_at')
+    list_filter = ('kind',)
+    search_fields = ('key',)
+    readonly_fields = ('updated_at',)
+
+
+@admin.register(PendingUpdate)
+class PendingUpdateAdmin(admin.ModelAdmin):
+    list_display = ('update_id', 'chat_id', 'status', 'attempts', 'created_at', 'processed_at')
+    list_filter = ('status',)
+    search_fields = ('update_id', 'chat_id')
+    readonly_fields = ('created_at', 'processed_at')
+
+
 # ============ ADMIN PARA ENCUESTAS ============
 
 class SurveyOptionInline(admin.TabularInline):
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 class TelegramAgentConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.telegram_agent'
+
+    def ready(self):
+        from apps.telegram_agent import signals  # noqa: F401
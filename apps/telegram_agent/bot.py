@@ -1,32 +1,84 @@
 """
 Bot de Telegram simple con python-telegram-bot
-Integración con Gemini AI y polling
+Integración con Gemini AI, en modo polling o webhook
 """
 import os
-import sys
+import time
 import logging
 from telegram import Update
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, ContextTypes, filters
+from telegram.error import BadRequest
+from telegram.ext import (
+    ApplicationBuilder, ApplicationHandlerStop, CommandHandler, MessageHandler, TypeHandler,
+    ContextTypes, filters,
+)
 from dotenv import load_dotenv
-from asgiref.sync import sync_to_async
 
 # Django setup
 import django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'recruitment_bot.settings')
 django.setup()
 
+from django.db import transaction
 from django.utils import timezone
 from apps.telegram_agent.models import (
-    TelegramUser, TelegramMessage, AIResponse,
-    Survey, SurveyQuestion, SurveyOption, SurveyResponse, SurveyAnswer
+    TelegramMessage, AIResponse,
+    Survey, SurveyResponse, SurveyAnswer
 )
 from apps.jobs.models import JobOffer
-from services.gemini_client import GeminiClient
+from apps.jobs import snapshot as jobs_snapshot
+from apps.jobs.view_counter import view_counter
+from apps.telegram_agent import user_cache
+from apps.telegram_agent.write_behind import write_behind
+from apps.telegram_agent.conversation_memory import conversation_memory
+from apps.telegram_agent.update_processor import ChatOrderedUpdateProcessor
+from apps.telegram_agent.chat_queue import ChatQueue, ACCEPTED, OVERFLOW
+from apps.telegram_agent.dedupe import seen_messages, message_key
+from apps.telegram_agent.persistence import DjangoPersistence
+from apps.telegram_agent.db import run_db, shutdown as shutdown_db
+from services.telegram_rate import TelegramRateLimiter
+from apps.telegram_agent.survey_graph import get_survey_graph, get_cached_survey_graph, load_survey_graph
+from services.gemini_pool import get_gemini_client
+from services.response_cache import response_cache
+from utils.metrics import registry, STAGE_SECONDS, stage_timer, start_metrics_server
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
+# Número de updates que se procesan en paralelo (conversaciones simultáneas)
+BOT_CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', '32'))
+
+# Modo de ejecución: 'polling' o 'webhook'
+TELEGRAM_BOT_MODE = os.getenv('TELEGRAM_BOT_MODE', 'polling')
+TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL')  # URL pública base, p. ej. https://bot.example.com
+TELEGRAM_WEBHOOK_PATH = os.getenv('TELEGRAM_WEBHOOK_PATH', 'telegram-bot')
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET')
+TELEGRAM_WEBHOOK_LISTEN = os.getenv('TELEGRAM_WEBHOOK_LISTEN', '0.0.0.0')
+TELEGRAM_WEBHOOK_PORT = int(os.getenv('TELEGRAM_WEBHOOK_PORT', '8443'))
+
+ALLOWED_UPDATES = ["message", "callback_query"]
+
+# Puerto de /metrics del proceso del bot (vacío = sin servidor de métricas)
+BOT_METRICS_PORT = os.getenv('BOT_METRICS_PORT')
+
+# Streaming de respuestas de Gemini (edición progresiva del mensaje)
+GEMINI_STREAMING = os.getenv('GEMINI_STREAMING', '1') == '1'
+BOT_STREAM_EDIT_INTERVAL = float(os.getenv('BOT_STREAM_EDIT_INTERVAL', '1.0'))  # segundos entre ediciones
+
+TELEGRAM_MAX_MESSAGE = 4000
+EMPTY_RESPONSE_TEXT = "No pude generar una respuesta. Por favor intenta de nuevo."
+QUEUE_FULL_TEXT = "⏳ Sigo respondiendo tus mensajes anteriores, espera un momento por favor."
+
+
+async def drop_duplicate_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Descarta los updates ya recibidos antes de llegar a los demás handlers (grupo -1)"""
+    if update.message:
+        key = message_key(update.message.chat_id, update.message.message_id)
+    else:
+        key = ('update', update.update_id)
+    if seen_messages.seen(key):
+        logger.info("Update repetido descartado", extra={'update_id': update.update_id})
+        raise ApplicationHandlerStop
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -57,9 +109,9 @@ En que puedo ayudarte hoy?"""
 async def ofertas(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /ofertas - Mostrar ofertas publicadas"""
     try:
-        jobs = await sync_to_async(lambda: list(
+        jobs = await run_db(lambda: list(
             JobOffer.objects.filter(status='published').order_by('-created_at')[:5]
-        ))()
+        ))
         
         if not jobs:
             await update.message.reply_text("No hay ofertas disponibles actualmente.")
@@ -80,8 +132,8 @@ Descripcion:
                 
                 await update.message.reply_text(job_text)
                 
-                # Registrar visualización
-                await sync_to_async(update_job_views)(job)
+                # Registrar visualización (se suma a la BD en el próximo flush)
+                view_counter.record(job.id, update.effective_user.id)
             except Exception as e:
                 logger.error(f"Error procesando oferta {job.id}: {str(e)}")
                 continue
@@ -116,7 +168,7 @@ async def perfil(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /perfil - Ver perfil"""
     try:
         user = await get_or_create_user(update.effective_user)
-        msg_count = await sync_to_async(lambda: TelegramMessage.objects.filter(user=user).count())()
+        msg_count = await run_db(lambda: TelegramMessage.objects.filter(user=user).count())
         
         profile_text = f"""Tu Perfil
 
@@ -138,11 +190,11 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handler para mensajes generales"""
     
     try:
-        logger.info(f"=== Nueva peticion recibida de {update.effective_user.username}")
         
         # Obtener o crear usuario (en thread sincrónico)
-        user = await sync_to_async(get_or_create_user_sync)(update.effective_user)
-        logger.info(f"Usuario: {user.username} (ID: {user.telegram_id})")
+        with stage_timer('user_lookup'):
+            user = await run_db(get_or_create_user_sync, update.effective_user)
+        logger.info("Nueva petición", extra={'username': user.username, 'user_id': user.telegram_id})
         
         # Verificar si está respondiendo encuesta
         if context.user_data.get('survey_mode'):
@@ -152,7 +204,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
             if survey_id_str in survey_mapping:
                 survey_id = survey_mapping[survey_id_str]
-                survey = await sync_to_async(Survey.objects.get)(id=survey_id)
+                survey = await run_db(Survey.objects.get, id=survey_id)
                 tg_user = update.effective_user
                 
                 context.user_data['survey_mode'] = False
@@ -166,112 +218,261 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await procesar_respuesta_encuesta(update, context, update.message.text)
             return
         
-        # Crear mensaje en BD (en thread sincrónico)
-        msg = await sync_to_async(create_message_sync)(user, update.message)
-        logger.info(f"Mensaje registrado en DB (ID: {msg.id})")
-        
-        # Obtener contexto (en thread sincrónico)
-        available_jobs = await sync_to_async(get_available_jobs)()
-        logger.info(f"Ofertas disponibles: {len(available_jobs)}")
+        # Encolar para la IA: el handler termina ya y libera el orden del chat
+        status = chat_queue.submit(update.effective_chat.id, (update.message, user))
+        if status != ACCEPTED:
+            # Se guarda el mensaje, pero no se llama a Gemini
+            write_behind.add(build_message(user, update.message))
+            if status == OVERFLOW:
+                await update.message.reply_text(QUEUE_FULL_TEXT)
+            logger.info(f"Cola llena para {user.username}, mensaje no enviado a Gemini")
+    
+    except Exception as e:
+        logger.error(f"ERROR en handle_message: {str(e)}", exc_info=True)
         
-        context_data = {'available_jobs': available_jobs}
+        try:
+            if update and update.message:
+                await update.message.reply_text(f"ERROR: {str(e)[:100]}")
+        except Exception as reply_error:
+            logger.error(f"No se pudo enviar mensaje de error: {str(reply_error)}")
+
+
+async def responder_con_ia(chat_id, items):
+    """
+    Responder con Gemini un lote de mensajes del mismo chat (worker de chat_queue)
+    
+    Args:
+        chat_id: Chat de los mensajes
+        items: Lista de (mensaje de Telegram, TelegramUser) en orden de llegada;
+            si hay varios se responden juntos con una sola llamada
+    """
+    message, user = items[-1]
+    started = time.perf_counter()
+    try:
+        # Construir mensajes (se guardan en BD con write-behind, sin esperar)
+        msgs = [build_message(item_user, item_message) for item_message, item_user in items]
+        user_text = "\n".join(item_message.text for item_message, _ in items)
+        
+        # Obtener contexto (snapshot en memoria, solo va a la BD si está vencido)
+        with stage_timer('job_context'):
+            snapshot = jobs_snapshot.get_cached_snapshot() or \
+                await run_db(jobs_snapshot.get_published_jobs_snapshot)
+        logger.debug("Contexto de ofertas", extra={'jobs': len(snapshot.jobs), 'snapshot': snapshot.version})
+        
+        # Historial reciente (en memoria; solo se lee de la BD si el usuario no está cargado)
+        with stage_timer('history'):
+            recent_messages = await conversation_memory.aget_history(str(user.telegram_id))
+        
+        context_data = {
+            'available_jobs': list(snapshot.jobs),
+            'jobs_prompt_block': snapshot.prompt_block,
+            'recent_messages': recent_messages,
+        }
         
         # Mostrar accion de "escribiendo"
-        await update.message.chat.send_action("typing")
-        logger.info("Enviando accion 'typing' a Telegram")
-        
-        # Obtener respuesta de Gemini (operación I/O, puede ser async)
-        logger.info(f"Llamando a Gemini con: {update.message.text[:50]}...")
-        gemini = GeminiClient()
-        ai_result = gemini.get_response(
-            update.message.text,
+        await message.chat.send_action("typing")
+        
+        # Obtener respuesta de Gemini (async, no bloquea a los demás usuarios)
+        logger.debug("Llamando a Gemini", extra={'text': user_text[:50]})
+        gemini = get_gemini_client()
+        if GEMINI_STREAMING:
+            # El usuario ve la respuesta mientras Gemini la genera (llamada y envío juntos)
+            stream = gemini.astream_response(
+                user_text,
+                str(user.telegram_id),
+                context_data,
+                use_cache=True
+            )
+            with stage_timer('gemini_stream'):
+                ai_result = await reply_streaming(message, stream)
+        else:
+            with stage_timer('gemini_call'):
+                ai_result = await gemini.aget_response(
+                    user_text,
+                    str(user.telegram_id),
+                    context_data,
+                    use_cache=True
+                )
+            with stage_timer('telegram_send'):
+                await reply_long_text(message, ai_result['response'])
+        
+        conversation_memory.append_turn(
             str(user.telegram_id),
-            context_data
+            user_text,
+            None if ai_result.get('error') else ai_result['response']
         )
-        logger.info(f"Respuesta Gemini obtenida. Error: {ai_result.get('error')}, Longitud: {len(ai_result['response'])}")
-        
-        # Guardar respuesta de IA (en thread sincrónico)
-        ai_response = await sync_to_async(create_ai_response_sync)(msg, ai_result)
-        logger.info(f"AIResponse guardada en DB (ID: {ai_response.id}, Status: {ai_response.status})")
-        
-        # Enviar respuesta
-        response_text = ai_result['response']
-        if not response_text or len(response_text.strip()) == 0:
-            logger.warning("Respuesta vacia de Gemini")
-            response_text = "No pude generar una respuesta. Por favor intenta de nuevo."
-        
-        logger.info(f"Enviando respuesta a Telegram ({len(response_text)} caracteres)...")
-        
-        if len(response_text) > 4000:
-            chunks = [response_text[i:i+4000] for i in range(0, len(response_text), 4000)]
-            logger.info(f"Dividiendo en {len(chunks)} mensajes")
-            for i, chunk in enumerate(chunks):
-                await update.message.reply_text(chunk, parse_mode="HTML")
-                logger.info(f"Chunk {i+1}/{len(chunks)} enviado")
-        else:
-            await update.message.reply_text(response_text, parse_mode="HTML")
-            logger.info("Respuesta enviada exitosamente")
         
-        logger.info(f"OK - Mensaje procesado completamente de {user.username}")
+        # Encolar mensajes y respuesta de IA (ligada al último mensaje) para guardarlos en lote
+        for msg in msgs[:-1]:
+            write_behind.add(msg)
+        ai_response = build_ai_response(msgs[-1], ai_result)
+        write_behind.add(msgs[-1], ai_response)
+        logger.info("Mensaje respondido", extra={
+            'username': user.username,
+            'messages': len(msgs),
+            'chars': len(ai_result['response']),
+            'error': bool(ai_result.get('error')),
+            'cached': bool(ai_result.get('cached')),
+            'ms': round((time.perf_counter() - started) * 1000),
+        })
     
     except Exception as e:
-        import traceback
-        error_detail = traceback.format_exc()
-        logger.error(f"ERROR en handle_message: {str(e)}")
-        logger.error(f"Traceback: {error_detail}")
-        
+        logger.error(f"ERROR respondiendo con IA: {str(e)}", exc_info=True)
         try:
-            if update and update.message:
-                await update.message.reply_text(f"ERROR: {str(e)[:100]}")
+            await message.reply_text(f"ERROR: {str(e)[:100]}")
         except Exception as reply_error:
             logger.error(f"No se pudo enviar mensaje de error: {str(reply_error)}")
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, flow='bot', stage='total')
+
+
+# Un worker por chat: junta los mensajes que llegan mientras Gemini responde
+chat_queue = ChatQueue(responder_con_ia)
+
+# Estado de las colas y cachés del bot (se lee al exportar /metrics)
+registry.gauge('recruitment_chat_queue_pending', 'Mensajes esperando respuesta de IA', callback=chat_queue.depth)
+registry.gauge('recruitment_write_behind_pending', 'Filas pendientes de guardar en BD',
+               callback=write_behind.pending)
+registry.gauge('recruitment_job_views_pending', 'Vistas de ofertas pendientes de guardar',
+               callback=view_counter.pending)
+registry.gauge(
+    'recruitment_cache_hit_rate', 'Tasa de aciertos de las cachés en memoria', ('cache',),
+    callback=lambda: {
+        ('response',): response_cache.stats()['hit_rate'],
+        ('user',): user_cache.user_cache_stats()['hit_rate'],
+    },
+)
+
+
+# ============ ENVÍO DE RESPUESTAS ============
+
+def split_text(text: str):
+    """Divide un texto en partes que caben en un mensaje de Telegram"""
+    return [text[i:i + TELEGRAM_MAX_MESSAGE] for i in range(0, len(text), TELEGRAM_MAX_MESSAGE)]
+
+
+async def reply_long_text(message, response_text: str):
+    """Envía una respuesta completa, dividida en varios mensajes si es larga"""
+    if not response_text or len(response_text.strip()) == 0:
+        logger.warning("Respuesta vacia de Gemini")
+        response_text = EMPTY_RESPONSE_TEXT
+    
+    logger.debug("Enviando respuesta a Telegram", extra={'chars': len(response_text)})
+    
+    chunks = split_text(response_text)
+    for i, chunk in enumerate(chunks):
+        await message.reply_text(chunk, parse_mode="HTML")
+        logger.debug(f"Chunk {i+1}/{len(chunks)} enviado")
+
+
+async def _edit_stream_message(tg_message, text: str, parse_mode: str = None):
+    """Edita un mensaje ya enviado; ignora 'message is not modified' y HTML inválido"""
+    try:
+        await tg_message.edit_text(text, parse_mode=parse_mode)
+    except BadRequest as e:
+        if 'not modified' in str(e).lower():
+            return
+        if not parse_mode:
+            raise
+        # HTML inválido en la respuesta final: dejar el texto plano
+        try:
+            await tg_message.edit_text(text)
+        except BadRequest as plain_error:
+            if 'not modified' not in str(plain_error).lower():
+                raise
+
+
+async def _sync_stream_messages(message, sent: list, text: str, parse_mode: str = None):
+    """
+    Refleja `text` en los mensajes de Telegram de la respuesta
+    
+    Edita los mensajes ya enviados cuyo contenido cambió y envía mensajes nuevos
+    cuando el texto supera el límite de Telegram.
+    """
+    chunks = split_text(text)
+    for i, chunk in enumerate(chunks):
+        if not chunk.strip():
+            continue
+        if i < len(sent):
+            tg_message, shown = sent[i]
+            if shown == chunk and not parse_mode:
+                continue
+            await _edit_stream_message(tg_message, chunk, parse_mode)
+            sent[i] = (tg_message, chunk)
+        else:
+            tg_message = await message.reply_text(chunk, parse_mode=parse_mode)
+            sent.append((tg_message, chunk))
+    
+    # Si el texto final es más corto (p. ej. error a mitad del stream), borrar los sobrantes
+    for tg_message, _ in sent[len(chunks):]:
+        try:
+            await tg_message.delete()
+        except Exception as e:
+            logger.warning(f"No se pudo borrar mensaje sobrante: {str(e)}")
+    del sent[len(chunks):]
+
+
+async def reply_streaming(message, stream) -> dict:
+    """
+    Envía la respuesta de Gemini a medida que se genera
+    
+    El primer fragmento se envía apenas llega; luego el mensaje se edita como
+    máximo una vez cada BOT_STREAM_EDIT_INTERVAL segundos (límite de ediciones
+    de Telegram). Al final se aplica el formato HTML.
+    
+    Returns:
+        Dict de resultado de Gemini (stream.result)
+    """
+    sent = []
+    text = ''
+    last_edit = 0.0
+    
+    async for fragment in stream:
+        text += fragment
+        now = time.monotonic()
+        if sent and now - last_edit < BOT_STREAM_EDIT_INTERVAL:
+            continue
+        if text.strip():
+            await _sync_stream_messages(message, sent, text)
+            last_edit = now
+    
+    ai_result = stream.result
+    final_text = ai_result['response'] if ai_result.get('error') else text
+    if not final_text or len(final_text.strip()) == 0:
+        logger.warning("Respuesta vacia de Gemini")
+        final_text = EMPTY_RESPONSE_TEXT
+    
+    await _sync_stream_messages(message, sent, final_text, parse_mode="HTML")
+    logger.debug("Respuesta en streaming enviada", extra={'chars': len(final_text), 'messages': len(sent)})
+    return ai_result
 
 
 # Funciones síncronas para operaciones de BD
 def get_or_create_user_sync(tg_user):
-    """Obtener o crear usuario de Telegram (sincrónico)"""
-    user, _ = TelegramUser.objects.get_or_create(
-        telegram_id=str(tg_user.id),
-        defaults={
-            'username': tg_user.username or 'sin_usuario',
-            'first_name': tg_user.first_name or 'Usuario',
-            'last_name': tg_user.last_name or '',
-        }
+    """Obtener o crear usuario de Telegram (sincrónico, con caché en memoria)"""
+    return user_cache.get_or_create_user(
+        telegram_id=tg_user.id,
+        username=tg_user.username,
+        first_name=tg_user.first_name,
+        last_name=tg_user.last_name,
     )
-    
-    # Actualizar información si cambió
-    if user.username != (tg_user.username or 'sin_usuario') or user.first_name != (tg_user.first_name or 'Usuario'):
-        user.username = tg_user.username or 'sin_usuario'
-        user.first_name = tg_user.first_name or 'Usuario'
-        user.last_name = tg_user.last_name or ''
-        user.save()
-    
-    return user
 
 
-def create_message_sync(user, message):
-    """Crear registro de mensaje (sincrónico)"""
-    return TelegramMessage.objects.create(
+def build_message(user, message):
+    """Construir registro de mensaje sin guardarlo (lo guarda write_behind)"""
+    return TelegramMessage(
         user=user,
         message_type='text',
         direction='incoming',
         content=message.text,
-        telegram_message_id=message.message_id
+        telegram_message_id=message.message_id,
+        chat_id=message.chat_id
     )
 
 
-def get_available_jobs():
-    """Obtener ofertas disponibles (sincrónico)"""
-    return list(
-        JobOffer.objects.filter(status='published').values(
-            'title', 'company', 'location'
-        )[:5]
-    )
-
-
-def create_ai_response_sync(msg, ai_result):
-    """Crear respuesta de IA (sincrónico)"""
-    return AIResponse.objects.create(
+def build_ai_response(msg, ai_result):
+    """Construir respuesta de IA sin guardarla (la guarda write_behind)"""
+    return AIResponse(
         message=msg,
         response_text=ai_result['response'],
         confidence_score=ai_result['confidence_score'],
@@ -280,15 +481,9 @@ def create_ai_response_sync(msg, ai_result):
     )
 
 
-def update_job_views(job):
-    """Actualizar vistas de oferta (sincrónico)"""
-    job.views_count += 1
-    job.save(update_fields=['views_count'])
-
-
 async def get_or_create_user(tg_user):
     """Obtener o crear usuario de Telegram (async wrapper)"""
-    return await sync_to_async(get_or_create_user_sync)(tg_user)
+    return await run_db(get_or_create_user_sync, tg_user)
 
 
 # ============ HANDLERS PARA ENCUESTAS ============
@@ -299,9 +494,9 @@ async def encuesta_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = await get_or_create_user(update.effective_user)
         
         # Obtener encuestas activas
-        surveys = await sync_to_async(lambda: list(
+        surveys = await run_db(lambda: list(
             Survey.objects.filter(status='active').order_by('-created_at')[:5]
-        ))()
+        ))
         
         if not surveys:
             await update.message.reply_text(
@@ -342,10 +537,10 @@ async def iniciar_encuesta(update: Update, context: ContextTypes.DEFAULT_TYPE, s
     """Iniciar la respuesta de una encuesta específica"""
     try:
         # Verificar si ya respondió
-        existing_response = await sync_to_async(lambda: SurveyResponse.objects.filter(
+        existing_response = await run_db(lambda: SurveyResponse.objects.filter(
             survey=survey,
             user=user
-        ).first())()
+        ).first())
         
         if existing_response and existing_response.is_completed:
             await update.message.reply_text(
@@ -355,16 +550,15 @@ async def iniciar_encuesta(update: Update, context: ContextTypes.DEFAULT_TYPE, s
             return
         
         # Crear o recuperar respuesta
-        survey_response, created = await sync_to_async(lambda: SurveyResponse.objects.get_or_create(
+        survey_response, created = await run_db(lambda: SurveyResponse.objects.get_or_create(
             survey=survey,
             user=user,
             defaults={'started_at': timezone.now()}
-        ))()
+        ))
         
-        # Obtener primera pregunta
-        first_question = await sync_to_async(lambda: survey.questions.filter(
-            order__isnull=False
-        ).order_by('order').first())()
+        # Cargar (o revalidar) el grafo de la encuesta: preguntas, opciones y orden
+        graph = await run_db(get_survey_graph, survey)
+        first_question = graph.first_question()
         
         if not first_question:
             await update.message.reply_text(
@@ -375,22 +569,19 @@ async def iniciar_encuesta(update: Update, context: ContextTypes.DEFAULT_TYPE, s
         # Guardar estado en context
         context.user_data['current_survey'] = survey.id
         context.user_data['survey_response'] = survey_response.id
-        context.user_data['current_question_order'] = 0
         
-        await enviar_pregunta(update, context, survey, first_question, 0)
+        await enviar_pregunta(update, context, graph, first_question)
     
     except Exception as e:
         logger.error(f"Error iniciar_encuesta: {str(e)}", exc_info=True)
         await update.message.reply_text("Error al iniciar la encuesta.")
 
 
-async def enviar_pregunta(update: Update, context: ContextTypes.DEFAULT_TYPE, survey, question, question_number):
-    """Enviar una pregunta de la encuesta"""
+async def enviar_pregunta(update: Update, context: ContextTypes.DEFAULT_TYPE, graph, question):
+    """Enviar una pregunta de la encuesta (sin consultas: usa el grafo en memoria)"""
     try:
-        total_questions = await sync_to_async(lambda: survey.questions.count())()
-        
         # Construir mensaje
-        question_text = f"Pregunta {question_number + 1}/{total_questions}\n\n{question.question_text}"
+        question_text = f"Pregunta {question.number}/{graph.total}\n\n{question.text}"
         
         if question.is_required:
             question_text += " *"
@@ -398,21 +589,15 @@ async def enviar_pregunta(update: Update, context: ContextTypes.DEFAULT_TYPE, su
         # Según tipo de pregunta
         if question.question_type == 'multiple':
             # Opciones múltiples
-            options = await sync_to_async(lambda: list(
-                question.options.all().order_by('order')
-            ))()
-            
             question_text += "\n\n"
-            keyboard = []
-            for idx, option in enumerate(options, 1):
-                question_text += f"{idx}. {option.option_text}\n"
-                keyboard.append([f"{idx}. {option.option_text}"])
+            for idx, option in enumerate(question.options, 1):
+                question_text += f"{idx}. {option.text}\n"
             
             question_text += f"\nEscribe el número de tu opción:"
             
             context.user_data['question_type'] = 'multiple'
             context.user_data['question_options'] = {
-                str(i): o.id for i, o in enumerate(options, 1)
+                str(i): o.id for i, o in enumerate(question.options, 1)
             }
         
         elif question.question_type == 'yes_no':
@@ -428,7 +613,6 @@ async def enviar_pregunta(update: Update, context: ContextTypes.DEFAULT_TYPE, su
             context.user_data['question_type'] = 'text'
         
         context.user_data['current_question_id'] = question.id
-        context.user_data['current_question_order'] = question_number
         
         await update.message.reply_text(question_text)
     
@@ -437,6 +621,17 @@ async def enviar_pregunta(update: Update, context: ContextTypes.DEFAULT_TYPE, su
         await update.message.reply_text("Error al procesar la pregunta.")
 
 
+def save_survey_answer_sync(survey_response_id, answer_data, completed: bool):
+    """Guardar respuesta y, si es la última, marcar la encuesta como completada (sincrónico)"""
+    with transaction.atomic():
+        SurveyAnswer.objects.create(response_id=survey_response_id, **answer_data)
+        if completed:
+            SurveyResponse.objects.filter(id=survey_response_id).update(
+                is_completed=True,
+                completed_at=timezone.now()
+            )
+
+
 async def procesar_respuesta_encuesta(update: Update, context: ContextTypes.DEFAULT_TYPE, user_answer: str):
     """Procesar respuesta de usuario a pregunta de encuesta"""
     try:
@@ -448,15 +643,22 @@ async def procesar_respuesta_encuesta(update: Update, context: ContextTypes.DEFA
         question_id = context.user_data['current_question_id']
         question_type = context.user_data.get('question_type')
         
-        # Obtener objetos
-        survey = await sync_to_async(Survey.objects.get)(id=survey_id)
-        survey_response = await sync_to_async(SurveyResponse.objects.get)(id=survey_response_id)
-        question = await sync_to_async(SurveyQuestion.objects.get)(id=question_id)
+        # Grafo en memoria (solo se lee de la BD si no está cargado en este proceso)
+        graph = get_cached_survey_graph(survey_id) or \
+            await run_db(load_survey_graph, survey_id)
+        question = graph.question(question_id)
+        
+        if question is None:
+            # La encuesta se editó mientras el usuario respondía
+            context.user_data.pop('current_survey', None)
+            await update.message.reply_text(
+                "Esta encuesta fue modificada. Escribe /encuesta para empezar de nuevo."
+            )
+            return
         
         # Procesar según tipo
         answer_data = {
-            'response': survey_response,
-            'question': question,
+            'question_id': question.id,
             'answered_at': timezone.now()
         }
         
@@ -468,10 +670,7 @@ async def procesar_respuesta_encuesta(update: Update, context: ContextTypes.DEFA
                 await update.message.reply_text("Opción inválida. Intenta de nuevo.")
                 return
             
-            option = await sync_to_async(SurveyOption.objects.get)(
-                id=option_mapping[option_id_str]
-            )
-            answer_data['selected_option'] = option
+            answer_data['selected_option_id'] = option_mapping[option_id_str]
         
         elif question_type == 'yes_no':
             if user_answer.strip() == '1':
@@ -495,49 +694,82 @@ async def procesar_respuesta_encuesta(update: Update, context: ContextTypes.DEFA
         elif question_type == 'text':
             answer_data['answer_text'] = user_answer
         
-        # Guardar respuesta
-        await sync_to_async(SurveyAnswer.objects.create)(**answer_data)
-        
-        # Obtener siguiente pregunta
-        current_order = context.user_data.get('current_question_order', 0)
-        next_question = await sync_to_async(lambda: survey.questions.filter(
-            order__gt=current_order
-        ).order_by('order').first())()
+        # Guardar respuesta (un insert; un update extra si era la última pregunta)
+        next_question = graph.next_question(question.id)
+        await run_db(
+            save_survey_answer_sync,
+            survey_response_id, answer_data, completed=next_question is None
+        )
         
         if not next_question:
             # Encuesta completada
-            survey_response.is_completed = True
-            survey_response.completed_at = timezone.now()
-            await sync_to_async(survey_response.save)()
-            
             context.user_data.pop('current_survey', None)
             
             await update.message.reply_text(
-                f"¡Gracias por responder la encuesta '{survey.title}'!\n\n"
+                f"¡Gracias por responder la encuesta '{graph.title}'!\n\n"
                 "Tus respuestas han sido registradas exitosamente."
             )
         else:
             # Enviar siguiente pregunta
-            next_order = next_question.order if next_question.order else current_order + 1
-            await enviar_pregunta(update, context, survey, next_question, next_order)
+            await enviar_pregunta(update, context, graph, next_question)
     
     except Exception as e:
         logger.error(f"Error procesar_respuesta_encuesta: {str(e)}", exc_info=True)
         await update.message.reply_text("Error al procesar tu respuesta.")
 
 
-def run_bot():
-    """Ejecutar el bot en polling mode"""
-    if not TELEGRAM_TOKEN:
-        logger.error('TELEGRAM_TOKEN no está configurado en .env')
-        return
-    
-    logger.info("Bot iniciando en modo polling...")
+async def on_startup(application):
+    """Iniciar las tareas periódicas del bot y el servidor de métricas"""
+    try:
+        # Mensajes ya guardados: un getUpdates repetido tras reiniciar no se vuelve a responder
+        await run_db(seen_messages.load_recent)
+    except Exception as e:
+        logger.error(f"No se pudo cargar la ventana de duplicados: {str(e)}")
+    view_counter.start()
+    if BOT_METRICS_PORT:
+        start_metrics_server(int(BOT_METRICS_PORT))
+
+
+async def on_stop(application):
+    """Terminar las respuestas en curso (el bot todavía puede enviar mensajes)"""
+    await chat_queue.drain()
+
+
+async def on_shutdown(application):
+    """Guardar en BD las filas pendientes antes de terminar"""
+    await write_behind.stop()
+    await view_counter.stop()
+    shutdown_db()
+
+
+def build_application(workers: int = BOT_CONCURRENT_UPDATES, token: str = None,
+                      base_url: str = None, rate_limit: bool = True):
+    """
+    Crear la aplicación del bot con sus handlers
     
-    # Crear aplicación del bot
-    application = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+    Args:
+        workers: Updates procesados en paralelo (en orden dentro de cada chat)
+        token: Token del bot (por defecto TELEGRAM_TOKEN)
+        base_url: URL de la Bot API (p. ej. la API simulada de las pruebas de carga)
+        rate_limit: Respetar los límites de envío de Telegram (services.telegram_rate)
+    """
+    builder = (
+        ApplicationBuilder()
+        .token(token or TELEGRAM_TOKEN)
+        .concurrent_updates(ChatOrderedUpdateProcessor(workers))
+        .persistence(DjangoPersistence())
+        .post_init(on_startup)
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+    )
+    if rate_limit:
+        builder = builder.rate_limiter(TelegramRateLimiter())
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build()
     
     # Agregar handlers
+    application.add_handler(TypeHandler(Update, drop_duplicate_update), group=-1)
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("ofertas", ofertas))
     application.add_handler(CommandHandler("ayuda", ayuda))
@@ -545,11 +777,46 @@ def run_bot():
     application.add_handler(CommandHandler("encuesta", encuesta_start))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     
+    return application
+
+
+def run_bot(mode: str = None, workers: int = None):
+    """
+    Ejecutar el bot
+    
+    Args:
+        mode: 'polling' o 'webhook' (por defecto TELEGRAM_BOT_MODE)
+        workers: Updates concurrentes (por defecto BOT_CONCURRENT_UPDATES)
+    """
+    if not TELEGRAM_TOKEN:
+        logger.error('TELEGRAM_TOKEN no está configurado en .env')
+        return
+    
+    mode = mode or TELEGRAM_BOT_MODE
+    workers = workers or BOT_CONCURRENT_UPDATES
+    
+    if mode == 'webhook' and not TELEGRAM_WEBHOOK_URL:
+        logger.error('TELEGRAM_WEBHOOK_URL no está configurado en .env (requerido en modo webhook)')
+        return
+    
+    logger.info(f"Bot iniciando en modo {mode} con {workers} workers...")
+    application = build_application(workers)
+    
     logger.info("Bot iniciado exitosamente. Esperando mensajes...")
     logger.info("Presiona Ctrl+C para detener el bot")
     
-    # Iniciar polling
-    application.run_polling(allowed_updates=["message", "callback_query"])
+    if mode == 'webhook':
+        # Telegram envía los updates a este proceso (sin long polling)
+        application.run_webhook(
+            listen=TELEGRAM_WEBHOOK_LISTEN,
+            port=TELEGRAM_WEBHOOK_PORT,
+            url_path=TELEGRAM_WEBHOOK_PATH,
+            webhook_url=f"{TELEGRAM_WEBHOOK_URL.rstrip('/')}/{TELEGRAM_WEBHOOK_PATH}",
+            secret_token=TELEGRAM_WEBHOOK_SECRET,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+    else:
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,109 @@
+"""
+Cola por chat para las respuestas de IA
+Cada chat tiene a lo sumo una llamada a Gemini en curso. Los mensajes que llegan
+mientras tanto se juntan y se responden con una sola llamada; pasado el límite
+de mensajes pendientes se rechazan (el bot responde "espera un momento").
+"""
+import os
+import asyncio
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Mensajes pendientes por chat antes de rechazar los nuevos
+CHAT_QUEUE_MAX_PENDING = int(os.getenv('CHAT_QUEUE_MAX_PENDING', '5'))
+
+# Resultados de ChatQueue.submit
+ACCEPTED = 'accepted'
+OVERFLOW = 'overflow'                 # Rechazado: avisar al usuario
+OVERFLOW_NOTIFIED = 'overflow_notified'  # Rechazado: el aviso ya se envió
+
+
+class _ChatState:
+    __slots__ = ('pending', 'task', 'notified')
+
+    def __init__(self):
+        self.pending = []
+        self.task = None
+        self.notified = False
+
+
+class ChatQueue:
+    """
+    Un worker por chat con mensajes pendientes
+
+    Args:
+        handler: Corutina handler(chat_id, items) que responde un lote de
+            mensajes del mismo chat (en orden de llegada)
+        max_pending: Mensajes en espera por chat antes de rechazar
+    """
+
+    def __init__(self, handler, max_pending: int = CHAT_QUEUE_MAX_PENDING):
+        self.handler = handler
+        self.max_pending = max_pending
+        self.merged = 0
+        self.rejected = 0
+        self._chats = {}
+        # Total de mensajes en espera: entero que el hilo de /metrics lee sin recorrer _chats
+        self._depth = 0
+
+    def submit(self, chat_id, item) -> str:
+        """
+        Encola un mensaje sin esperar la respuesta
+
+        Returns:
+            ACCEPTED, OVERFLOW (enviar aviso) u OVERFLOW_NOTIFIED (ya avisado)
+        """
+        state = self._chats.get(chat_id)
+        if state is None:
+            state = self._chats[chat_id] = _ChatState()
+
+        if len(state.pending) >= self.max_pending:
+            self.rejected += 1
+            if state.notified:
+                return OVERFLOW_NOTIFIED
+            state.notified = True
+            return OVERFLOW
+
+        state.pending.append(item)
+        self._depth += 1
+        if state.task is None:
+            state.task = asyncio.get_running_loop().create_task(self._worker(chat_id, state))
+        return ACCEPTED
+
+    async def _worker(self, chat_id, state: _ChatState):
+        """Responde los lotes del chat hasta vaciar su cola"""
+        try:
+            while state.pending:
+                batch, state.pending = state.pending, []
+                self._depth -= len(batch)
+                state.notified = False
+                if len(batch) > 1:
+                    self.merged += len(batch) - 1
+                    logger.info(f"[ChatQueue] {len(batch)} mensajes del chat {chat_id} en una sola respuesta")
+                try:
+                    await self.handler(chat_id, batch)
+                except Exception as e:
+                    logger.error(f"[ChatQueue] Error respondiendo al chat {chat_id}: {str(e)}", exc_info=True)
+        finally:
+            del self._chats[chat_id]
+
+    def depth(self) -> int:
+        """Mensajes en espera en todos los chats"""
+        return self._depth
+
+    async def drain(self):
+        """Espera a que terminen los workers en curso (al apagar el bot)"""
+        tasks = [state.task for state in self._chats.values() if state.task is not None]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            'active_chats': len(self._chats),
+            'pending': self.depth(),
+            'merged': self.merged,
+            'rejected': self.rejected,
+        }
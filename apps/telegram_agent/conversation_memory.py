@@ -0,0 +1,131 @@
+"""
+Memoria de conversación por usuario para el contexto de Gemini
+Guarda los últimos turnos de cada usuario en un buffer circular acotado, con
+expulsión LRU entre usuarios. Solo se lee el historial de la BD
+(TelegramMessage/AIResponse) cuando el usuario no está en memoria.
+"""
+import os
+import logging
+import threading
+from collections import OrderedDict, deque
+from dotenv import load_dotenv
+
+from apps.telegram_agent.models import TelegramMessage
+from apps.telegram_agent.db import run_db
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+CONVERSATION_TURNS = int(os.getenv('CONVERSATION_TURNS', '5'))          # Intercambios por usuario
+CONVERSATION_USERS = int(os.getenv('CONVERSATION_USERS', '5000'))       # Usuarios en memoria
+CONVERSATION_MAX_CHARS = int(os.getenv('CONVERSATION_MAX_CHARS', '500'))  # Largo máximo por mensaje
+
+
+def _entry(role: str, content: str) -> dict:
+    return {'role': role, 'content': content[:CONVERSATION_MAX_CHARS]}
+
+
+class ConversationMemory:
+    """Buffers de turnos recientes por usuario (thread-safe)"""
+
+    def __init__(self, turns: int = CONVERSATION_TURNS, max_users: int = CONVERSATION_USERS):
+        self.turns = turns
+        self.max_users = max_users
+        self.hits = 0
+        self.misses = 0
+        self._buffers = OrderedDict()  # telegram_id -> deque de {'role', 'content'}
+        self._lock = threading.Lock()
+
+    def _store(self, user_id: str, buffer: deque):
+        """Guarda un buffer expulsando al usuario menos reciente (con el lock tomado)"""
+        self._buffers[user_id] = buffer
+        self._buffers.move_to_end(user_id)
+        while len(self._buffers) > self.max_users:
+            self._buffers.popitem(last=False)
+
+    def get_cached(self, user_id: str):
+        """Historial en memoria (None si el usuario no está cargado; no consulta la BD)"""
+        with self._lock:
+            buffer = self._buffers.get(user_id)
+            if buffer is None:
+                self.misses += 1
+                return None
+            self._buffers.move_to_end(user_id)
+            self.hits += 1
+            return list(buffer)
+
+    def load(self, user_id: str, exclude_message_id: int = None) -> list:
+        """
+        Carga los últimos turnos del usuario desde la BD (sincrónico)
+
+        Args:
+            user_id: telegram_id del usuario
+            exclude_message_id: Mensaje ya guardado que se está respondiendo
+        """
+        queryset = TelegramMessage.objects.filter(
+            user__telegram_id=user_id, direction='incoming', message_type='text'
+        )
+        if exclude_message_id is not None:
+            queryset = queryset.exclude(id=exclude_message_id)
+        rows = list(
+            queryset.order_by('-created_at')
+            .values_list('content', 'ai_response__response_text')[:self.turns]
+        )
+
+        buffer = deque(maxlen=self.turns * 2)
+        for content, response_text in reversed(rows):
+            buffer.append(_entry('user', content))
+            if response_text:
+                buffer.append(_entry('assistant', response_text))
+
+        with self._lock:
+            # Si otro hilo ya lo cargó (y quizá agregó turnos), conservar ese
+            current = self._buffers.get(user_id)
+            if current is not None:
+                return list(current)
+            self._store(user_id, buffer)
+        return list(buffer)
+
+    def get_history(self, user_id: str, exclude_message_id: int = None) -> list:
+        """Historial reciente, hidratado desde la BD si no está en memoria (sincrónico)"""
+        history = self.get_cached(user_id)
+        if history is None:
+            history = self.load(user_id, exclude_message_id)
+        return history
+
+    async def aget_history(self, user_id: str) -> list:
+        """Versión async de get_history (solo va a la BD en un fallo de caché)"""
+        history = self.get_cached(user_id)
+        if history is None:
+            history = await run_db(self.load, user_id)
+        return history
+
+    def append_turn(self, user_id: str, user_text: str, assistant_text: str = None):
+        """Agrega un intercambio al buffer del usuario"""
+        with self._lock:
+            buffer = self._buffers.get(user_id)
+            if buffer is None:
+                buffer = deque(maxlen=self.turns * 2)
+            self._store(user_id, buffer)
+            buffer.append(_entry('user', user_text))
+            if assistant_text:
+                buffer.append(_entry('assistant', assistant_text))
+
+    def forget(self, user_id: str):
+        """Descarta el historial de un usuario"""
+        with self._lock:
+            self._buffers.pop(user_id, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'users': len(self._buffers),
+            'max_users': self.max_users,
+            'hit_rate': (self.hits / total) if total else 0.0,
+        }
+
+
+# Memoria compartida del proceso (bot o servidor web)
+conversation_memory = ConversationMemory()
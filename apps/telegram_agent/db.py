@@ -0,0 +1,105 @@
+"""
+Acceso a la BD desde el bot (async)
+sync_to_async(thread_sensitive=True) y los métodos a* del ORM ejecutan todas
+las consultas en un único hilo compartido, así que los handlers concurrentes se
+serializan en la BD. Aquí las consultas corren en un pool de hilos de tamaño
+fijo; cada hilo mantiene su propia conexión de Django (las conexiones son
+por hilo) y la reutiliza entre consultas mientras no supere CONN_MAX_AGE.
+"""
+import os
+import asyncio
+import logging
+import functools
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from django.db import close_old_connections
+
+from utils.metrics import registry
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Con SQLite solo hay un escritor a la vez (el resto espera el busy timeout);
+# las lecturas sí se reparten entre los hilos
+DB_EXECUTOR_WORKERS = int(os.getenv('DB_EXECUTOR_WORKERS', '8'))
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Pool compartido del proceso (se crea en el primer uso)"""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=DB_EXECUTOR_WORKERS,
+                    thread_name_prefix='bot-db',
+                )
+                logger.info(f"[DBExecutor] Pool de {DB_EXECUTOR_WORKERS} hilos iniciado")
+    return _executor
+
+
+def _call(func, args, kwargs):
+    """
+    Ejecuta la función en un hilo del pool
+
+    Como Django al inicio y al final de cada petición: se cierra la conexión
+    del hilo si está vencida (CONN_MAX_AGE) o quedó inservible (caída del
+    servidor, transacción rota), y la próxima consulta abre otra.
+    """
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_db(func, *args, **kwargs):
+    """
+    Ejecuta una función sincrónica de BD en el pool sin bloquear el event loop
+
+    Args:
+        func: Función que usa el ORM
+        *args, **kwargs: Argumentos de la función
+
+    Returns:
+        El valor devuelto por func
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_executor(),
+        functools.partial(context.run, _call, func, args, kwargs),
+    )
+
+
+def database_async(func):
+    """Decorador: versión async de una función sincrónica que corre en el pool"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+    return wrapper
+
+
+def shutdown(wait: bool = True):
+    """Detiene el pool (las conexiones se cierran al terminar sus hilos)"""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+        logger.info("[DBExecutor] Pool detenido")
+
+
+def pending() -> int:
+    """Consultas en espera de un hilo libre"""
+    executor = _executor
+    return executor._work_queue.qsize() if executor is not None else 0
+
+
+registry.gauge('recruitment_db_executor_pending', 'Consultas de BD del bot esperando un hilo libre',
+               callback=pending)
@@ -0,0 +1,86 @@
+"""
+Descarte de updates repetidos (reintentos de Telegram o getUpdates repetido)
+Ventana en memoria de los últimos mensajes vistos, clave (chat, message_id):
+la comprobación es O(1) y ocurre antes de cualquier consulta o llamada a Gemini.
+Al iniciar se carga con los últimos mensajes guardados, así que también cubre
+los updates que Telegram vuelve a entregar tras reiniciar el proceso. La
+restricción única de TelegramMessage (chat_id, telegram_message_id) es la
+garantía final en la BD.
+"""
+import os
+import logging
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+from apps.telegram_agent.models import TelegramMessage
+from utils.metrics import registry
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+UPDATE_DEDUPE_WINDOW = int(os.getenv('UPDATE_DEDUPE_WINDOW', '10000'))
+
+DUPLICATES = registry.counter(
+    'recruitment_duplicate_updates_total',
+    'Updates descartados por repetidos',
+    ('source',),
+)
+
+
+def message_key(chat_id, message_id) -> tuple:
+    """Clave de un mensaje entrante (misma que la restricción única de la BD; message_id es único por chat)"""
+    return (int(chat_id), int(message_id))
+
+
+class DedupeWindow:
+    """Conjunto acotado (FIFO) de claves ya vistas, thread-safe"""
+
+    def __init__(self, maxsize: int = UPDATE_DEDUPE_WINDOW):
+        self.maxsize = maxsize
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def seen(self, key, source: str = 'bot') -> bool:
+        """
+        Registra la clave
+
+        Returns:
+            True si ya estaba (el update es un duplicado y debe descartarse)
+        """
+        with self._lock:
+            if key in self._keys:
+                DUPLICATES.inc(source=source)
+                return True
+            self._keys[key] = None
+            if len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+            return False
+
+    def forget(self, key):
+        """Quita la clave (el mensaje no se pudo procesar y se va a reintentar)"""
+        with self._lock:
+            self._keys.pop(key, None)
+
+    def load_recent(self) -> int:
+        """Carga los últimos mensajes entrantes guardados (sincrónico)"""
+        rows = list(
+            TelegramMessage.objects
+            .filter(direction='incoming', chat_id__isnull=False, telegram_message_id__isnull=False)
+            .order_by('-id')
+            .values_list('chat_id', 'telegram_message_id')[:self.maxsize]
+        )
+        with self._lock:
+            for chat_id, message_id in reversed(rows):
+                self._keys.setdefault(message_key(chat_id, message_id), None)
+            while len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+        logger.info(f"[Dedupe] {len(rows)} mensajes recientes cargados")
+        return len(rows)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+# Ventana compartida del proceso
+seen_messages = DedupeWindow()
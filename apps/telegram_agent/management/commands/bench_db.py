@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from apps.telegram_agent import db as bot_db
+from apps.telegram_agent.models import TelegramUser, TelegramMessage
+
+BENCH_PREFIX = 'benchdb-'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark de handlers limitados por la BD: sync_to_async (un hilo) vs pool de hilos del bot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--handlers', default='1,5,10,25,50',
+                            help='Lista de handlers concurrentes separados por coma')
+        parser.add_argument('--messages', type=int, default=10,
+                            help='Mensajes procesados por cada handler')
+        parser.add_argument('--threads', type=int, default=bot_db.DB_EXECUTOR_WORKERS,
+                            help='Hilos del pool de BD')
+
+    def handle(self, *args, **options):
+        handlers_list = [int(n) for n in options['handlers'].split(',') if n.strip()]
+        messages = options['messages']
+        bot_db.DB_EXECUTOR_WORKERS = options['threads']
+
+        self._setup(max(handlers_list))
+        try:
+            self.stdout.write(f"Hilos del pool: {options['threads']}, mensajes por handler: {messages}, "
+                              f"BD: {connection.vendor}")
+            self.stdout.write(f"{'handlers':>8} | {'sync_to_async msg/s':>19} | {'run_db msg/s':>12} | {'speedup':>7}")
+            for handlers in handlers_list:
+                serial_rate = asyncio.run(self._run(handlers, messages, use_pool=False))
+                pool_rate = asyncio.run(self._run(handlers, messages, use_pool=True))
+                self.stdout.write(
+                    f"{handlers:>8} | {serial_rate:>19.2f} | {pool_rate:>12.2f} | {pool_rate / serial_rate:>6.1f}x"
+                )
+        finally:
+            bot_db.shutdown()
+            TelegramUser.objects.filter(telegram_id__startswith=BENCH_PREFIX).delete()
+
+    def _setup(self, users: int):
+        """Usuarios con algunos mensajes para que las consultas lean datos reales"""
+        TelegramUser.objects.filter(telegram_id__startswith=BENCH_PREFIX).delete()
+        created = TelegramUser.objects.bulk_create([
+            TelegramUser(telegram_id=f'{BENCH_PREFIX}{i}', username=f'bench{i}') for i in range(users)
+        ])
+        TelegramMessage.objects.bulk_create([
+            TelegramMessage(user=user, content=f'Mensaje {n}', direction='incoming')
+            for user in created for n in range(5)
+        ])
+
+    async def _run(self, handlers: int, messages: int, use_pool: bool) -> float:
+        """
+        Simula `handlers` conversaciones concurrentes y devuelve mensajes por segundo
+
+        Solo consultas reales: la ganancia depende de la latencia de la BD
+        configurada (con SQLite local es pequeña; con un servidor en red, mayor).
+        """
+
+        def handle_message(telegram_id: str) -> int:
+            # Lo que hace el bot por mensaje: buscar al usuario y leer su historial
+            user = TelegramUser.objects.get(telegram_id=telegram_id)
+            history = list(
+                TelegramMessage.objects.filter(user=user).order_by('-id').values_list('content', flat=True)[:10]
+            )
+            return len(history)
+
+        async def conversation(index: int):
+            telegram_id = f'{BENCH_PREFIX}{index}'
+            for _ in range(messages):
+                if use_pool:
+                    await bot_db.run_db(handle_message, telegram_id)
+                else:
+                    # Igual que antes: todas las consultas pasan por el único hilo thread-sensitive
+                    await sync_to_async(handle_message)(telegram_id)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(conversation(i) for i in range(handlers)))
+        elapsed = time.perf_counter() - start
+        if use_pool:
+            bot_db.shutdown()
+        return (handlers * messages) / elapsed
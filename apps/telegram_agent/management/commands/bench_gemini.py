@@ -0,0 +1,56 @@
+import asyncio
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from services.gemini_client import GeminiClient
+from services.gemini_stub import StubGenerativeModel
+
+
+class Command(BaseCommand):
+    help = 'Benchmark de throughput de GeminiClient (sync vs async) con N usuarios simulados y un modelo stub'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', default='1,5,10,25,50',
+                            help='Lista de usuarios concurrentes separados por coma')
+        parser.add_argument('--messages', type=int, default=3,
+                            help='Mensajes enviados por cada usuario')
+        parser.add_argument('--latency', type=float, default=0.2,
+                            help='Latencia simulada del modelo en segundos')
+
+    def handle(self, *args, **options):
+        # Silenciar los logs INFO del cliente durante el benchmark
+        logging.getLogger('services.gemini_client').setLevel(logging.WARNING)
+
+        users_list = [int(n) for n in options['users'].split(',') if n.strip()]
+        messages = options['messages']
+        latency = options['latency']
+
+        self.stdout.write(f"Latencia del modelo: {latency}s, mensajes por usuario: {messages}")
+        self.stdout.write(f"{'usuarios':>8} | {'sync msg/s':>10} | {'async msg/s':>11} | {'speedup':>7}")
+
+        for users in users_list:
+            sync_rate = asyncio.run(self._run(users, messages, latency, use_async=False))
+            async_rate = asyncio.run(self._run(users, messages, latency, use_async=True))
+            self.stdout.write(
+                f"{users:>8} | {sync_rate:>10.2f} | {async_rate:>11.2f} | {async_rate / sync_rate:>6.1f}x"
+            )
+
+    async def _run(self, users: int, messages: int, latency: float, use_async: bool) -> float:
+        """Simula `users` conversaciones concurrentes y devuelve mensajes por segundo"""
+        client = GeminiClient()
+        client.model = StubGenerativeModel(latency=latency)
+
+        async def conversation(user_id: int):
+            for i in range(messages):
+                if use_async:
+                    await client.aget_response(f"Mensaje {i}", str(user_id))
+                else:
+                    # Igual que el handler antiguo: llamada bloqueante dentro del event loop
+                    client.get_response(f"Mensaje {i}", str(user_id))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(conversation(u) for u in range(users)))
+        elapsed = time.perf_counter() - start
+        return (users * messages) / elapsed
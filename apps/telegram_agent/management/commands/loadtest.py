@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import random
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from apps.telegram_agent.models import TelegramUser, BotState
+from services.gemini_pool import get_gemini_client
+from services.gemini_stub import StubGenerativeModel
+from services.response_cache import response_cache
+from services.telegram_stub import FakeTelegramServer
+
+LOADTEST_TOKEN = '123456:LOADTEST'
+FIRST_USER_ID = 900000000
+
+# Preguntas frecuentes (se repiten entre usuarios, como en producción)
+FAQ_MESSAGES = [
+    '¿Cómo aplico a una oferta?',
+    '¿Qué ofertas hay?',
+    'Hola',
+    '¿Hay trabajos remotos?',
+    '¿Qué es Magneto?',
+]
+PERSONAL_MESSAGES = [
+    'Tengo {n} años de experiencia en ventas, ¿qué me recomiendas?',
+    'Soy desarrollador con {n} proyectos, ¿dónde aplico?',
+]
+MAX_SURVEY_ANSWERS = 20
+
+
+def percentile(values: list, p: float) -> float:
+    """Percentil p (0-100) de una lista ya ordenada"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+class VirtualUser:
+    """Estado de un usuario simulado: qué le respondió el bot y cuándo"""
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.first_reply = asyncio.Event()
+        self.first_at = None
+        self.last_at = 0.0
+        self.texts = []
+
+    def begin(self):
+        self.first_reply.clear()
+        self.first_at = None
+        self.texts = []
+
+    def record(self, now: float, text: str):
+        if self.first_at is None:
+            self.first_at = now
+            self.first_reply.set()
+        self.last_at = now
+        self.texts.append(text)
+
+
+class Command(BaseCommand):
+    help = ('Prueba de carga del bot: API de Telegram simulada + Gemini stub, '
+            'N usuarios recorriendo /start, /ofertas, texto libre y /encuesta')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='Usuarios virtuales')
+        parser.add_argument('--rounds', type=int, default=1, help='Veces que cada usuario repite el recorrido')
+        parser.add_argument('--ramp', type=float, default=2.0,
+                            help='Segundos en los que se reparten las llegadas de los usuarios')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Updates concurrentes del bot (por defecto BOT_CONCURRENT_UPDATES)')
+        parser.add_argument('--latency', type=float, default=0.5, help='Latencia del modelo stub (s)')
+        parser.add_argument('--jitter', type=float, default=0.2, help='Variación de la latencia (fracción)')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Fracción de llamadas al modelo que fallan (0 a 1)')
+        parser.add_argument('--timeout', type=float, default=30.0,
+                            help='Segundos máximos esperando la primera respuesta de un paso')
+        parser.add_argument('--quiet', type=float, default=0.3,
+                            help='Segundos sin envíos del bot para dar un paso por terminado')
+        parser.add_argument('--rate-limit', action='store_true',
+                            help='Aplicar los límites de envío de Telegram (services.telegram_rate)')
+        parser.add_argument('--keep-data', action='store_true',
+                            help='No borrar los usuarios de prueba al terminar')
+        parser.add_argument('--verbose', action='store_true', help='Mostrar los logs del bot')
+
+    def handle(self, *args, **options):
+        # Importar aquí: bot.py lee las variables de entorno y vuelve a configurar
+        # los logs de Django al importarse (antes de silenciarlos)
+        from apps.telegram_agent import bot
+
+        if not options['verbose']:
+            for name in ('apps', 'services', 'telegram', 'httpx', 'django'):
+                logging.getLogger(name).setLevel(logging.WARNING)
+            logging.getLogger().setLevel(logging.WARNING)
+
+        user_ids = [FIRST_USER_ID + i for i in range(options['users'])]
+        model = StubGenerativeModel(
+            latency=options['latency'], jitter=options['jitter'], error_rate=options['error_rate']
+        )
+        # El stub reemplaza a todos los modelos de la cadena: si el principal
+        # falla (--error-rate), los de respaldo tampoco deben llamar a la API real
+        client = get_gemini_client()
+        for name in [client.model_name, *client.fallback_models]:
+            get_gemini_client(name).model = model
+        # Restos de una corrida con --keep-data: la API simulada reinicia los
+        # message_id y se tomarían como mensajes repetidos
+        self._cleanup(user_ids)
+
+        try:
+            latencies, timeouts, elapsed, server = asyncio.run(self._run(bot, user_ids, options))
+        finally:
+            if not options['keep_data']:
+                self._cleanup(user_ids)
+
+        self._report(latencies, timeouts, elapsed, server, model, options)
+
+    async def _run(self, bot, user_ids: list, options: dict):
+        loop = asyncio.get_running_loop()
+        users = {user_id: VirtualUser(user_id) for user_id in user_ids}
+
+        def on_send(chat_id, method, text):
+            user = users.get(chat_id)
+            if user is not None:
+                loop.call_soon_threadsafe(user.record, loop.time(), text)
+
+        server = FakeTelegramServer(on_send=on_send)
+        server.start()
+
+        application = bot.build_application(
+            options['workers'] or bot.BOT_CONCURRENT_UPDATES,
+            token=LOADTEST_TOKEN,
+            base_url=server.base_url,
+            rate_limit=options['rate_limit'],
+        )
+        latencies = defaultdict(list)
+        timeouts = defaultdict(int)
+
+        async def step(user: VirtualUser, kind: str, text: str):
+            """Envía un mensaje y espera a que el bot termine de responder"""
+            user.begin()
+            sent_at = loop.time()
+            server.push_message(user.user_id, text)
+            try:
+                await asyncio.wait_for(user.first_reply.wait(), options['timeout'])
+            except asyncio.TimeoutError:
+                timeouts[kind] += 1
+                return None
+            latencies[kind].append(user.first_at - sent_at)
+            while loop.time() - user.last_at < options['quiet']:
+                await asyncio.sleep(options['quiet'] - (loop.time() - user.last_at))
+            return '\n'.join(user.texts)
+
+        async def survey(user: VirtualUser):
+            reply = await step(user, 'encuesta', '/encuesta')
+            if not reply or 'número de la encuesta' not in reply:
+                return
+            reply = await step(user, 'encuesta', '1')
+            for _ in range(MAX_SURVEY_ANSWERS):
+                if not reply or 'Gracias' in reply or 'Pregunta' not in reply:
+                    return
+                if '1 ⭐' in reply:
+                    answer = str(random.randint(1, 5))
+                elif '1. Sí' in reply or 'número de tu opción' in reply:
+                    answer = '1'
+                else:
+                    answer = 'Respuesta de prueba de carga'
+                reply = await step(user, 'encuesta', answer)
+
+        async def journey(user: VirtualUser, delay: float):
+            await asyncio.sleep(delay)
+            for _ in range(options['rounds']):
+                await step(user, 'start', '/start')
+                await step(user, 'ofertas', '/ofertas')
+                await step(user, 'texto', random.choice(FAQ_MESSAGES))
+                await step(user, 'texto', random.choice(PERSONAL_MESSAGES).format(n=random.randint(1, 20)))
+                await survey(user)
+
+        await application.initialize()
+        await application.post_init(application)
+        await application.start()
+        await application.updater.start_polling(poll_interval=0.0, timeout=1)
+
+        started = time.perf_counter()
+        try:
+            ramp = options['ramp']
+            await asyncio.gather(*(
+                journey(user, random.uniform(0, ramp)) for user in users.values()
+            ))
+            await bot.chat_queue.drain()
+        finally:
+            elapsed = time.perf_counter() - started
+            await application.updater.stop()
+            await application.stop()
+            await application.post_stop(application)
+            await application.shutdown()
+            await application.post_shutdown(application)
+            server.stop()
+
+        return latencies, timeouts, elapsed, server
+
+    def _cleanup(self, user_ids: list):
+        """Borra los usuarios de prueba (en cascada sus mensajes y encuestas) y su estado"""
+        keys = [str(user_id) for user_id in user_ids]
+        TelegramUser.objects.filter(telegram_id__in=keys).delete()
+        BotState.objects.filter(kind__in=['user', 'chat'], key__in=keys).delete()
+
+    def _report(self, latencies, timeouts, elapsed, server, model, options):
+        total_steps = sum(len(values) for values in latencies.values())
+        total_timeouts = sum(timeouts.values())
+
+        self.stdout.write(
+            f"\nUsuarios: {options['users']} x {options['rounds']} recorridos | "
+            f"latencia modelo: {options['latency']}s ±{options['jitter']:.0%} | "
+            f"errores modelo: {options['error_rate']:.0%} | "
+            f"rate limit: {'sí' if options['rate_limit'] else 'no'}"
+        )
+        self.stdout.write(
+            f"Duración: {elapsed:.1f}s | pasos: {total_steps} | timeouts: {total_timeouts} | "
+            f"throughput: {total_steps / elapsed:.1f} updates/s\n"
+        )
+        self.stdout.write("Latencia hasta la primera respuesta (ms):")
+        self.stdout.write(f"{'paso':>10} | {'n':>6} | {'p50':>7} | {'p95':>7} | {'p99':>7} | {'max':>7} | {'timeouts':>8}")
+
+        all_values = []
+        for kind in sorted(set(latencies) | set(timeouts)):
+            values = sorted(latencies[kind])
+            all_values.extend(values)
+            self._row(kind, values, timeouts[kind])
+        self._row('total', sorted(all_values), total_timeouts)
+
+        cache = response_cache.stats()
+        self.stdout.write(
+            f"\nGemini stub: {model.calls} llamadas, {model.errors} errores | "
+            f"caché de respuestas: {cache['hits']} aciertos ({cache['hit_rate']:.0%}), "
+            f"{cache['bypassed']} sin caché"
+        )
+        methods = ', '.join(f"{method}={count}" for method, count in server.requests.most_common())
+        self.stdout.write(f"Bot API: {methods}")
+
+    def _row(self, kind: str, values: list, timeouts: int):
+        ms = [value * 1000 for value in values]
+        self.stdout.write(
+            f"{kind:>10} | {len(ms):>6} | {percentile(ms, 50):>7.0f} | {percentile(ms, 95):>7.0f} | "
+            f"{percentile(ms, 99):>7.0f} | {(ms[-1] if ms else 0):>7.0f} | {timeouts:>8}"
+        )
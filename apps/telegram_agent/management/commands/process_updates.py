@@ -0,0 +1,33 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from apps.telegram_agent.dedupe import seen_messages
+from apps.telegram_agent.update_queue import UpdateQueueWorker, UPDATE_QUEUE_WORKERS
+from apps.telegram_agent.views import handle_telegram_update
+from utils.metrics import start_metrics_server
+
+
+class Command(BaseCommand):
+    help = 'Procesa los updates que el webhook dejó en cola (PendingUpdate), en orden por chat'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=UPDATE_QUEUE_WORKERS,
+                            help='Threads de procesamiento (por defecto UPDATE_QUEUE_WORKERS)')
+        parser.add_argument('--metrics-port', type=int,
+                            help='Exponer /metrics del proceso en este puerto')
+
+    def handle(self, *args, **options):
+        seen_messages.load_recent()
+        worker = UpdateQueueWorker(handle_telegram_update, workers=options['workers'])
+        if options['metrics_port']:
+            start_metrics_server(options['metrics_port'])
+
+        # Ctrl+C / SIGTERM: terminar los updates ya tomados y salir
+        def shutdown(signum, frame):
+            self.stdout.write('Deteniendo, terminando los updates en curso...')
+            worker.stop()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+        worker.run()
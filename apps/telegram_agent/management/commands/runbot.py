@@ -3,5 +3,12 @@ from apps.telegram_agent import bot as bot_module
 
 class Command(BaseCommand):
     help = 'Run the telegram bot (use separate process in production)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['polling', 'webhook'],
+                            help='Modo de ejecución (por defecto TELEGRAM_BOT_MODE)')
+        parser.add_argument('--workers', type=int,
+                            help='Updates procesados en paralelo (por defecto BOT_CONCURRENT_UPDATES)')
+
     def handle(self, *args, **options):
-        bot_module.run_bot()
+        bot_module.run_bot(mode=options['mode'], workers=options['workers'])
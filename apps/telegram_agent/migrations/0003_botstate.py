@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_agent', '0002_survey_surveyquestion_surveyoption_surveyresponse_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BotState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('user', 'User data'), ('chat', 'Chat data'), ('bot', 'Bot data'), ('conversation', 'Conversación')], max_length=20)),
+                ('key', models.CharField(max_length=255)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Bot State',
+                'verbose_name_plural': 'Bot States',
+                'unique_together': {('kind', 'key')},
+            },
+        ),
+    ]
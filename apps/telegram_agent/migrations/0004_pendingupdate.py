@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_agent', '0003_botstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('update_id', models.BigIntegerField(unique=True)),
+                ('chat_id', models.BigIntegerField(blank=True, null=True)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('processing', 'Procesando'), ('done', 'Procesado'), ('failed', 'Fallido')], default='pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Pending Update',
+                'verbose_name_plural': 'Pending Updates',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'id'], name='telegram_ag_status_471dc7_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:57
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def backfill_chat_id(apps, schema_editor):
+    """
+    Completa chat_id con el chat guardado en metadata (mensajes del webhook) y
+    deja el telegram_message_id solo en el primer mensaje de cada
+    (chat_id, telegram_message_id) repetido; los demás conservan la fila
+    (y su AIResponse y feedback) con el id en NULL
+    """
+    TelegramMessage = apps.get_model('telegram_agent', 'TelegramMessage')
+    pending = TelegramMessage.objects.filter(chat_id__isnull=True, telegram_message_id__isnull=False)
+    for message in pending.only('id', 'metadata').iterator():
+        chat_id = ((message.metadata or {}).get('chat') or {}).get('id')
+        if chat_id is not None:
+            TelegramMessage.objects.filter(id=message.id).update(chat_id=chat_id)
+
+    duplicates = (
+        TelegramMessage.objects.filter(chat_id__isnull=False, telegram_message_id__isnull=False)
+        .values('chat_id', 'telegram_message_id')
+        .annotate(first_id=Min('id'), total=Count('id'))
+        .filter(total__gt=1)
+    )
+    for row in duplicates:
+        TelegramMessage.objects.filter(
+            chat_id=row['chat_id'], telegram_message_id=row['telegram_message_id']
+        ).exclude(id=row['first_id']).update(telegram_message_id=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_agent', '0004_pendingupdate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='telegrammessage',
+            name='chat_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_chat_id, reverse_code=migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='telegrammessage',
+            constraint=models.UniqueConstraint(condition=models.Q(('chat_id__isnull', False), ('telegram_message_id__isnull', False)), fields=('chat_id', 'telegram_message_id'), name='unique_chat_telegram_message'),
+        ),
+    ]
@@ -43,6 +43,8 @@ class TelegramMessage(models.Model):
     message_type = models.CharField(max_length=20, choices=MESSAGE_TYPE, default='text')
     direction = models.CharField(max_length=20, choices=DIRECTION, default='incoming')
     telegram_message_id = models.IntegerField(null=True, blank=True)
+    # message_id solo es único dentro de un chat
+    chat_id = models.BigIntegerField(null=True, blank=True)
     content = models.TextField()
     metadata = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -51,6 +53,14 @@ class TelegramMessage(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Telegram Message'
         verbose_name_plural = 'Telegram Messages'
+        constraints = [
+            # Un update repetido no puede crear el mismo mensaje dos veces
+            models.UniqueConstraint(
+                fields=['chat_id', 'telegram_message_id'],
+                condition=models.Q(chat_id__isnull=False, telegram_message_id__isnull=False),
+                name='unique_chat_telegram_message',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user} - {self.direction} - {self.content[:50]}"
@@ -128,6 +138,57 @@ class TelegramConfig(models.Model):
         return f"{self.key}: {self.value[:50]}"
 
 
+class BotState(models.Model):
+    """Estado persistente del bot (user_data, chat_data, bot_data y conversaciones)"""
+    KIND = (
+        ('user', 'User data'),
+        ('chat', 'Chat data'),
+        ('bot', 'Bot data'),
+        ('conversation', 'Conversación'),
+    )
+
+    kind = models.CharField(max_length=20, choices=KIND)
+    key = models.CharField(max_length=255)
+    data = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['kind', 'key']
+        verbose_name = 'Bot State'
+        verbose_name_plural = 'Bot States'
+
+    def __str__(self):
+        return f"{self.kind}:{self.key}"
+
+
+class PendingUpdate(models.Model):
+    """Update recibido por el webhook, en cola hasta que lo procese process_updates"""
+    STATUS = (
+        ('pending', 'Pendiente'),
+        ('processing', 'Procesando'),
+        ('done', 'Procesado'),
+        ('failed', 'Fallido'),
+    )
+
+    update_id = models.BigIntegerField(unique=True)
+    chat_id = models.BigIntegerField(null=True, blank=True)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['status', 'id'])]
+        verbose_name = 'Pending Update'
+        verbose_name_plural = 'Pending Updates'
+
+    def __str__(self):
+        return f"{self.update_id} ({self.status})"
+
+
 # ============ MODELOS PARA ENCUESTAS ============
 
 class Survey(models.Model):
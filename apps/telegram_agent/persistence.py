@@ -0,0 +1,235 @@
+"""
+Persistencia del estado del bot (user_data, chat_data, bot_data y conversaciones)
+en la BD de Django. Solo se escriben las claves que cambiaron, en lotes, cada
+BOT_PERSISTENCE_INTERVAL segundos; así reiniciar el bot no pierde encuestas en
+curso y varias réplicas pueden compartir el estado.
+"""
+import os
+import json
+import asyncio
+import logging
+from dotenv import load_dotenv
+from django.db import transaction
+from telegram.ext import BasePersistence, PersistenceInput
+
+from apps.telegram_agent.models import BotState
+from apps.telegram_agent.db import run_db
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Segundos entre escrituras del estado a la BD
+BOT_PERSISTENCE_INTERVAL = float(os.getenv('BOT_PERSISTENCE_INTERVAL', '10'))
+# Releer user_data/chat_data de la BD antes de cada update (varias réplicas)
+BOT_PERSISTENCE_REFRESH = os.getenv('BOT_PERSISTENCE_REFRESH', '0') == '1'
+
+BOT_DATA_KEY = 'bot'
+
+
+def _dump(data) -> str:
+    """
+    Serializa de forma estable para detectar cambios
+
+    Raises:
+        TypeError: si data tiene objetos que JSON no soporta
+    """
+    return json.dumps(data, sort_keys=True)
+
+
+def _conversation_key(name: str, key: tuple) -> str:
+    return f"{name}:{json.dumps(list(key))}"
+
+
+def write_states(changes: dict):
+    """
+    Aplica un lote de cambios en una transacción (sincrónico)
+
+    Args:
+        changes: {(kind, key): data} donde data=None borra la fila
+    """
+    upserts = [
+        BotState(kind=kind, key=key, data=data)
+        for (kind, key), data in changes.items() if data is not None
+    ]
+    deletes = [kind_key for kind_key, data in changes.items() if data is None]
+
+    with transaction.atomic():
+        if upserts:
+            BotState.objects.bulk_create(
+                upserts,
+                update_conflicts=True,
+                unique_fields=['kind', 'key'],
+                update_fields=['data', 'updated_at'],
+            )
+        for kind, key in deletes:
+            BotState.objects.filter(kind=kind, key=key).delete()
+
+
+def load_states(kind: str) -> dict:
+    """Lee todas las filas de un tipo: {key: data} (sincrónico)"""
+    return dict(BotState.objects.filter(kind=kind).values_list('key', 'data'))
+
+
+def load_state(kind: str, key: str):
+    """Lee una fila (None si no existe) (sincrónico)"""
+    return BotState.objects.filter(kind=kind, key=key).values_list('data', flat=True).first()
+
+
+class DjangoPersistence(BasePersistence):
+    """
+    BasePersistence respaldada por el modelo BotState
+
+    PTB llama a update_* en cada ciclo de persistencia con los datos de todos
+    los usuarios/chats que tuvieron actividad; aquí se comparan con lo último
+    escrito y solo las claves que realmente cambiaron se escriben, todas juntas
+    en una transacción. Los datos deben guardarse en JSON sin cambiar (claves
+    str, listas en vez de tuplas); si no, update_* lanza TypeError.
+    """
+
+    def __init__(self, update_interval: float = BOT_PERSISTENCE_INTERVAL,
+                 refresh: bool = BOT_PERSISTENCE_REFRESH):
+        super().__init__(
+            store_data=PersistenceInput(callback_data=False),
+            update_interval=update_interval,
+        )
+        self.refresh = refresh
+        self.written = 0
+        self._dirty = {}    # (kind, key) -> data (None = borrar)
+        self._hashes = {}   # (kind, key) -> hash de lo último leído/escrito
+        self._write_task = None
+
+    # ---------- Registro de cambios ----------
+
+    def _mark(self, kind: str, key: str, data):
+        """Registra un cambio si difiere de lo último escrito"""
+        kind_key = (kind, key)
+        if data is None:
+            if kind_key not in self._hashes and kind_key not in self._dirty:
+                return
+            self._hashes.pop(kind_key, None)
+            self._dirty[kind_key] = None
+        else:
+            dumped = _dump(data)
+            # Copia desacoplada del objeto vivo (PTB ya pasa deepcopies)
+            stored = json.loads(dumped)
+            if stored != data:
+                # Claves int o tuplas volverían como str y listas tras un reinicio
+                raise TypeError(
+                    f"[DjangoPersistence] {kind} {key}: los datos cambian al guardarse en JSON "
+                    f"(usar claves str y listas)"
+                )
+            digest = hash(dumped)
+            if self._hashes.get(kind_key) == digest:
+                return
+            self._hashes[kind_key] = digest
+            self._dirty[kind_key] = stored
+        self._schedule_write()
+
+    def _schedule_write(self):
+        """Agrupa todos los cambios de un ciclo de persistencia en una sola escritura"""
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.get_running_loop().create_task(self._write())
+
+    async def _write(self):
+        # Ceder el loop para que el resto de update_* del ciclo se acumulen
+        await asyncio.sleep(0)
+        while self._dirty:
+            changes, self._dirty = self._dirty, {}
+            try:
+                await run_db(write_states, changes)
+            except Exception as e:
+                logger.error(f"[DjangoPersistence] Error escribiendo {len(changes)} claves: {str(e)}")
+                # Reencolar sin pisar cambios más nuevos (se reintenta en el próximo ciclo)
+                for kind_key, data in changes.items():
+                    self._dirty.setdefault(kind_key, data)
+                return
+            self.written += len(changes)
+            logger.debug(f"[DjangoPersistence] {len(changes)} claves escritas")
+
+    async def flush(self) -> None:
+        """Espera la escritura en curso y escribe lo pendiente (al apagar)"""
+        if self._write_task is not None:
+            await self._write_task
+        if self._dirty:
+            await self._write()
+        logger.info(f"[DjangoPersistence] Flush final ({self.written} claves escritas)")
+
+    # ---------- Lectura ----------
+
+    async def _load_all(self, kind: str) -> dict:
+        rows = await run_db(load_states, kind)
+        for key, data in rows.items():
+            self._hashes[(kind, key)] = hash(_dump(data))
+        return rows
+
+    async def get_user_data(self):
+        rows = await self._load_all('user')
+        return {int(key): data for key, data in rows.items()}
+
+    async def get_chat_data(self):
+        rows = await self._load_all('chat')
+        return {int(key): data for key, data in rows.items()}
+
+    async def get_bot_data(self):
+        data = await run_db(load_state, 'bot', BOT_DATA_KEY)
+        if data is None:
+            return {}
+        self._hashes[('bot', BOT_DATA_KEY)] = hash(_dump(data))
+        return data
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str):
+        rows = await self._load_all('conversation')
+        prefix = f"{name}:"
+        conversations = {}
+        for key, data in rows.items():
+            if key.startswith(prefix):
+                conversations[tuple(json.loads(key[len(prefix):]))] = data.get('state')
+        return conversations
+
+    # ---------- Escritura ----------
+
+    async def update_user_data(self, user_id: int, data) -> None:
+        self._mark('user', str(user_id), data)
+
+    async def update_chat_data(self, chat_id: int, data) -> None:
+        self._mark('chat', str(chat_id), data)
+
+    async def update_bot_data(self, data) -> None:
+        self._mark('bot', BOT_DATA_KEY, data)
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        kind_key = _conversation_key(name, key)
+        self._mark('conversation', kind_key, None if new_state is None else {'state': new_state})
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._mark('user', str(user_id), None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._mark('chat', str(chat_id), None)
+
+    # ---------- Refresco (varias réplicas) ----------
+
+    async def _refresh(self, kind: str, key: str, data: dict):
+        if not self.refresh or (kind, key) in self._dirty:
+            return
+        stored = await run_db(load_state, kind, key)
+        if stored is None:
+            return
+        self._hashes[(kind, key)] = hash(_dump(stored))
+        data.clear()
+        data.update(stored)
+
+    async def refresh_user_data(self, user_id: int, user_data) -> None:
+        await self._refresh('user', str(user_id), user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data) -> None:
+        await self._refresh('chat', str(chat_id), chat_data)
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        pass
@@ -0,0 +1,49 @@
+"""
+Señales para invalidar las cachés en memoria del bot
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from apps.telegram_agent.models import TelegramUser, Survey, SurveyQuestion, SurveyOption
+from apps.telegram_agent.user_cache import invalidate_user
+from apps.telegram_agent.survey_graph import invalidate_survey_graph
+
+
+@receiver([post_save, post_delete], sender=TelegramUser)
+def invalidate_telegram_user(sender, instance, **kwargs):
+    """Descarta el usuario cacheado cuando se modifica o elimina"""
+    invalidate_user(instance.telegram_id)
+
+
+@receiver([post_save, post_delete], sender=Survey)
+def invalidate_survey(sender, instance, **kwargs):
+    """Descarta el grafo cacheado cuando se edita la encuesta"""
+    invalidate_survey_graph(instance.id)
+
+
+def _touch_survey(survey_id: int):
+    """
+    Cambia la versión (updated_at) de la encuesta: los otros procesos (bot,
+    workers) no reciben estas señales y recargan el grafo al ver otra versión
+    """
+    # update() no dispara post_save de Survey
+    Survey.objects.filter(id=survey_id).update(updated_at=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=SurveyQuestion)
+def invalidate_survey_question(sender, instance, **kwargs):
+    """Descarta el grafo cacheado cuando se edita una pregunta"""
+    _touch_survey(instance.survey_id)
+    invalidate_survey_graph(instance.survey_id)
+
+
+@receiver([post_save, post_delete], sender=SurveyOption)
+def invalidate_survey_option(sender, instance, **kwargs):
+    """Descarta el grafo cacheado cuando se edita una opción"""
+    survey_id = SurveyQuestion.objects.filter(id=instance.question_id).values_list('survey_id', flat=True).first()
+    if survey_id is None:
+        # La pregunta ya fue eliminada (borrado en cascada); su señal ya invalidó el grafo
+        return
+    _touch_survey(survey_id)
+    invalidate_survey_graph(survey_id)
@@ -0,0 +1,125 @@
+"""
+Grafo inmutable y cacheado de una encuesta (preguntas, opciones y orden)
+Se carga una vez por versión de la encuesta, así responder una pregunta en el
+bot cuesta un insert y ninguna lectura.
+"""
+import os
+import time
+import logging
+import threading
+from types import MappingProxyType
+from typing import NamedTuple, Optional
+from dotenv import load_dotenv
+
+from apps.telegram_agent.models import Survey
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Segundos antes de revalidar un grafo al iniciar una encuesta
+# (cubre ediciones hechas desde otro proceso, p. ej. el admin)
+SURVEY_GRAPH_TTL = int(os.getenv('SURVEY_GRAPH_TTL', '600'))
+
+
+class OptionNode(NamedTuple):
+    id: int
+    text: str
+
+
+class QuestionNode(NamedTuple):
+    id: int
+    text: str
+    question_type: str
+    is_required: bool
+    number: int            # Posición 1..N dentro de la encuesta
+    options: tuple         # OptionNode ordenadas
+    next_id: Optional[int]  # Siguiente pregunta (None si es la última)
+
+
+class SurveyGraph(NamedTuple):
+    id: int
+    title: str
+    version: object        # updated_at de la encuesta al cargarla
+    questions: tuple       # QuestionNode en orden
+    by_id: MappingProxyType
+    loaded_at: float
+
+    @property
+    def total(self) -> int:
+        return len(self.questions)
+
+    def first_question(self) -> Optional[QuestionNode]:
+        return self.questions[0] if self.questions else None
+
+    def question(self, question_id: int) -> Optional[QuestionNode]:
+        return self.by_id.get(question_id)
+
+    def next_question(self, question_id: int) -> Optional[QuestionNode]:
+        question = self.by_id.get(question_id)
+        if question is None or question.next_id is None:
+            return None
+        return self.by_id[question.next_id]
+
+
+_lock = threading.Lock()
+_graphs = {}
+
+
+def load_survey_graph(survey_id: int) -> SurveyGraph:
+    """Carga el grafo desde la BD y lo guarda en caché (sincrónico)"""
+    survey = Survey.objects.get(id=survey_id)
+    questions = list(
+        survey.questions.order_by('order', 'id').prefetch_related('options')
+    )
+
+    nodes = []
+    for index, question in enumerate(questions):
+        options = tuple(
+            OptionNode(option.id, option.option_text)
+            for option in sorted(question.options.all(), key=lambda o: (o.order, o.id))
+        )
+        nodes.append(QuestionNode(
+            id=question.id,
+            text=question.question_text,
+            question_type=question.question_type,
+            is_required=question.is_required,
+            number=index + 1,
+            options=options,
+            next_id=questions[index + 1].id if index + 1 < len(questions) else None,
+        ))
+
+    graph = SurveyGraph(
+        id=survey.id,
+        title=survey.title,
+        version=survey.updated_at,
+        questions=tuple(nodes),
+        by_id=MappingProxyType({node.id: node for node in nodes}),
+        loaded_at=time.monotonic(),
+    )
+    with _lock:
+        _graphs[survey.id] = graph
+    logger.info(f"[SurveyGraph] Encuesta {survey.id} cargada ({graph.total} preguntas)")
+    return graph
+
+
+def get_survey_graph(survey: Survey) -> SurveyGraph:
+    """
+    Obtiene el grafo de una encuesta ya leída, recargándolo si cambió su versión
+    o venció el TTL (sincrónico; usar al iniciar la encuesta)
+    """
+    graph = _graphs.get(survey.id)
+    if (graph is None or graph.version != survey.updated_at
+            or time.monotonic() - graph.loaded_at > SURVEY_GRAPH_TTL):
+        graph = load_survey_graph(survey.id)
+    return graph
+
+
+def get_cached_survey_graph(survey_id: int) -> Optional[SurveyGraph]:
+    """Obtiene el grafo en caché sin tocar la BD (None si no está cargado)"""
+    return _graphs.get(survey_id)
+
+
+def invalidate_survey_graph(survey_id: int):
+    """Descarta el grafo de una encuesta (tras editarla)"""
+    with _lock:
+        _graphs.pop(survey_id, None)
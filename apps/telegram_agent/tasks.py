@@ -6,21 +6,23 @@ from celery import shared_task
 from django.utils import timezone
 from django.contrib.auth.models import User
 import asyncio
-from aiogram import Bot
+from telegram.ext import ExtBot
 from dotenv import load_dotenv
 import os
 
-from apps.telegram_agent.models import TelegramUser, Broadcast, AIResponse, TelegramMessage
-from services.gemini_client import GeminiClient
+from apps.telegram_agent.models import TelegramUser, Broadcast, AIResponse, TelegramMessage, PendingUpdate
+from services.gemini_pool import get_gemini_client
+from services.telegram_rate import TelegramRateLimiter, PRIORITY_BULK, BROADCAST_CONCURRENCY
+from utils.metrics import stage_timer, timed_task
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
-bot = Bot(token=TELEGRAM_TOKEN)
 
 
 @shared_task
+@timed_task
 def send_scheduled_broadcasts():
     """Envía broadcasts programados que han llegado su hora"""
     try:
@@ -42,6 +44,7 @@ def send_scheduled_broadcasts():
 
 
 @shared_task
+@timed_task
 def send_broadcast(broadcast_id):
     """Envía un broadcast a todos los usuarios activos"""
     try:
@@ -49,17 +52,12 @@ def send_broadcast(broadcast_id):
         broadcast.status = 'sending'
         broadcast.save()
         
-        users = TelegramUser.objects.filter(is_active=True)
-        sent_count = 0
-        failed_count = 0
-        
-        for user in users:
-            try:
-                asyncio.run(send_broadcast_message(user.telegram_id, broadcast.content))
-                sent_count += 1
-            except Exception as e:
-                logger.error(f"Error enviando broadcast a {user.telegram_id}: {str(e)}")
-                failed_count += 1
+        chat_ids = list(
+            TelegramUser.objects.filter(is_active=True).values_list('telegram_id', flat=True)
+        )
+        sent_count, failed_count = asyncio.run(
+            send_broadcast_messages(chat_ids, broadcast.content)
+        )
         
         broadcast.sent_count = sent_count
         broadcast.failed_count = failed_count
@@ -74,21 +72,49 @@ def send_broadcast(broadcast_id):
         return f"Error: {str(e)}"
 
 
-async def send_broadcast_message(chat_id: str, text: str):
-    """Envía mensaje de broadcast a Telegram"""
+async def send_broadcast_messages(chat_ids: list, text: str):
+    """
+    Envía un broadcast a varios chats con un solo bot y el rate limiter compartido
+    
+    Returns:
+        Tupla (enviados, fallidos)
+    """
+    semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+    
+    async with ExtBot(token=TELEGRAM_TOKEN, rate_limiter=TelegramRateLimiter()) as bot:
+        async def send_one(chat_id):
+            async with semaphore:
+                try:
+                    await send_broadcast_message(bot, chat_id, text)
+                    return True
+                except Exception as e:
+                    logger.error(f"Error enviando broadcast a {chat_id}: {str(e)}")
+                    return False
+        
+        results = await asyncio.gather(*(send_one(chat_id) for chat_id in chat_ids))
+    
+    sent_count = sum(results)
+    return sent_count, len(results) - sent_count
+
+
+async def send_broadcast_message(bot: ExtBot, chat_id: str, text: str):
+    """Envía mensaje de broadcast a Telegram (prioridad baja frente al bot)"""
     try:
         if len(text) > 4000:
             chunks = [text[i:i+4000] for i in range(0, len(text), 4000)]
             for chunk in chunks:
-                await bot.send_message(chat_id=chat_id, text=chunk, parse_mode="HTML")
+                await bot.send_message(chat_id=chat_id, text=chunk, parse_mode="HTML",
+                                       rate_limit_args=PRIORITY_BULK)
         else:
-            await bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML")
+            await bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML",
+                                   rate_limit_args=PRIORITY_BULK)
     except Exception as e:
         logger.error(f"Error enviando a {chat_id}: {str(e)}")
         raise
 
 
 @shared_task
+@timed_task
 def analyze_feedback():
     """Analiza el feedback recibido y mejora el modelo"""
     try:
@@ -98,7 +124,7 @@ def analyze_feedback():
             feedback_score__isnull=False
         ).order_by('-updated_at')[:20]
         
-        gemini = GeminiClient()
+        gemini = get_gemini_client()
         
         analysis_results = []
         for response in responses:
@@ -117,6 +143,7 @@ def analyze_feedback():
 
 
 @shared_task
+@timed_task
 def cleanup_old_data():
     """Limpia datos antiguos de la base de datos"""
     try:
@@ -135,7 +162,14 @@ def cleanup_old_data():
             status__in=['pending', 'failed']
         ).delete()
         
-        logger.info(f"Limpieza completada: {old_messages_count} mensajes, {old_responses_count} respuestas")
+        # Updates del webhook ya procesados (se conservan un día para ignorar reintentos)
+        old_updates_count, _ = PendingUpdate.objects.filter(
+            status='done',
+            processed_at__lt=timezone.now() - timedelta(days=1)
+        ).delete()
+        
+        logger.info(f"Limpieza completada: {old_messages_count} mensajes, {old_responses_count} respuestas, "
+                    f"{old_updates_count} updates")
         return f"Eliminados {old_messages_count} mensajes y {old_responses_count} respuestas antiguas"
     
     except Exception as e:
@@ -144,10 +178,11 @@ def cleanup_old_data():
 
 
 @shared_task
+@timed_task
 def process_ai_response_batch(user_ids: list):
     """Procesa respuestas de IA para un lote de usuarios"""
     try:
-        gemini = GeminiClient()
+        gemini = get_gemini_client()
         processed = 0
         
         for user_id in user_ids:
@@ -156,15 +191,17 @@ def process_ai_response_batch(user_ids: list):
                 recent_message = TelegramMessage.objects.filter(user=user).latest('created_at')
                 
                 if recent_message and not AIResponse.objects.filter(message=recent_message).exists():
-                    ai_result = gemini.get_response(recent_message.content, user_id)
+                    with stage_timer('gemini_call', flow='celery'):
+                        ai_result = gemini.get_response(recent_message.content, user_id)
                     
-                    AIResponse.objects.create(
-                        message=recent_message,
-                        response_text=ai_result['response'],
-                        confidence_score=ai_result['confidence_score'],
-                        model_used=ai_result['model'],
-                        status='sent'
-                    )
+                    with stage_timer('response_insert', flow='celery'):
+                        AIResponse.objects.create(
+                            message=recent_message,
+                            response_text=ai_result['response'],
+                            confidence_score=ai_result['confidence_score'],
+                            model_used=ai_result['model'],
+                            status='sent'
+                        )
                     processed += 1
             except Exception as e:
                 logger.error(f"Error procesando usuario {user_id}: {str(e)}")
@@ -178,6 +215,7 @@ def process_ai_response_batch(user_ids: list):
 
 
 @shared_task
+@timed_task
 def generate_statistics():
     """Genera estadísticas del sistema"""
     try:
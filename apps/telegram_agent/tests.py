@@ -0,0 +1,117 @@
+import asyncio
+from datetime import datetime, timezone
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, TestCase
+from telegram import Chat, Message, Update
+
+from apps.telegram_agent import update_queue, user_cache
+from apps.telegram_agent.models import PendingUpdate, TelegramUser
+from apps.telegram_agent.update_processor import ChatOrderedUpdateProcessor
+from apps.telegram_agent.update_queue import UpdateQueueWorker, UPDATE_QUEUE_MAX_ATTEMPTS
+from apps.telegram_agent.views import handle_telegram_update
+
+
+def _message_update(update_id: int, message_id: int = 1) -> dict:
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': message_id,
+            'from': {'id': 555, 'username': 'prueba'},
+            'chat': {'id': 555, 'type': 'private'},
+            'text': 'hola',
+        },
+    }
+
+
+@mock.patch.object(update_queue.time, 'sleep', lambda seconds: None)
+class UpdateQueueRetryTests(TestCase):
+    """Un update cuyo procesamiento falla se reintenta y termina como fallido"""
+
+    def _claimed_row(self, update_data: dict) -> dict:
+        update_queue.enqueue_update(update_data)
+        return UpdateQueueWorker(handle_telegram_update, workers=1)._claim()[0]
+
+    def test_failing_handler_marks_row_failed_after_max_attempts(self):
+        handler = mock.Mock(side_effect=RuntimeError('falla'))
+        row = self._claimed_row(_message_update(1001))
+
+        self.assertFalse(UpdateQueueWorker(handler, workers=1)._handle(row))
+
+        pending = PendingUpdate.objects.get(update_id=1001)
+        self.assertEqual(pending.status, 'failed')
+        self.assertEqual(pending.attempts, UPDATE_QUEUE_MAX_ATTEMPTS)
+        self.assertIn('falla', pending.last_error)
+        self.assertEqual(handler.call_count, UPDATE_QUEUE_MAX_ATTEMPTS)
+
+    def test_gemini_error_propagates_and_every_attempt_runs(self):
+        row = self._claimed_row(_message_update(1002, message_id=7))
+
+        with mock.patch('apps.telegram_agent.views.get_gemini_client', side_effect=RuntimeError('gemini caído')) as client:
+            self.assertFalse(UpdateQueueWorker(handle_telegram_update, workers=1)._handle(row))
+
+        # Ningún reintento se descartó como duplicado
+        self.assertEqual(client.call_count, UPDATE_QUEUE_MAX_ATTEMPTS)
+        self.assertEqual(PendingUpdate.objects.get(update_id=1002).status, 'failed')
+
+
+class UserCacheTTLTests(TestCase):
+    """Un acierto de la caché de usuarios no renueva su TTL"""
+
+    def setUp(self):
+        user_cache.invalidate_user('777')
+
+    def test_hits_do_not_extend_ttl(self):
+        with mock.patch('utils.cache.time.monotonic', return_value=1000.0):
+            user_cache.get_or_create_user('777', 'ana', 'Ana')
+        # Edición hecha en otro proceso (sin señal en este)
+        TelegramUser.objects.filter(telegram_id='777').update(is_active=False)
+
+        with mock.patch('utils.cache.time.monotonic', return_value=1000.0 + user_cache.USER_CACHE_TTL - 1):
+            self.assertTrue(user_cache.get_or_create_user('777', 'ana', 'Ana').is_active)
+        with mock.patch('utils.cache.time.monotonic', return_value=1000.0 + user_cache.USER_CACHE_TTL + 1):
+            self.assertFalse(user_cache.get_or_create_user('777', 'ana', 'Ana').is_active)
+
+
+def _chat_update(update_id: int, chat_id: int) -> Update:
+    chat = Chat(id=chat_id, type=Chat.PRIVATE)
+    return Update(update_id, message=Message(update_id, datetime.now(timezone.utc), chat))
+
+
+class ChatOrderedUpdateProcessorTests(SimpleTestCase):
+    """Orden dentro de cada chat y concurrencia entre chats hasta el límite"""
+
+    def test_same_chat_in_order_other_chats_concurrent_up_to_limit(self):
+        processor = ChatOrderedUpdateProcessor(2)
+        events = []
+        running = []
+        peak = []
+
+        async def handle(name: str):
+            running.append(name)
+            peak.append(len(running))
+            events.append(f'{name}:inicio')
+            await asyncio.sleep(0.02)
+            events.append(f'{name}:fin')
+            running.remove(name)
+
+        async def run():
+            updates = [
+                ('chat1-a', _chat_update(1, 1)),
+                ('chat1-b', _chat_update(2, 1)),
+                ('chat2', _chat_update(3, 2)),
+                ('chat3', _chat_update(4, 3)),
+            ]
+            await asyncio.gather(*(
+                processor.process_update(update, handle(name)) for name, update in updates
+            ))
+
+        async_to_sync(run)()
+
+        self.assertLess(events.index('chat1-a:fin'), events.index('chat1-b:inicio'))
+        # chat2 no espera a que termine chat1
+        self.assertLess(events.index('chat2:inicio'), events.index('chat1-a:fin'))
+        self.assertEqual(max(peak), 2)
+        self.assertEqual(processor.max_concurrent_updates, 2)
+        self.assertEqual(processor._chat_locks, {})
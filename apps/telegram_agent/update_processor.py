@@ -0,0 +1,80 @@
+"""
+Procesador de updates concurrente que respeta el orden por chat
+Los updates de chats distintos se procesan en paralelo; los de un mismo chat
+se procesan uno tras otro (necesario para la máquina de estados de encuestas).
+"""
+import asyncio
+import logging
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+# Límite del semáforo de BaseUpdateProcessor: process_update (final) lo toma
+# antes de do_process_update, así que no debe ser el que limita la concurrencia
+_UNBOUNDED = 2 ** 31 - 1
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Limita la concurrencia total a max_concurrent_updates y serializa por chat
+
+    Los updates llegan en orden y los asyncio.Lock despiertan a sus esperas en
+    orden FIFO, por lo que dentro de un chat se conserva el orden de llegada.
+    Un cupo de concurrencia se toma recién con el lock del chat en mano: los
+    updates que esperan a su chat no ocupan cupos y no frenan a otros chats.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        # El semáforo de la base queda sin límite a propósito: _slots es el que
+        # limita, y se toma dentro del lock del chat (ver do_process_update).
+        # Depende de detalles privados de BaseUpdateProcessor en PTB 21.5
+        # (fijada en requirements.txt): su __init__ lee la propiedad
+        # max_concurrent_updates, que aquí devuelve _limit, así que _limit
+        # debe existir antes de super().__init__ y se cambia después al
+        # límite real que se informa.
+        self._limit = _UNBOUNDED
+        super().__init__(_UNBOUNDED)
+        self._limit = max_concurrent_updates
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._chat_locks = {}  # chat_id -> [Lock, updates en espera o en curso]
+
+    @property
+    def max_concurrent_updates(self) -> int:
+        return self._limit
+
+    @staticmethod
+    def _chat_id(update: object):
+        if isinstance(update, Update) and update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        chat_id = self._chat_id(update)
+        if chat_id is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        entry = self._chat_locks.get(chat_id)
+        if entry is None:
+            entry = self._chat_locks[chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._slots:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                # Chat sin updates pendientes: no se guarda su lock
+                del self._chat_locks[chat_id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
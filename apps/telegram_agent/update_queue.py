@@ -0,0 +1,202 @@
+"""
+Cola durable de updates del webhook
+El webhook solo valida el update, lo guarda en PendingUpdate y responde 200; el
+comando process_updates los procesa con un pool de workers. Los updates de un
+mismo chat van siempre al mismo worker, así que se procesan en orden.
+"""
+import os
+import time
+import queue
+import logging
+import threading
+from dotenv import load_dotenv
+from django.db import close_old_connections
+from django.utils import timezone
+
+from apps.telegram_agent.models import PendingUpdate
+from utils.metrics import registry, stage_timer
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+UPDATE_QUEUE_WORKERS = int(os.getenv('UPDATE_QUEUE_WORKERS', '4'))
+UPDATE_QUEUE_BATCH = int(os.getenv('UPDATE_QUEUE_BATCH', '100'))
+UPDATE_QUEUE_POLL_MS = int(os.getenv('UPDATE_QUEUE_POLL_MS', '200'))
+UPDATE_QUEUE_MAX_ATTEMPTS = int(os.getenv('UPDATE_QUEUE_MAX_ATTEMPTS', '3'))
+UPDATE_QUEUE_LOG_INTERVAL = float(os.getenv('UPDATE_QUEUE_LOG_INTERVAL', '30'))  # segundos
+
+
+def update_chat_id(update_data: dict):
+    """Chat del update (None si no tiene)"""
+    for key in ('message', 'edited_message', 'channel_post'):
+        if key in update_data:
+            return (update_data[key].get('chat') or {}).get('id')
+    callback = update_data.get('callback_query')
+    if callback and callback.get('message'):
+        return (callback['message'].get('chat') or {}).get('id')
+    return None
+
+
+def _pending_update(update_data: dict) -> PendingUpdate:
+    update_id = update_data.get('update_id')
+    if not isinstance(update_id, int):
+        raise ValueError('update_id inválido')
+    return PendingUpdate(update_id=update_id, chat_id=update_chat_id(update_data), payload=update_data)
+
+
+def enqueue_update(update_data: dict):
+    """
+    Guarda el update en la cola (un solo INSERT; los reintentos de Telegram se ignoran)
+
+    Raises:
+        ValueError: Si el update no tiene update_id
+    """
+    PendingUpdate.objects.bulk_create([_pending_update(update_data)], ignore_conflicts=True)
+
+
+async def aenqueue_update(update_data: dict):
+    """Versión asíncrona de enqueue_update (ORM async)"""
+    await PendingUpdate.objects.abulk_create([_pending_update(update_data)], ignore_conflicts=True)
+
+
+def backlog() -> int:
+    """Updates pendientes o en proceso"""
+    return PendingUpdate.objects.filter(status__in=['pending', 'processing']).count()
+
+
+registry.gauge('recruitment_update_queue_backlog', 'Updates del webhook sin procesar', callback=backlog)
+
+
+class UpdateQueueWorker:
+    """
+    Despachador + pool de threads que vacía PendingUpdate
+
+    Args:
+        handler: Función handler(update_data) que procesa un update (sincrónica)
+        workers: Threads de procesamiento
+    """
+
+    def __init__(self, handler, workers: int = UPDATE_QUEUE_WORKERS,
+                 batch_size: int = UPDATE_QUEUE_BATCH, poll_ms: int = UPDATE_QUEUE_POLL_MS):
+        self.handler = handler
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_ms / 1000
+        self.processed = 0
+        self.failed = 0
+        self._queues = [queue.Queue(maxsize=batch_size) for _ in range(workers)]
+        self._done = []
+        self._done_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _route(self, chat_id) -> queue.Queue:
+        return self._queues[hash(chat_id) % self.workers]
+
+    def _work(self, items: queue.Queue):
+        """Procesa en orden los updates asignados a este thread"""
+        while True:
+            row = items.get()
+            if row is None:
+                break
+            close_old_connections()
+            if self._handle(row):
+                with self._done_lock:
+                    self._done.append(row['id'])
+        close_old_connections()
+
+    def _handle(self, row: dict) -> bool:
+        """
+        Procesa un update reintentando en el mismo thread (así no se adelanta
+        el siguiente update del chat)
+
+        Returns:
+            True si se procesó; False si se marcó como fallido
+        """
+        for attempt in range(row['attempts'] + 1, UPDATE_QUEUE_MAX_ATTEMPTS + 1):
+            try:
+                with stage_timer('total', flow='webhook'):
+                    self.handler(row['payload'])
+                return True
+            except Exception as e:
+                logger.error(
+                    f"[UpdateQueue] Error procesando update {row['update_id']} "
+                    f"(intento {attempt}/{UPDATE_QUEUE_MAX_ATTEMPTS}): {str(e)}",
+                    exc_info=True,
+                )
+                error = e
+                if attempt < UPDATE_QUEUE_MAX_ATTEMPTS:
+                    time.sleep(min(2 ** attempt * 0.1, 5))
+        PendingUpdate.objects.filter(id=row['id']).update(
+            status='failed', attempts=UPDATE_QUEUE_MAX_ATTEMPTS, last_error=str(error)[:1000]
+        )
+        self.failed += 1
+        return False
+
+    def _mark_done(self):
+        """Marca como procesados los updates terminados (un solo UPDATE)"""
+        with self._done_lock:
+            ids, self._done = self._done, []
+        if ids:
+            PendingUpdate.objects.filter(id__in=ids).update(status='done', processed_at=timezone.now())
+            self.processed += len(ids)
+
+    def _claim(self) -> list:
+        """Toma el siguiente lote de pendientes en orden de llegada"""
+        rows = list(
+            PendingUpdate.objects.filter(status='pending')
+            .order_by('id')
+            .values('id', 'update_id', 'chat_id', 'payload', 'attempts')[:self.batch_size]
+        )
+        if rows:
+            PendingUpdate.objects.filter(id__in=[row['id'] for row in rows]).update(status='processing')
+        return rows
+
+    def run(self):
+        """Procesa la cola hasta stop() (bloqueante)"""
+        # Los que quedaron a medias en una ejecución anterior vuelven a la cola
+        recovered = PendingUpdate.objects.filter(status='processing').update(status='pending')
+        if recovered:
+            logger.warning(f"[UpdateQueue] {recovered} updates recuperados de una ejecución anterior")
+
+        self._threads = [
+            threading.Thread(target=self._work, args=(items,), daemon=True, name=f"update-worker-{i}")
+            for i, items in enumerate(self._queues)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"[UpdateQueue] Procesando con {self.workers} workers")
+
+        last_log = 0.0
+        try:
+            while not self._stop.is_set():
+                self._mark_done()
+                rows = self._claim()
+                for row in rows:
+                    # put bloquea si el worker está atrasado (contrapresión)
+                    chat_id = row['chat_id']
+                    self._route(row['update_id'] if chat_id is None else chat_id).put(row)
+                if time.monotonic() - last_log >= UPDATE_QUEUE_LOG_INTERVAL:
+                    last_log = time.monotonic()
+                    logger.info("[UpdateQueue] Estado", extra=self.stats())
+                if not rows:
+                    self._stop.wait(self.poll_interval)
+                close_old_connections()
+        finally:
+            for items in self._queues:
+                items.put(None)
+            for thread in self._threads:
+                thread.join()
+            self._mark_done()
+            logger.info(f"[UpdateQueue] Detenido: {self.processed} procesados, {self.failed} fallidos")
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> dict:
+        return {
+            'backlog': backlog(),
+            'in_memory': sum(items.qsize() for items in self._queues),
+            'processed': self.processed,
+            'failed': self.failed,
+        }
@@ -5,6 +5,7 @@ app_name = 'telegram_agent'
 urlpatterns = [
     # Webhook
     path('webhook/', views.webhook, name='webhook'),
+    path('metrics/', views.metrics, name='metrics'),
     
     # Dashboard y panel
     path('dashboard/', views.dashboard, name='dashboard'),
@@ -0,0 +1,87 @@
+"""
+Caché en memoria de usuarios de Telegram para el hot path del bot
+Evita el SELECT (y el UPDATE) de TelegramUser en cada mensaje
+"""
+import os
+import logging
+from dotenv import load_dotenv
+from django.utils import timezone
+
+from apps.telegram_agent.models import TelegramUser
+from utils.cache import TTLCache
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '600'))  # segundos
+
+# Campos del modelo que se guardan en caché (pk y perfil)
+FIELD_NAMES = [f.attname for f in TelegramUser._meta.concrete_fields]
+
+_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+
+def get_or_create_user(telegram_id: str, username: str = None, first_name: str = None,
+                       last_name: str = None) -> TelegramUser:
+    """
+    Obtiene o crea un usuario usando la caché (sincrónico)
+
+    Solo toca la BD en un fallo de caché o cuando cambian username/first_name.
+
+    Args:
+        telegram_id: ID de Telegram del usuario
+        username: Username actual en Telegram
+        first_name: Nombre actual en Telegram
+        last_name: Apellido actual en Telegram
+
+    Returns:
+        Instancia de TelegramUser (construida desde la caché, sin consulta)
+    """
+    telegram_id = str(telegram_id)
+    username = username or 'sin_usuario'
+    first_name = first_name or 'Usuario'
+    last_name = last_name or ''
+
+    values = _cache.get(telegram_id)
+    changed = values is None
+    if values is None:
+        user, _ = TelegramUser.objects.get_or_create(
+            telegram_id=telegram_id,
+            defaults={
+                'username': username,
+                'first_name': first_name,
+                'last_name': last_name,
+            }
+        )
+        values = {name: getattr(user, name) for name in FIELD_NAMES}
+
+    # Actualizar información solo si cambió
+    if values['username'] != username or values['first_name'] != first_name:
+        now = timezone.now()
+        TelegramUser.objects.filter(pk=values['id']).update(
+            username=username,
+            first_name=first_name,
+            last_name=last_name,
+            updated_at=now,
+        )
+        values = dict(values, username=username, first_name=first_name,
+                      last_name=last_name, updated_at=now)
+        changed = True
+
+    # Un acierto no renueva el TTL: así acota cuánto tarda en verse un cambio
+    # hecho en otro proceso (admin, Celery, otra réplica), donde las señales
+    # de invalidación no llegan
+    if changed:
+        _cache.set(telegram_id, values)
+    return TelegramUser.from_db('default', FIELD_NAMES, [values[name] for name in FIELD_NAMES])
+
+
+def invalidate_user(telegram_id: str):
+    """Elimina un usuario de la caché (p. ej. tras editarlo en el admin)"""
+    _cache.pop(str(telegram_id))
+
+
+def user_cache_stats() -> dict:
+    """Aciertos, fallos y tamaño de la caché de usuarios"""
+    return _cache.stats()
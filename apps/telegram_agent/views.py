@@ -5,9 +5,10 @@ import json
 import logging
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse, HttpResponse
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
+from django.db import IntegrityError, transaction
 from django.db.models import Count, Q, Avg
 from dotenv import load_dotenv
 import os
@@ -19,14 +20,21 @@ from apps.telegram_agent.models import (
     Survey, SurveyQuestion, SurveyOption, SurveyResponse, SurveyAnswer
 )
 from apps.jobs.models import JobOffer
-from services.gemini_client import GeminiClient
+from apps.jobs.snapshot import get_published_jobs_snapshot
+from apps.telegram_agent import user_cache
+from apps.telegram_agent.conversation_memory import conversation_memory
+from apps.telegram_agent.update_queue import aenqueue_update
+from apps.telegram_agent.dedupe import seen_messages, message_key
+from services.gemini_pool import get_gemini_client
 from services.gemini_2_cliente import Gemini2Client
-from services.telegram_api import publish_generated_image
+from services.telegram_api import apublish_generated_image
+from utils.metrics import registry, stage_timer, is_authorized, CONTENT_TYPE
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET')
 
 
 @login_required(login_url='/admin/login/')
@@ -153,7 +161,7 @@ def image_generator(request):
 
 
 @login_required(login_url='/admin/login/')
-def generate_image(request):
+async def generate_image(request):
     """API para generar imagenes, carruseles y videos con Stable Diffusion"""
     if request.method != 'POST':
         return JsonResponse({'success': False, 'error': 'Metodo no permitido'})
@@ -179,10 +187,10 @@ def generate_image(request):
             return JsonResponse({
                 'success': False,
                 'error': 'Gemini 2 no está configurado',
-                'details': 'Asegúrate de tener GEMINI_API_KEY_2 en el archivo .env'
+                'details': 'Asegúrate de tener GEMINI_IMAGE_API_KEYS o GEMINI_API_KEY_2 en el archivo .env'
             })
         
-        result = gemini2_client.generate_image(description, content_type, theme=theme)
+        result = await gemini2_client.agenerate_image(description, content_type, theme=theme)
         
         if not result or not result.get('success'):
             logger.error(f"[generate_image] Error generando imagen: {result}")
@@ -219,13 +227,11 @@ def generate_image(request):
         logger.error(f"[generate_image] Error en JSON: {str(e)}")
         return JsonResponse({'success': False, 'error': 'JSON inválido'})
     except Exception as e:
-        logger.error(f"[generate_image] Error: {str(e)}")
-        import traceback
-        logger.error(traceback.format_exc())
+        logger.error(f"[generate_image] Error: {str(e)}", exc_info=True)
         return JsonResponse({'success': False, 'error': str(e)})
 
 
-def publish_image(request):
+async def publish_image(request):
     """API para publicar imagen generada en Telegram"""
     if request.method != 'POST':
         return JsonResponse({'success': False, 'error': 'Metodo no permitido'})
@@ -250,7 +256,7 @@ def publish_image(request):
         logger.info(f"[publish_image] Iniciando publicación en Telegram...")
         
         # Publicar imagen en Telegram
-        success = publish_generated_image(image_base64, theme, description)
+        success = await apublish_generated_image(image_base64, theme, description)
         
         if not success:
             logger.error(f"[publish_image] Fallo al publicar en Telegram")
@@ -273,26 +279,23 @@ def publish_image(request):
         return JsonResponse({'success': False, 'error': 'JSON inválido en la solicitud'})
     
     except Exception as e:
-        logger.error(f"[publish_image] Error publicando imagen: {str(e)}")
-        import traceback
-        logger.error(traceback.format_exc())
+        logger.error(f"[publish_image] Error publicando imagen: {str(e)}", exc_info=True)
         return JsonResponse({'success': False, 'error': f'Error del servidor: {str(e)}'})
-        return JsonResponse({'success': False, 'error': str(e)})
 
 
 @login_required(login_url='/admin/login/')
-def feedback_response(request, response_id):
+async def feedback_response(request, response_id):
     """API para enviar feedback de respuestas IA"""
     if request.method != 'POST':
         return JsonResponse({'success': False, 'error': 'Metodo no permitido'})
     
     try:
         data = json.loads(request.body)
-        response_obj = get_object_or_404(AIResponse, id=response_id)
+        response_obj = await aget_object_or_404(AIResponse, id=response_id)
         
         response_obj.feedback_score = int(data.get('rating', 3))
-        response_obj.feedback_text = data.get('feedback', '')
-        response_obj.save()
+        response_obj.feedback = data.get('feedback', '')
+        await response_obj.asave(update_fields=['feedback_score', 'feedback', 'updated_at'])
         
         return JsonResponse({'success': True, 'message': 'Feedback registrado'})
     
@@ -302,105 +305,163 @@ def feedback_response(request, response_id):
 
 
 @csrf_exempt
-def webhook(request):
+async def webhook(request):
     """
     Webhook para recibir actualizaciones de Telegram
     POST /telegram/webhook/
+    
+    Solo guarda el update en la cola (PendingUpdate) y responde de inmediato;
+    lo procesa el comando process_updates.
     """
     if request.method == 'POST':
+        if TELEGRAM_WEBHOOK_SECRET and \
+                request.headers.get('X-Telegram-Bot-Api-Secret-Token') != TELEGRAM_WEBHOOK_SECRET:
+            logger.warning("Webhook rechazado: secret token inválido")
+            return JsonResponse({'ok': False, 'error': 'Forbidden'}, status=403)
         try:
             update_data = json.loads(request.body)
-            
-            # Procesar actualización
-            process_telegram_update(update_data)
-            
+            with stage_timer('enqueue', flow='webhook'):
+                await aenqueue_update(update_data)
             return JsonResponse({'ok': True})
-        except Exception as e:
-            logger.error(f"Error en webhook: {str(e)}")
+        except (ValueError, AttributeError) as e:
+            logger.error(f"Update inválido en webhook: {str(e)}")
             return JsonResponse({'ok': False, 'error': str(e)}, status=400)
+        except Exception as e:
+            # Sin guardar: un 500 hace que Telegram reintente el envío
+            logger.error(f"Error en webhook: {str(e)}", exc_info=True)
+            return JsonResponse({'ok': False, 'error': 'No se pudo encolar el update'}, status=500)
     
     return JsonResponse({'ok': True, 'message': 'Webhook ready'})
 
 
-def process_telegram_update(update_data: dict):
+def metrics(request):
+    """
+    Métricas del proceso web en formato Prometheus
+    GET /telegram/metrics/ (con METRICS_TOKEN: Authorization: Bearer <token>)
+    """
+    if not is_authorized(request.headers.get('Authorization', '')):
+        return HttpResponse('Unauthorized', status=401)
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
+
+
+def handle_telegram_update(update_data: dict):
     """
     Procesa una actualización de Telegram
     Crea mensajes, genera respuestas con Gemini y envía respuestas
+    
+    Raises:
+        La excepción original si algo falla; el mensaje deja de contarse como
+        visto para que el reintento no se descarte como duplicado
     """
-    try:
-        if 'message' not in update_data:
+    if 'message' not in update_data:
+        return
+    
+    message_data = update_data['message']
+    user_data = message_data.get('from', {})
+    
+    # Descartar reintentos antes de tocar la BD o llamar a Gemini
+    key = None
+    chat_id = (message_data.get('chat') or {}).get('id')
+    if chat_id is not None and message_data.get('message_id') is not None:
+        key = message_key(chat_id, message_data['message_id'])
+        if seen_messages.seen(key, source='webhook'):
+            logger.info("Update repetido descartado", extra={'update_id': update_data.get('update_id')})
             return
-        
-        message_data = update_data['message']
-        user_data = message_data.get('from', {})
-        
-        # Obtener o crear usuario
-        telegram_id = str(user_data.get('id'))
-        user, created = TelegramUser.objects.get_or_create(
+    
+    try:
+        _answer_message(update_data, message_data, user_data)
+    except Exception:
+        if key is not None:
+            seen_messages.forget(key)
+        raise
+
+
+def _answer_message(update_data: dict, message_data: dict, user_data: dict):
+    """Guarda el mensaje entrante y su respuesta de IA (propaga los errores)"""
+    # Obtener o crear usuario (con caché en memoria)
+    telegram_id = str(user_data.get('id'))
+    with stage_timer('user_lookup', flow='webhook'):
+        user = user_cache.get_or_create_user(
             telegram_id=telegram_id,
-            defaults={
-                'username': user_data.get('username', ''),
-                'first_name': user_data.get('first_name', ''),
-                'last_name': user_data.get('last_name', ''),
-            }
+            username=user_data.get('username'),
+            first_name=user_data.get('first_name'),
+            last_name=user_data.get('last_name'),
         )
-        
-        # Determinar tipo de mensaje
-        message_type = 'text'
-        content = message_data.get('text', '')
-        
-        if message_data.get('photo'):
-            message_type = 'photo'
-            content = '[Foto enviada]'
-        elif message_data.get('document'):
-            message_type = 'document'
-            content = '[Documento enviado]'
-        elif message_data.get('voice'):
-            message_type = 'voice'
-            content = '[Mensaje de voz]'
-        
-        # Crear registro de mensaje
-        msg = TelegramMessage.objects.create(
-            user=user,
-            message_type=message_type,
-            direction='incoming',
-            content=content,
+    
+    # Determinar tipo de mensaje
+    message_type = 'text'
+    content = message_data.get('text', '')
+    
+    if message_data.get('photo'):
+        message_type = 'photo'
+        content = '[Foto enviada]'
+    elif message_data.get('document'):
+        message_type = 'document'
+        content = '[Documento enviado]'
+    elif message_data.get('voice'):
+        message_type = 'voice'
+        content = '[Mensaje de voz]'
+    
+    # Crear registro de mensaje
+    try:
+        # Savepoint: un IntegrityError no invalida una transacción que nos contenga
+        with stage_timer('message_insert', flow='webhook'), transaction.atomic():
+            msg = TelegramMessage.objects.create(
+                user=user,
+                message_type=message_type,
+                direction='incoming',
+                content=content,
+                telegram_message_id=message_data.get('message_id'),
+                chat_id=(message_data.get('chat') or {}).get('id'),
+                metadata=message_data
+            )
+    except IntegrityError:
+        # Ya guardado (restricción única de message_id): si quedó sin respuesta es
+        # el reintento de un intento fallido y se retoma; si no, es un duplicado
+        msg = TelegramMessage.objects.filter(
+            chat_id=(message_data.get('chat') or {}).get('id'),
             telegram_message_id=message_data.get('message_id'),
-            metadata=message_data
-        )
-        
-        # No responder a mensajes que no sean texto
-        if message_type != 'text':
+        ).select_related('ai_response').first()
+        if msg is None or hasattr(msg, 'ai_response') or message_type != 'text':
+            logger.info("Mensaje repetido descartado", extra={'update_id': update_data.get('update_id')})
             return
-        
-        # Obtener contexto
-        available_jobs = list(
-            JobOffer.objects.filter(status='published').values(
-                'title', 'company', 'location'
-            )[:5]
-        )
-        
+        logger.info("Retomando mensaje sin respuesta", extra={'update_id': update_data.get('update_id')})
+    
+    # No responder a mensajes que no sean texto
+    if message_type != 'text':
+        return
+    
+    # Obtener contexto (snapshot en memoria de ofertas publicadas)
+    with stage_timer('job_context', flow='webhook'):
+        snapshot = get_published_jobs_snapshot()
+    
+    with stage_timer('history', flow='webhook'):
         context = {
-            'available_jobs': available_jobs
+            'available_jobs': list(snapshot.jobs),
+            'jobs_prompt_block': snapshot.prompt_block,
+            # Historial en memoria (se hidrata de la BD sin el mensaje actual)
+            'recent_messages': conversation_memory.get_history(telegram_id, exclude_message_id=msg.id),
         }
-        
-        # Generar respuesta con Gemini
-        gemini = GeminiClient()
-        ai_result = gemini.get_response(content, telegram_id, context)
-        
-        # Guardar respuesta de IA
-        ai_response = AIResponse.objects.create(
+    
+    # Generar respuesta con Gemini
+    gemini = get_gemini_client()
+    with stage_timer('gemini_call', flow='webhook'):
+        ai_result = gemini.get_response(content, telegram_id, context, use_cache=True)
+    
+    # Guardar respuesta de IA
+    with stage_timer('response_insert', flow='webhook'):
+        AIResponse.objects.create(
             message=msg,
             response_text=ai_result['response'],
             confidence_score=ai_result['confidence_score'],
             model_used=ai_result['model'],
             status='pending'
         )
-        
-        logger.info(f"Mensaje procesado de {user.username}: {content[:50]}")
+    conversation_memory.append_turn(
+        telegram_id, content, None if ai_result.get('error') else ai_result['response']
+    )
     
-    except Exception as e:
-        logger.error(f"Error procesando actualización: {str(e)}")
+    logger.info(f"Mensaje procesado de {user.username}: {content[:50]}")
 
 
 # ============ VISTAS DEL PANEL WEB ============
@@ -673,7 +734,7 @@ def create_survey_with_ai(request):
         
         try:
             # Generar estructura de encuesta con Gemini
-            gemini = GeminiClient()
+            gemini = get_gemini_client()
             
             generation_prompt = f"""
 Genera una estructura JSON para una encuesta con las siguientes características:
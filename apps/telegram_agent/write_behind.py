@@ -0,0 +1,143 @@
+"""
+Buffer write-behind para TelegramMessage y AIResponse
+El bot encola las filas y se insertan con bulk_create cada N filas o T milisegundos,
+sin que la respuesta al usuario espere por la BD.
+"""
+import os
+import asyncio
+import logging
+from dotenv import load_dotenv
+from django.db import IntegrityError, transaction
+
+from apps.telegram_agent.models import TelegramMessage, AIResponse
+from apps.telegram_agent.db import run_db
+from utils.metrics import stage_timer
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', '50'))
+WRITE_BEHIND_FLUSH_MS = int(os.getenv('WRITE_BEHIND_FLUSH_MS', '500'))
+
+
+def _insert_rows(rows):
+    """Inserta mensajes y sus respuestas con dos bulk_create (sincrónico)"""
+    # Limpiar pks de un intento fallido anterior (el rollback no los revierte en memoria)
+    for message, ai_response in rows:
+        message.pk = None
+        message._state.adding = True
+        if ai_response is not None:
+            ai_response.pk = None
+            ai_response._state.adding = True
+            ai_response.message_id = None
+
+    TelegramMessage.objects.bulk_create([message for message, _ in rows])
+
+    responses = []
+    for message, ai_response in rows:
+        if ai_response is not None:
+            ai_response.message = message
+            responses.append(ai_response)
+    if responses:
+        AIResponse.objects.bulk_create(responses)
+
+
+def write_rows(rows) -> int:
+    """
+    Escribe un lote en una transacción; si falla, reintenta fila por fila
+    para no perder las filas válidas del lote (sincrónico)
+
+    Returns:
+        Número de filas (pares mensaje/respuesta) que no se pudieron guardar
+    """
+    try:
+        with transaction.atomic():
+            _insert_rows(rows)
+        return 0
+    except Exception as e:
+        logger.warning(f"[WriteBehind] Falló el lote de {len(rows)} filas, reintentando una a una: {str(e)}")
+
+    failed = 0
+    for row in rows:
+        try:
+            with transaction.atomic():
+                _insert_rows([row])
+        except IntegrityError as e:
+            # Mensaje ya guardado (update repetido): no es una pérdida
+            logger.info(f"[WriteBehind] Fila duplicada descartada ({row[0].user_id}): {str(e)}")
+        except Exception as e:
+            failed += 1
+            logger.error(f"[WriteBehind] Fila descartada ({row[0].user_id}): {str(e)}")
+    return failed
+
+
+class WriteBehindBuffer:
+    """Cola asíncrona de filas pendientes con flush por tamaño o por tiempo"""
+
+    def __init__(self, batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval_ms: int = WRITE_BEHIND_FLUSH_MS):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.written = 0
+        self.failed = 0
+        self._pending = []
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    def add(self, message: TelegramMessage, ai_response: AIResponse = None):
+        """
+        Encola un mensaje (sin guardar) y opcionalmente su respuesta de IA
+
+        No bloquea: la inserción ocurre en el próximo flush.
+        """
+        self._pending.append((message, ai_response))
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def _run(self):
+        """Loop de flush periódico"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # Nunca dejar morir el loop por un flush fallido
+                logger.error(f"[WriteBehind] Error en flush: {str(e)}", exc_info=True)
+
+    async def flush(self):
+        """Inserta todas las filas pendientes"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            rows, self._pending = self._pending, []
+            with stage_timer('db_write'):
+                failed = await run_db(write_rows, rows)
+            self.written += len(rows) - failed
+            self.failed += failed
+            logger.debug(f"[WriteBehind] Flush de {len(rows)} filas ({failed} fallidas)")
+
+    async def stop(self):
+        """Detiene el loop y hace el flush final (llamar al apagar el bot)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        logger.info(f"[WriteBehind] Detenido: {self.written} filas escritas, {self.failed} fallidas")
+
+
+# Buffer compartido del proceso del bot
+write_behind = WriteBehindBuffer()
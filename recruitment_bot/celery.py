@@ -3,6 +3,7 @@ Configuración de Celery para tareas asincrónicas
 """
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 from celery.schedules import crontab
 from dotenv import load_dotenv
 
@@ -43,6 +44,19 @@ app.conf.update(
 )
 
 
+@worker_process_init.connect
+def start_worker_metrics(**kwargs):
+    """
+    Expone /metrics del worker en CELERY_METRICS_PORT
+    Cada proceso hijo tiene su propio registro y solo el primero obtiene el
+    puerto: para métricas completas usar --concurrency=1 (un worker por puerto).
+    """
+    port = os.getenv('CELERY_METRICS_PORT')
+    if port:
+        from utils.metrics import start_metrics_server
+        start_metrics_server(int(port))
+
+
 @app.task(bind=True)
 def debug_task(self):
     """Tarea de debug"""
@@ -57,6 +57,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Los hilos del bot (apps.telegram_agent.db) reutilizan su conexión hasta esta edad
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -96,6 +99,11 @@ PRIMARY_COLOR = os.getenv('PRIMARY_COLOR', '#3D1A5F')  # Púrpura
 SECONDARY_COLOR = os.getenv('SECONDARY_COLOR', '#7EFFA2')  # Verde
 
 # ========== LOGGING ==========
+# Los handlers escriben desde un thread aparte (QueueListener), ver utils/logger.py
+# logs/ no está en el repo (.gitignore): se crea al arrancar
+(BASE_DIR / 'logs').mkdir(exist_ok=True)
+
+LOGGING_CONFIG = 'utils.logger.configure_logging'
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -108,6 +116,9 @@ LOGGING = {
             'format': '{levelname} {asctime} {message}',
             'style': '{',
         },
+        'kv': {
+            '()': 'utils.logger.KeyValueFormatter',
+        },
     },
     'filters': {
         'require_debug_false': {
@@ -129,7 +140,8 @@ LOGGING = {
             'filename': BASE_DIR / 'logs' / 'recruitment_bot.log',
             'maxBytes': 1024 * 1024 * 10,  # 10 MB
             'backupCount': 5,
-            'formatter': 'verbose'
+            'encoding': 'utf-8',
+            'formatter': 'kv'
         },
     },
     'root': {
@@ -5,7 +5,6 @@ Script para ejecutar el bot de Telegram con mejor manejo de logs en Windows
 import os
 import sys
 import logging
-import asyncio
 from pathlib import Path
 
 # Configurar encoding para Windows
@@ -23,15 +22,10 @@ sys.path.insert(0, str(project_root))
 logs_dir = project_root / 'logs'
 logs_dir.mkdir(exist_ok=True)
 
-# Configurar logging ANTES de importar Django
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler(str(logs_dir / 'bot.log'), encoding='utf-8')
-    ]
-)
+# Los logs los configura Django (settings.LOGGING, escritura en un thread aparte)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'recruitment_bot.settings')
+import django
+django.setup()
 
 logger = logging.getLogger(__name__)
 logger.info("="*70)
@@ -0,0 +1,132 @@
+"""
+Circuit breaker por modelo de Gemini
+Tras GEMINI_BREAKER_FAILURES fallos dentro de GEMINI_BREAKER_WINDOW segundos el
+circuito se abre y las llamadas a ese modelo fallan de inmediato durante
+GEMINI_BREAKER_COOLDOWN segundos (sin esperar timeouts ni reintentos). Luego
+se deja pasar una sola llamada de prueba: si responde, el circuito se cierra.
+"""
+import os
+import time
+import logging
+import threading
+from collections import deque
+from dotenv import load_dotenv
+
+from utils.metrics import registry
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+GEMINI_BREAKER_FAILURES = int(os.getenv('GEMINI_BREAKER_FAILURES', '5'))
+GEMINI_BREAKER_WINDOW = float(os.getenv('GEMINI_BREAKER_WINDOW', '60'))      # segundos
+GEMINI_BREAKER_COOLDOWN = float(os.getenv('GEMINI_BREAKER_COOLDOWN', '30'))  # segundos
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+REJECTED = registry.counter(
+    'recruitment_gemini_breaker_rejected_total',
+    'Llamadas a Gemini descartadas con el circuito abierto',
+    ('model',),
+)
+
+
+class CircuitBreaker:
+    """Circuito de un modelo (thread-safe)"""
+
+    def __init__(self, name: str, failure_threshold: int = GEMINI_BREAKER_FAILURES,
+                 window: float = GEMINI_BREAKER_WINDOW, cooldown: float = GEMINI_BREAKER_COOLDOWN):
+        """
+        Args:
+            name: Nombre del modelo (logs y métricas)
+            failure_threshold: Fallos dentro de la ventana que abren el circuito
+            window: Ventana de conteo de fallos en segundos
+            cooldown: Segundos que el circuito permanece abierto
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self._failures = deque()
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        Indica si se puede llamar al modelo
+
+        Returns:
+            False si el circuito está abierto (o ya hay una llamada de prueba en curso)
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and now - self._opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                self._probing = False
+                logger.info(f"[CircuitBreaker] {self.name}: probando el modelo tras {self.cooldown:.0f}s")
+            # Una prueba que nunca informó su resultado (p. ej. cancelada) no bloquea el circuito
+            if self.state == HALF_OPEN and (not self._probing or now - self._probe_started >= self.cooldown):
+                self._probing = True
+                self._probe_started = now
+                return True
+        REJECTED.inc(model=self.name)
+        return False
+
+    def record_success(self):
+        """Llamada exitosa: cierra el circuito"""
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info(f"[CircuitBreaker] {self.name}: circuito cerrado")
+            self.state = CLOSED
+            self._probing = False
+            self._failures.clear()
+
+    def record_failure(self):
+        """Llamada fallida: abre el circuito si se alcanzó el umbral"""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._open(now, 'falló la llamada de prueba')
+                return
+            self._failures.append(now)
+            while self._failures and now - self._failures[0] > self.window:
+                self._failures.popleft()
+            if self.state == CLOSED and len(self._failures) >= self.failure_threshold:
+                self._open(now, f'{len(self._failures)} fallos en {self.window:.0f}s')
+
+    def _open(self, now: float, reason: str):
+        self.state = OPEN
+        self._opened_at = now
+        self._probing = False
+        self._failures.clear()
+        logger.warning(f"[CircuitBreaker] {self.name}: circuito abierto por {self.cooldown:.0f}s ({reason})")
+
+    def stats(self) -> dict:
+        return {'state': self.state, 'recent_failures': len(self._failures)}
+
+
+_breakers = {}
+_lock = threading.Lock()
+
+
+def get_breaker(model_name: str) -> CircuitBreaker:
+    """Circuito compartido del proceso para un modelo"""
+    breaker = _breakers.get(model_name)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.setdefault(model_name, CircuitBreaker(model_name))
+    return breaker
+
+
+registry.gauge(
+    'recruitment_gemini_breaker_state', 'Estado del circuito por modelo (0 cerrado, 1 prueba, 2 abierto)', ('model',),
+    callback=lambda: {(name,): _STATE_VALUES[breaker.state] for name, breaker in list(_breakers.items())},
+)
@@ -3,6 +3,7 @@ Cliente para Gemini 2 API
 Genera imágenes, videos y carruseles usando Gemini 2
 """
 import os
+import asyncio
 import logging
 from typing import Optional
 import google.generativeai as genai
@@ -10,17 +11,16 @@ from dotenv import load_dotenv
 import glob
 import random
 
+from services.gemini_transport import GeminiTransport, GEMINI_IMAGE_TIMEOUT, GEMINI_IMAGE_RETRY_BUDGET
+from services.gemini_keys import get_key_pool, get_pooled_model
+
 load_dotenv()
 logger = logging.getLogger(__name__)
 
-# Configuración de Gemini 2
-GEMINI_API_KEY_2 = os.getenv('GEMINI_API_KEY_2')
-
-# Configurar Gemini 2
-if GEMINI_API_KEY_2:
-    genai.configure(api_key=GEMINI_API_KEY_2)
-else:
-    logger.warning("[Gemini2] GEMINI_API_KEY_2 no está configurada")
+# Configuración de Gemini 2: las keys de imágenes salen del pool de
+# services.gemini_keys (GEMINI_IMAGE_API_KEYS separadas por coma y/o GEMINI_API_KEY_2)
+if not get_key_pool('image'):
+    logger.warning("[Gemini2] No hay keys de imágenes (GEMINI_IMAGE_API_KEYS / GEMINI_API_KEY_2)")
 
 
 class Gemini2Client:
@@ -28,23 +28,26 @@ class Gemini2Client:
     
     def __init__(self):
         """Inicializa el cliente de Gemini 2"""
-        self.api_key = GEMINI_API_KEY_2
+        self.key_pool = get_key_pool('image')
         self.model_name = 'gemini-2.0-flash-thinking-exp-1219'  # Modelo experimental que genera imágenes
+        self.transport = GeminiTransport(
+            self.model_name, timeout=GEMINI_IMAGE_TIMEOUT, retry_budget=GEMINI_IMAGE_RETRY_BUDGET
+        )
         
-        if self.api_key:
+        if self.key_pool:
             try:
-                self.model = genai.GenerativeModel(self.model_name)
+                self.model = get_pooled_model(self.model_name, 'image')
                 logger.info("[Gemini2] Cliente inicializado correctamente")
             except Exception as e:
                 logger.error(f"[Gemini2] Error inicializando modelo: {str(e)}")
                 self.model = None
         else:
-            logger.error("[Gemini2] GEMINI_API_KEY_2 no configurada")
+            logger.error("[Gemini2] Sin keys de imágenes: configura GEMINI_IMAGE_API_KEYS o GEMINI_API_KEY_2")
             self.model = None
     
     def is_configured(self) -> bool:
         """Verifica si el cliente está configurado correctamente"""
-        return bool(self.api_key and self.model)
+        return bool(self.key_pool and self.model)
     
     def _get_cache_dir(self) -> str:
         """Obtiene el directorio de media con imágenes predefinidas"""
@@ -166,6 +169,71 @@ class Gemini2Client:
         
         logger.info(f"[Gemini2] Generando {content_type} con prompt: {prompt[:100]} - tema: {theme}")
         
+        early_result = self._precheck(prompt, content_type, theme)
+        if early_result:
+            return early_result
+        
+        try:
+            # Crear el prompt para generar imagen
+            enhanced_prompt = self._enhance_prompt(prompt, content_type)
+            
+            logger.info(f"[Gemini2] Enviando prompt mejorado de {len(enhanced_prompt)} caracteres")
+            
+            # Generar imagen con Gemini 2
+            response = self.transport.generate(
+                self.model, enhanced_prompt, operation='image', generation_config=self._generation_config(0.5)
+            )
+            
+            result = self._image_result(response, content_type, enhanced_prompt)
+            if result:
+                return result
+            # Si no generó imagen, intentar con instrucción más explícita
+            logger.warning("[Gemini2] No se generó imagen, intentando método alternativo")
+            return self._fallback_generate(prompt, content_type)
+        
+        except Exception as e:
+            logger.error(f"[Gemini2] Error generando imagen: {str(e)}", exc_info=True)
+            
+            # Si hay error, intentar fallback (incluyendo caché)
+            logger.info("[Gemini2] Error en generación principal, intentando fallback...")
+            return self._fallback_generate(prompt, content_type)
+    
+    async def agenerate_image(self, prompt: str, content_type: str = 'image', theme: str = '') -> dict:
+        """
+        Versión asíncrona de generate_image (generate_content_async, no bloquea el event loop)
+        
+        La lectura y escritura de imágenes en media corre en un thread.
+        
+        Returns:
+            Dict con el mismo formato que generate_image
+        """
+        logger.info(f"[Gemini2] Generando {content_type} (async) - tema: {theme}")
+        
+        early_result = await asyncio.to_thread(self._precheck, prompt, content_type, theme)
+        if early_result:
+            return early_result
+        
+        try:
+            enhanced_prompt = self._enhance_prompt(prompt, content_type)
+            response = await self.transport.agenerate(
+                self.model, enhanced_prompt, operation='image', generation_config=self._generation_config(0.5)
+            )
+            result = await asyncio.to_thread(self._image_result, response, content_type, enhanced_prompt)
+            if result:
+                return result
+            logger.warning("[Gemini2] No se generó imagen, intentando método alternativo")
+        except Exception as e:
+            logger.error(f"[Gemini2] Error generando imagen: {str(e)}", exc_info=True)
+        
+        return await self._afallback_generate(prompt, content_type)
+    
+    def _precheck(self, prompt: str, content_type: str, theme: str) -> Optional[dict]:
+        """
+        Resultado que no necesita llamar a la API (imagen temática o cliente sin configurar)
+        
+        Returns:
+            Dict de resultado, o None si hay que generar la imagen
+        """
         # Si el tema es reclutamiento, usar imagen temática
         if theme.lower() == 'recruitment':
             logger.info("[Gemini2] Usando imagen temática para reclutamiento")
@@ -183,33 +251,29 @@ class Gemini2Client:
                 }
         
         if not self.is_configured():
-            error_msg = "GEMINI_API_KEY_2 no está configurada o modelo no inicializado"
+            error_msg = "No hay keys de imágenes (GEMINI_IMAGE_API_KEYS / GEMINI_API_KEY_2) o modelo no inicializado"
             logger.error(f"[Gemini2] {error_msg}")
             return {
                 'success': False,
                 'error': error_msg,
-                'details': 'Asegúrate de tener GEMINI_API_KEY_2 en el archivo .env'
+                'details': 'Asegúrate de tener GEMINI_IMAGE_API_KEYS o GEMINI_API_KEY_2 en el archivo .env'
             }
+        return None
+    
+    @staticmethod
+    def _generation_config(temperature: float):
+        return genai.types.GenerationConfig(temperature=temperature, max_output_tokens=1024)
+    
+    def _image_result(self, response, content_type: str, prompt_used: str) -> Optional[dict]:
+        """
+        Resultado exitoso si la respuesta trae una imagen (la guarda como fallback)
         
-        try:
-            # Crear el prompt para generar imagen
-            enhanced_prompt = self._enhance_prompt(prompt, content_type)
-            
-            logger.info(f"[Gemini2] Enviando prompt mejorado de {len(enhanced_prompt)} caracteres")
-            
-            # Generar imagen con Gemini 2
-            response = self.model.generate_content(
-                enhanced_prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.5,
-                    max_output_tokens=1024,
-                )
-            )
-            
-            # Verificar si la respuesta contiene imagen
-            if response.parts and response.parts[0].mime_type and 'image' in response.parts[0].mime_type:
-                image_data = response.parts[0].data
-                
+        Returns:
+            Dict de resultado, o None si la respuesta no tiene imagen
+        """
+        for part in response.parts or []:
+            if part.mime_type and 'image' in part.mime_type:
+                image_data = part.data
                 logger.info(f"[Gemini2] Imagen generada exitosamente ({len(image_data)} bytes)")
                 
                 # Guardar en caché para usar como fallback
@@ -220,23 +284,37 @@ class Gemini2Client:
                     'content_type': content_type,
                     'image_data': image_data,
                     'model': self.model_name,
-                    'prompt_used': enhanced_prompt[:100],
+                    'prompt_used': prompt_used[:100],
                     'size_bytes': len(image_data),
                     'from_cache': False
                 }
-            else:
-                # Si no generó imagen, intentar con instrucción más explícita
-                logger.warning("[Gemini2] No se generó imagen, intentando método alternativo")
-                return self._fallback_generate(prompt, content_type)
+        return None
+    
+    def _cached_result(self, prompt: str, content_type: str, message: str, error: str = None) -> dict:
+        """Último recurso: una imagen guardada de un intento anterior"""
+        cached_image = self._load_cached_image(content_type)
         
-        except Exception as e:
-            logger.error(f"[Gemini2] Error generando imagen: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
-            
-            # Si hay error, intentar fallback (incluyendo caché)
-            logger.info("[Gemini2] Error en generación principal, intentando fallback...")
-            return self._fallback_generate(prompt, content_type)
+        if cached_image:
+            logger.info(f"[Gemini2] Usando imagen en caché como último recurso ({len(cached_image)} bytes)")
+            return {
+                'success': True,
+                'content_type': content_type,
+                'image_data': cached_image,
+                'model': self.model_name,
+                'prompt_used': prompt,
+                'size_bytes': len(cached_image),
+                'from_cache': True,
+                'message': message
+            }
+        
+        if error:
+            return {'success': False, 'error': error}
+        logger.error("[Gemini2] No hay imágenes en caché como último recurso")
+        return {
+            'success': False,
+            'error': 'No se pudo generar imagen ni hay imágenes guardadas en caché',
+            'details': 'Intenta más tarde cuando la cuota se reinicie'
+        }
     
     def _enhance_prompt(self, prompt: str, content_type: str) -> str:
         """
@@ -265,6 +343,14 @@ Create the image now."""
         logger.info(f"[Gemini2] Prompt mejorado (primeros 150 chars): {enhanced[:150]}...")
         return enhanced
     
+    @staticmethod
+    def _alternative_prompt(prompt: str) -> str:
+        return f"""Generate a professional image based on this description:
+            
+{prompt}
+
+Return the image in high quality, realistic style."""
+    
     def _fallback_generate(self, prompt: str, content_type: str) -> dict:
         """
         Método alternativo si falla la primera generación
@@ -277,91 +363,50 @@ Create the image now."""
         Returns:
             Dict con resultado
         """
+        logger.info("[Gemini2] Intentando generación alternativa...")
         try:
-            logger.info("[Gemini2] Intentando generación alternativa...")
-            
-            alt_prompt = f"""Generate a professional image based on this description:
-            
-{prompt}
-
-Return the image in high quality, realistic style."""
-            
-            response = self.model.generate_content(
-                [alt_prompt],
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.3,
-                    max_output_tokens=1024,
-                )
+            response = self.transport.generate(
+                self.model, [self._alternative_prompt(prompt)], operation='image',
+                generation_config=self._generation_config(0.3)
             )
-            
-            if response.parts and len(response.parts) > 0:
-                # Buscar la primera parte que sea imagen
-                for part in response.parts:
-                    if part.mime_type and 'image' in part.mime_type:
-                        image_data = part.data
-                        logger.info(f"[Gemini2] Imagen generada con fallback ({len(image_data)} bytes)")
-                        
-                        # Guardar en caché
-                        self._save_image_to_cache(image_data, content_type)
-                        
-                        return {
-                            'success': True,
-                            'content_type': content_type,
-                            'image_data': image_data,
-                            'model': self.model_name,
-                            'prompt_used': alt_prompt[:100],
-                            'size_bytes': len(image_data),
-                            'from_cache': False
-                        }
+        except Exception as e:
+            return self._fallback_result(prompt, content_type, error=e)
+        return self._fallback_result(prompt, content_type, response)
+    
+    async def _afallback_generate(self, prompt: str, content_type: str) -> dict:
+        """Versión asíncrona de _fallback_generate"""
+        logger.info("[Gemini2] Intentando generación alternativa...")
+        try:
+            response = await self.transport.agenerate(
+                self.model, [self._alternative_prompt(prompt)], operation='image',
+                generation_config=self._generation_config(0.3)
+            )
+        except Exception as e:
+            return await asyncio.to_thread(self._fallback_result, prompt, content_type, error=e)
+        return await asyncio.to_thread(self._fallback_result, prompt, content_type, response)
+    
+    def _fallback_result(self, prompt: str, content_type: str, response=None, error: Exception = None) -> dict:
+        """
+        Resultado de la generación alternativa: su imagen o, si no trae
+        (o la llamada falló), una imagen en caché como último recurso
+        """
+        if error is None:
+            result = self._image_result(response, content_type, self._alternative_prompt(prompt))
+            if result:
+                return result
             
             # Si también falló el fallback, usar imagen del caché
             logger.warning("[Gemini2] Fallback de generación también falló, intentando usar imagen en caché...")
-            cached_image = self._load_cached_image(content_type)
-            
-            if cached_image:
-                logger.info(f"[Gemini2] Usando imagen en caché como último recurso ({len(cached_image)} bytes)")
-                return {
-                    'success': True,
-                    'content_type': content_type,
-                    'image_data': cached_image,
-                    'model': self.model_name,
-                    'prompt_used': prompt,
-                    'size_bytes': len(cached_image),
-                    'from_cache': True,
-                    'message': 'Usando imagen guardada de un intento anterior'
-                }
-            
-            logger.error("[Gemini2] No hay imágenes en caché como último recurso")
-            return {
-                'success': False,
-                'error': 'No se pudo generar imagen ni hay imágenes guardadas en caché',
-                'details': 'Intenta más tarde cuando la cuota se reinicie'
-            }
+            return self._cached_result(prompt, content_type, 'Usando imagen guardada de un intento anterior')
         
-        except Exception as e:
-            logger.error(f"[Gemini2] Error en fallback: {str(e)}")
-            
-            # Último intento: usar imagen en caché
-            logger.info("[Gemini2] Intentando cargar imagen en caché por error...")
-            cached_image = self._load_cached_image(content_type)
-            
-            if cached_image:
-                logger.info(f"[Gemini2] Usando imagen en caché por error ({len(cached_image)} bytes)")
-                return {
-                    'success': True,
-                    'content_type': content_type,
-                    'image_data': cached_image,
-                    'model': self.model_name,
-                    'prompt_used': prompt,
-                    'size_bytes': len(cached_image),
-                    'from_cache': True,
-                    'message': f'Error al generar. Usando imagen guardada: {str(e)}'
-                }
-            
-            return {
-                'success': False,
-                'error': f'Error en generación y en caché: {str(e)}'
-            }
+        logger.error(f"[Gemini2] Error en fallback: {str(error)}")
+        
+        # Último intento: usar imagen en caché
+        logger.info("[Gemini2] Intentando cargar imagen en caché por error...")
+        return self._cached_result(
+            prompt, content_type, f'Error al generar. Usando imagen guardada: {str(error)}',
+            error=f'Error en generación y en caché: {str(error)}'
+        )
 
 
 def generate_image(prompt: str, content_type: str = 'image') -> dict:
@@ -394,12 +439,12 @@ if __name__ == '__main__':
     client = Gemini2Client()
     
     if not client.is_configured():
-        print("❌ Error: GEMINI_API_KEY_2 no está configurada")
+        print("❌ Error: no hay keys de imágenes (GEMINI_IMAGE_API_KEYS / GEMINI_API_KEY_2)")
         print("Añade la clave en el archivo .env")
     else:
         print("✅ Cliente Gemini 2 configurado correctamente")
         print(f"📌 Modelo: {client.model_name}")
-        print(f"🔑 API Key: {GEMINI_API_KEY_2[:10]}...")
+        print(f"🔑 API Keys: {len(client.key_pool.keys)}")
         
         # Ejemplo de generación
         print("\n" + "=" * 60)
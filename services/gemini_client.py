@@ -4,29 +4,60 @@ Maneja la generación de respuestas inteligentes para usuarios de Telegram
 """
 import os
 import json
+import time
+import asyncio
 import logging
+from contextlib import nullcontext
 from typing import Optional
-import google.generativeai as genai
 from dotenv import load_dotenv
+from google.api_core import exceptions as google_exceptions
+
+from services.response_cache import response_cache
+from services.gemini_transport import GeminiTransport, is_retryable
+from services.circuit_breaker import get_breaker
+from services.gemini_keys import get_pooled_model
+from services.prompt_builder import prompt_builder
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
-# Configuración de Gemini
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+# Configuración de Gemini (las keys se reparten en services.gemini_keys:
+# GEMINI_API_KEYS separadas por coma y/o GEMINI_API_KEY)
 MODEL_NAME = 'gemini-2.5-flash'  # Usar modelo más nuevo y disponible
 
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+# Modelos que se prueban, en orden, si el principal falla o tiene el circuito abierto
+GEMINI_FALLBACK_MODELS = [
+    name.strip() for name in os.getenv('GEMINI_FALLBACK_MODELS', 'gemini-2.5-flash-lite').split(',')
+    if name.strip()
+]
+# Respuesta cuando ningún modelo está disponible y no hay una respuesta cacheada
+GEMINI_FALLBACK_REPLY = os.getenv(
+    'GEMINI_FALLBACK_REPLY',
+    'En este momento tengo muchas consultas 😅. Mientras tanto puedes ver las ofertas '
+    'publicadas con /ofertas, o escríbeme de nuevo en unos minutos.'
+)
 
 
 class GeminiClient:
     """Cliente para interactuar con Google Gemini API"""
     
-    def __init__(self):
-        self.model = genai.GenerativeModel(MODEL_NAME) if GEMINI_API_KEY else None
-        self.chat_history = {}  # Store chat history by user_id
+    def __init__(self, model_name: str = MODEL_NAME, limiter=None, fallback_models=None):
+        """
+        Args:
+            model_name: Modelo de Gemini a usar
+            limiter: Context manager (sync y async) que limita las llamadas concurrentes.
+                Lo asigna services.gemini_pool; usa get_gemini_client() en vez de
+                instanciar esta clase en cada mensaje.
+            fallback_models: Modelos de respaldo, en orden (los clientes salen del pool)
+        """
+        self.model_name = model_name
         self.system_prompt = self._get_system_prompt()
+        # El prompt del sistema va como system_instruction: no se repite en cada llamada
+        self.model = get_pooled_model(model_name, 'text', system_instruction=self.system_prompt)
+        self.breaker = get_breaker(model_name)
+        self.transport = GeminiTransport(model_name, breaker=self.breaker)
+        self.fallback_models = [name for name in fallback_models or [] if name != model_name]
+        self._limiter = limiter or nullcontext()
     
     def _get_system_prompt(self) -> str:
         """Obtiene el prompt del sistema para el bot de reclutamiento"""
@@ -51,7 +82,8 @@ Instrucciones de estilo:
 Eres un agente diseñado para mejorar la experiencia de los usuarios, fortalecer la marca empleadora y facilitar el proceso de reclutamiento.
 """
     
-    def get_response(self, user_message: str, user_id: str = None, context: dict = None) -> dict:
+    def get_response(self, user_message: str, user_id: str = None, context: dict = None,
+                     use_cache: bool = False) -> dict:
         """
         Obtiene una respuesta de Gemini para un mensaje de usuario
         
@@ -59,81 +91,236 @@ Eres un agente diseñado para mejorar la experiencia de los usuarios, fortalecer
             user_message: Mensaje del usuario
             user_id: ID del usuario para mantener contexto
             context: Contexto adicional (ofertas disponibles, historial, etc.)
+            use_cache: Reutilizar respuestas de preguntas repetidas (services.response_cache)
         
         Returns:
             Dict con respuesta, confianza y metadata
         """
-        logger.info(f"[GeminiClient] Iniciando get_response para usuario {user_id}")
-        logger.info(f"[GeminiClient] Mensaje: {user_message[:100]}")
-        logger.info(f"[GeminiClient] Modelo disponible: {self.model is not None}")
+        logger.debug("[GeminiClient] Iniciando get_response", extra={'user_id': user_id, 'text': user_message[:100]})
         
         if not self.model:
-            logger.error("[GeminiClient] Gemini API no está configurada - GEMINI_API_KEY no encontrado")
-            return {
-                'response': 'Lo siento, el servicio de IA no está disponible en este momento.',
-                'confidence_score': 0.0,
-                'model': 'gemini-2.5-flash',
-                'error': True
-            }
+            return self._unavailable_result()
+        
+        cache_key, cached = self._cache_lookup(user_message, context, use_cache)
+        if cached:
+            return cached
         
         try:
             # Construir contexto de conversación
-            logger.info("[GeminiClient] Construyendo prompt...")
             full_prompt = self._build_prompt(user_message, user_id, context)
-            logger.info(f"[GeminiClient] Prompt preparado ({len(full_prompt)} caracteres)")
-            
-            # Generar respuesta
-            logger.info("[GeminiClient] Llamando a Gemini API...")
-            response = self.model.generate_content(full_prompt)
-            response_text = response.text
+            logger.debug("[GeminiClient] Prompt preparado", extra={'prompt_chars': len(full_prompt)})
             
-            logger.info(f"[GeminiClient] Respuesta recibida ({len(response_text)} caracteres)")
-            
-            # Calcular confianza
-            confidence = self._calculate_confidence(response)
-            logger.info(f"[GeminiClient] Confianza calculada: {confidence}")
-            
-            logger.info(f"[GeminiClient] OK - Respuesta generada exitosamente para usuario {user_id}")
-            
-            return {
-                'response': response_text,
-                'confidence_score': confidence,
-                'model': MODEL_NAME,
-                'error': False
-            }
+            # Generar respuesta con el primer modelo disponible de la cadena
+            last_error = None
+            for client in self._candidates():
+                try:
+                    with self._limiter:
+                        response = client.transport.generate(client.model, full_prompt)
+                    result = client._success_result(response, user_id)
+                except Exception as e:
+                    if not self._record_failure(client, e):
+                        raise
+                    last_error = e
+                    continue
+                client.breaker.record_success()
+                return self._cache_store(cache_key, result) if client is self else result
+            return self._degraded_result(user_message, context, last_error)
         
         except Exception as e:
-            logger.error(f"[GeminiClient] ERROR en Gemini: {str(e)}")
-            import traceback
-            logger.error(f"[GeminiClient] Traceback: {traceback.format_exc()}")
-            
-            return {
-                'response': 'Lo siento, ocurrió un error procesando tu mensaje. Por favor intenta de nuevo.',
-                'confidence_score': 0.0,
-                'model': MODEL_NAME,
-                'error': True,
-                'error_detail': str(e)
-            }
+            return self._error_result(e)
     
-    def _build_prompt(self, user_message: str, user_id: str = None, context: dict = None) -> str:
-        """Construye el prompt completo con contexto"""
-        prompt = self.system_prompt
-        prompt += "\n\n--- CONVERSACIÓN ---\n"
-        
-        # Agregar contexto si está disponible
-        if context:
-            if context.get('recent_messages'):
-                prompt += "\n--- HISTORIAL RECIENTE ---\n"
-                for msg in context['recent_messages'][-5:]:  # Últimas 5 mensajes
-                    prompt += f"Usuario: {msg['content']}\n"
+    async def aget_response(self, user_message: str, user_id: str = None, context: dict = None,
+                            use_cache: bool = False) -> dict:
+        """
+        Versión asíncrona de get_response
+        
+        Usa la API nativa de corutinas de Gemini (generate_content_async), por lo
+        que no bloquea el event loop del bot mientras se espera la respuesta.
+        
+        Args:
+            user_message: Mensaje del usuario
+            user_id: ID del usuario para mantener contexto
+            context: Contexto adicional (ofertas disponibles, historial, etc.)
+            use_cache: Reutilizar respuestas de preguntas repetidas
+        
+        Returns:
+            Dict con respuesta, confianza y metadata (mismo formato que get_response)
+        """
+        logger.debug("[GeminiClient] Iniciando aget_response", extra={'user_id': user_id})
+        
+        if not self.model:
+            return self._unavailable_result()
+        
+        cache_key, cached = self._cache_lookup(user_message, context, use_cache)
+        if cached:
+            return cached
+        
+        try:
+            full_prompt = self._build_prompt(user_message, user_id, context)
+            logger.debug("[GeminiClient] Prompt preparado", extra={'prompt_chars': len(full_prompt)})
             
-            if context.get('available_jobs'):
-                prompt += "\n--- OFERTAS DISPONIBLES ---\n"
-                for job in context['available_jobs'][:3]:  # Top 3 ofertas
-                    prompt += f"• {job['title']} en {job['company']} - {job['location']}\n"
+            last_error = None
+            for client in self._candidates():
+                try:
+                    async with self._limiter:
+                        response = await client.transport.agenerate(client.model, full_prompt)
+                    result = client._success_result(response, user_id)
+                except Exception as e:
+                    if not self._record_failure(client, e):
+                        raise
+                    last_error = e
+                    continue
+                client.breaker.record_success()
+                return self._cache_store(cache_key, result) if client is self else result
+            return self._degraded_result(user_message, context, last_error)
+        
+        except Exception as e:
+            return self._error_result(e)
+    
+    def astream_response(self, user_message: str, user_id: str = None, context: dict = None,
+                         use_cache: bool = False) -> 'ResponseStream':
+        """
+        Obtiene la respuesta de Gemini en streaming
+        
+        Args:
+            user_message: Mensaje del usuario
+            user_id: ID del usuario para mantener contexto
+            context: Contexto adicional (ofertas disponibles, historial, etc.)
+            use_cache: Reutilizar respuestas de preguntas repetidas (se entregan de una vez)
+        
+        Returns:
+            ResponseStream: iterable asíncrono de fragmentos de texto. Al terminar
+            la iteración, stream.result tiene el mismo dict que aget_response.
+        
+        Ejemplo:
+            stream = client.astream_response("¿Qué ofertas hay?")
+            async for fragment in stream:
+                print(fragment, end='')
+            print(stream.result['confidence_score'])
+        """
+        return ResponseStream(self, user_message, user_id, context, use_cache)
+    
+    def _candidates(self):
+        """
+        Clientes de la cadena (este modelo y los de respaldo) que se pueden llamar ahora
+
+        Los modelos con el circuito abierto se saltan sin esperar.
+        """
+        from services.gemini_pool import get_gemini_client
+        for name in [self.model_name, *self.fallback_models]:
+            client = self if name == self.model_name else get_gemini_client(name)
+            if client.model is not None and client.breaker.allow():
+                yield client
+    
+    def _record_failure(self, client: 'GeminiClient', e: Exception) -> bool:
+        """
+        Registra el fallo de un modelo de la cadena
+        
+        Returns:
+            True si el error es transitorio (se prueba el siguiente modelo);
+            False si no lo es (un prompt inválido fallaría en cualquier modelo)
+        """
+        if not is_retryable(e):
+            return False
+        client.breaker.record_failure()
+        logger.warning(
+            f"[GeminiClient] {client.model_name} no disponible ({type(e).__name__}), probando respaldo",
+            extra={'model': client.model_name},
+        )
+        return True
+    
+    def _degraded_result(self, user_message: str, context: dict = None, error: Exception = None) -> dict:
+        """
+        Resultado sin ningún modelo disponible: una respuesta cacheada (aunque haya
+        expirado) de cualquier modelo de la cadena o, si no hay, la respuesta fija
+        """
+        key = response_cache.make_key(user_message, context, self.model_name)
+        if key is not None:
+            for name in [self.model_name, *self.fallback_models]:
+                stale = response_cache.get_stale((name,) + key[1:])
+                if stale:
+                    logger.info("[GeminiClient] Modelos no disponibles, respuesta cacheada", extra={'model': name})
+                    return dict(stale, degraded=True)
+        
+        logger.warning(
+            "[GeminiClient] Modelos no disponibles, respuesta de respaldo",
+            extra={'model': self.model_name, 'error': str(error) if error else 'circuito abierto'},
+        )
+        return {
+            'response': GEMINI_FALLBACK_REPLY,
+            'confidence_score': 0.0,
+            'model': self.model_name,
+            'error': True,
+            'degraded': True,
+            'error_detail': str(error) if error else 'circuito abierto'
+        }
+    
+    def _cache_lookup(self, user_message: str, context: dict, use_cache: bool):
+        """
+        Busca una respuesta cacheada
+        
+        Returns:
+            Tupla (clave o None si no se cachea, resultado cacheado o None)
+        """
+        if not use_cache:
+            return None, None
+        cache_key = response_cache.make_key(user_message, context, self.model_name)
+        if cache_key is None:
+            return None, None
+        cached = response_cache.get(cache_key)
+        if cached:
+            logger.info("[GeminiClient] Respuesta servida desde caché", extra={'model': self.model_name})
+        return cache_key, cached
+    
+    def _cache_store(self, cache_key, result: dict) -> dict:
+        """Guarda el resultado en caché si corresponde y lo devuelve"""
+        if cache_key is not None:
+            response_cache.set(cache_key, result)
+        return result
+    
+    def _unavailable_result(self) -> dict:
+        """Resultado cuando la API de Gemini no está configurada"""
+        logger.error("[GeminiClient] Gemini API no está configurada - no hay GEMINI_API_KEY ni GEMINI_API_KEYS")
+        return {
+            'response': 'Lo siento, el servicio de IA no está disponible en este momento.',
+            'confidence_score': 0.0,
+            'model': self.model_name,
+            'error': True
+        }
+    
+    def _success_result(self, response, user_id: str = None) -> dict:
+        """Construye el resultado a partir de una respuesta exitosa de Gemini"""
+        response_text = response.text
+        
+        # Calcular confianza
+        confidence = self._calculate_confidence(response)
+        logger.info(
+            "[GeminiClient] Respuesta generada",
+            extra={'user_id': user_id, 'chars': len(response_text), 'confidence': confidence},
+        )
         
-        prompt += f"\nUsuario: {user_message}\nAsistente:"
-        return prompt
+        return {
+            'response': response_text,
+            'confidence_score': confidence,
+            'model': self.model_name,
+            'error': False
+        }
+    
+    def _error_result(self, e: Exception) -> dict:
+        """Construye el resultado de error a partir de una excepción"""
+        logger.error(f"[GeminiClient] ERROR en Gemini: {str(e)}", exc_info=True, extra={'model': self.model_name})
+        
+        return {
+            'response': 'Lo siento, ocurrió un error procesando tu mensaje. Por favor intenta de nuevo.',
+            'confidence_score': 0.0,
+            'model': self.model_name,
+            'error': True,
+            'error_detail': str(e)
+        }
+    
+    def _build_prompt(self, user_message: str, user_id: str = None, context: dict = None) -> str:
+        """Construye la parte variable del prompt (historial y ofertas dentro del presupuesto de tokens)"""
+        return prompt_builder.build(user_message, context)
     
     def _calculate_confidence(self, response) -> float:
         """Calcula la puntuación de confianza de la respuesta"""
@@ -152,6 +339,103 @@ Eres un agente diseñado para mejorar la experiencia de los usuarios, fortalecer
             return 0.5
 
 
+class ResponseStream:
+    """Respuesta de Gemini en streaming (ver GeminiClient.astream_response)"""
+    
+    def __init__(self, client: GeminiClient, user_message: str, user_id: str = None,
+                 context: dict = None, use_cache: bool = False):
+        self.client = client
+        self.user_message = user_message
+        self.user_id = user_id
+        self.context = context
+        self.use_cache = use_cache
+        self.result = None
+    
+    async def __aiter__(self):
+        client = self.client
+        logger.debug("[GeminiClient] Iniciando streaming", extra={'user_id': self.user_id})
+        
+        if not client.model:
+            self.result = client._unavailable_result()
+            yield self.result['response']
+            return
+        
+        cache_key, cached = client._cache_lookup(self.user_message, self.context, self.use_cache)
+        if cached:
+            self.result = cached
+            yield cached['response']
+            return
+        
+        try:
+            full_prompt = client._build_prompt(self.user_message, self.user_id, self.context)
+            last_error = None
+            for candidate in client._candidates():
+                started = False
+                queue = asyncio.Queue()
+                reader = asyncio.create_task(self._read(candidate, full_prompt, queue))
+                try:
+                    while True:
+                        kind, value = await queue.get()
+                        if kind == 'error':
+                            raise value
+                        if kind == 'done':
+                            response = value
+                            break
+                        if value.parts:
+                            started = True
+                            yield value.text
+                    result = candidate._success_result(response, self.user_id)
+                except Exception as e:
+                    # Con fragmentos ya enviados no se puede cambiar de modelo
+                    if not client._record_failure(candidate, e) or started:
+                        raise
+                    last_error = e
+                    continue
+                finally:
+                    # El consumidor dejó de leer (o falló): no seguir leyendo el stream
+                    reader.cancel()
+                candidate.breaker.record_success()
+                self.result = client._cache_store(cache_key, result) if candidate is client else result
+                return
+            self.result = client._degraded_result(self.user_message, self.context, last_error)
+            yield self.result['response']
+        except Exception as e:
+            self.result = client._error_result(e)
+    
+    async def _read(self, candidate: GeminiClient, full_prompt: str, queue: asyncio.Queue):
+        """
+        Lee el stream de un modelo y pasa los fragmentos a la cola
+
+        El slot del limiter se ocupa solo mientras Gemini envía (no mientras el
+        consumidor edita el mensaje en Telegram), y la lectura de fragmentos
+        tiene como plazo lo que queda del tiempo total de la llamada: un stream
+        que se detiene no retiene al handler para siempre.
+        """
+        transport = candidate.transport
+        try:
+            async with self.client._limiter:
+                deadline = time.monotonic() + transport.retry_budget
+                response = await transport.agenerate(
+                    candidate.model, full_prompt, operation='stream', stream=True
+                )
+                remaining = max(0.1, deadline - time.monotonic())
+                try:
+                    await asyncio.wait_for(self._pump(response, queue), remaining)
+                except asyncio.TimeoutError:
+                    raise google_exceptions.DeadlineExceeded(
+                        f'El stream de Gemini no terminó en {transport.retry_budget:.1f}s'
+                    ) from None
+        except Exception as e:
+            queue.put_nowait(('error', e))
+        else:
+            queue.put_nowait(('done', response))
+
+    @staticmethod
+    async def _pump(response, queue: asyncio.Queue):
+        async for chunk in response:
+            queue.put_nowait(('chunk', chunk))
+
+
 def get_ai_response(prompt: str, user_id: str = None, context: dict = None) -> dict:
     """
     Función helper para obtener respuesta de IA
@@ -164,5 +448,6 @@ def get_ai_response(prompt: str, user_id: str = None, context: dict = None) -> d
     Returns:
         Dict con la respuesta
     """
-    client = GeminiClient()
+    from services.gemini_pool import get_gemini_client
+    client = get_gemini_client()
     return client.get_response(prompt, user_id, context)
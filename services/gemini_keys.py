@@ -0,0 +1,356 @@
+"""
+Pool de API keys de Gemini
+Cada propósito (texto, imágenes) tiene varias keys; cada llamada usa la menos
+cargada según sus peticiones y tokens del último minuto, y una key que devuelve
+un error de cuota queda en pausa un tiempo. Cada key tiene sus propios clientes
+de la API, así que no se usa la configuración global de genai.configure (que la
+última importación sobrescribía para todo el proceso).
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+import weakref
+from collections import deque
+from dotenv import load_dotenv
+import google.generativeai as genai
+from google.ai import generativelanguage as glm
+from google.api_core import exceptions as google_exceptions
+
+from utils.metrics import registry
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+GEMINI_KEY_RPM = int(os.getenv('GEMINI_KEY_RPM', '60'))            # Peticiones por minuto por key (0 = sin límite)
+GEMINI_KEY_TPM = int(os.getenv('GEMINI_KEY_TPM', '1000000'))       # Tokens por minuto por key (0 = sin límite)
+GEMINI_KEY_BENCH_SECONDS = float(os.getenv('GEMINI_KEY_BENCH_SECONDS', '60'))
+
+QUOTA_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+
+KEY_REQUESTS = registry.counter(
+    'recruitment_gemini_key_requests_total',
+    'Llamadas a Gemini por key (nombre, no el valor de la key)',
+    ('key',),
+)
+KEY_BENCHED = registry.counter(
+    'recruitment_gemini_key_benched_total',
+    'Veces que una key quedó en pausa por un error de cuota',
+    ('key',),
+)
+
+
+def _split_keys(*values) -> list:
+    """Keys de variables separadas por coma, sin vacíos ni repetidas"""
+    keys = []
+    for value in values:
+        for key in (value or '').split(','):
+            key = key.strip()
+            if key and key not in keys:
+                keys.append(key)
+    return keys
+
+
+def estimate_tokens(contents) -> int:
+    """Estimación rápida de tokens (~4 caracteres por token)"""
+    if isinstance(contents, (list, tuple)):
+        return sum(estimate_tokens(part) for part in contents)
+    return len(contents) // 4 + 1 if isinstance(contents, str) else 0
+
+
+class ApiKey:
+    """Una key con su consumo del último minuto y sus clientes de la API"""
+
+    def __init__(self, key: str, name: str):
+        self.key = key
+        self.name = name
+        self.benched_until = 0.0
+        self.in_flight = 0
+        self._requests = deque()     # timestamps
+        self._tokens = deque()       # [timestamp, tokens]
+        self._token_total = 0
+        self._client = None
+        self._models = {}
+        self._async_models = weakref.WeakKeyDictionary()
+
+    def prune(self, now: float):
+        """Descarta el consumo de hace más de un minuto"""
+        while self._requests and now - self._requests[0] > 60:
+            self._requests.popleft()
+        while self._tokens and now - self._tokens[0][0] > 60:
+            self._token_total -= self._tokens.popleft()[1]
+
+    def load(self, rpm: int, tpm: int) -> float:
+        """Fracción usada del límite más cercano (1.0 = agotado)"""
+        loads = [0.0]
+        if rpm:
+            loads.append(len(self._requests) / rpm)
+        if tpm:
+            loads.append(self._token_total / tpm)
+        return max(loads)
+
+    def model(self, model_name: str, system_instruction: str = None) -> genai.GenerativeModel:
+        """
+        GenerativeModel (sincrónico) que llama a la API con esta key
+
+        GenerativeModel solo usa el cliente global de genai.configure si su
+        _client está vacío; aquí se le asigna el de la key. _client y
+        _async_client son atributos privados de google-generativeai 0.7.2
+        (fijada en requirements.txt); services/tests.py falla si desaparecen.
+        """
+        model = self._models.get((model_name, system_instruction))
+        if model is None:
+            if self._client is None:
+                self._client = glm.GenerativeServiceClient(client_options={'api_key': self.key})
+            model = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+            model._client = self._client
+            self._models[(model_name, system_instruction)] = model
+        return model
+
+    def amodel(self, model_name: str, system_instruction: str = None) -> genai.GenerativeModel:
+        """Versión async de model: el cliente gRPC async se crea dentro de su event loop (uno por loop)"""
+        loop = asyncio.get_running_loop()
+        models = self._async_models.get(loop)
+        if models is None:
+            models = self._async_models[loop] = {}
+        model = models.get((model_name, system_instruction))
+        if model is None:
+            if 'client' not in models:
+                models['client'] = glm.GenerativeServiceAsyncClient(client_options={'api_key': self.key})
+            model = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+            model._async_client = models['client']
+            models[(model_name, system_instruction)] = model
+        return model
+
+
+class KeyPool:
+    """Keys de un propósito con selección de la menos cargada (thread-safe)"""
+
+    def __init__(self, purpose: str, keys: list, rpm: int = GEMINI_KEY_RPM, tpm: int = GEMINI_KEY_TPM,
+                 bench_seconds: float = GEMINI_KEY_BENCH_SECONDS):
+        """
+        Args:
+            purpose: Nombre del propósito ('text', 'image'); las keys se nombran text-1, text-2...
+            keys: Valores de las API keys
+            rpm: Peticiones por minuto permitidas a cada key (0 = sin límite)
+            tpm: Tokens por minuto permitidos a cada key (0 = sin límite)
+            bench_seconds: Pausa de una key tras un error de cuota
+        """
+        self.purpose = purpose
+        self.keys = [ApiKey(key, f'{purpose}-{index}') for index, key in enumerate(keys, 1)]
+        self.rpm = rpm
+        self.tpm = tpm
+        self.bench_seconds = bench_seconds
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self.keys)
+
+    def acquire(self, tokens: int = 0):
+        """
+        Elige la key para una llamada y le anota la petición y los tokens estimados
+
+        Prefiere las keys activas con cupo, la de menor carga primero. Si todas
+        están en pausa o sin cupo, usa la que se libera antes (el transporte
+        reintentará si la API vuelve a rechazarla).
+
+        Returns:
+            Tupla (key, registro de uso para release)
+        """
+        now = time.monotonic()
+        with self._lock:
+            for key in self.keys:
+                key.prune(now)
+            active = [key for key in self.keys if key.benched_until <= now]
+            available = [key for key in active if key.load(self.rpm, self.tpm) < 1.0]
+            if available:
+                key = min(available, key=lambda k: (k.load(self.rpm, self.tpm), k.in_flight))
+            elif active:
+                key = min(active, key=lambda k: (k._requests[0] if k._requests else now, k.in_flight))
+            else:
+                key = min(self.keys, key=lambda k: k.benched_until)
+            usage = [now, tokens]
+            key._requests.append(now)
+            key._tokens.append(usage)
+            key._token_total += tokens
+            key.in_flight += 1
+        KEY_REQUESTS.inc(key=key.name)
+        return key, usage
+
+    def release(self, key: ApiKey, usage: list, tokens: int = None):
+        """
+        Fin de la llamada
+
+        Args:
+            usage: Registro devuelto por acquire
+            tokens: Tokens reales (usage_metadata) que reemplazan a la estimación
+        """
+        with self._lock:
+            key.in_flight -= 1
+            # Si el registro ya salió de la ventana de un minuto no se corrige
+            if tokens is not None and time.monotonic() - usage[0] <= 60:
+                key._token_total += tokens - usage[1]
+                usage[1] = tokens
+
+    def bench(self, key: ApiKey, error: Exception = None):
+        """Pone la key en pausa tras un error de cuota"""
+        with self._lock:
+            key.benched_until = time.monotonic() + self.bench_seconds
+        KEY_BENCHED.inc(key=key.name)
+        logger.warning(
+            f"[GeminiKeys] {key.name} en pausa {self.bench_seconds:.0f}s por cuota: {str(error)[:120]}"
+        )
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            for key in self.keys:
+                key.prune(now)
+            return {
+                key.name: {
+                    'rpm': len(key._requests),
+                    'tpm': key._token_total,
+                    'in_flight': key.in_flight,
+                    'benched': key.benched_until > now,
+                }
+                for key in self.keys
+            }
+
+
+def _usage_tokens(response):
+    """Tokens reales de la respuesta (None si no vienen)"""
+    usage = getattr(response, 'usage_metadata', None)
+    return getattr(usage, 'total_token_count', None) or None
+
+
+class PooledModel:
+    """
+    Modelo de Gemini que reparte las llamadas entre las keys de un pool
+
+    Misma interfaz que genai.GenerativeModel (generate_content y
+    generate_content_async), así que los clientes y el transporte no cambian.
+    """
+
+    def __init__(self, model_name: str, pool: KeyPool, system_instruction: str = None):
+        """
+        Args:
+            model_name: Modelo de Gemini
+            pool: Keys entre las que se reparten las llamadas
+            system_instruction: Prompt del sistema (se envía aparte del contenido de cada llamada)
+        """
+        self.model_name = model_name
+        self.pool = pool
+        self.system_instruction = system_instruction
+        self._system_tokens = estimate_tokens(system_instruction or '')
+
+    def generate_content(self, contents, **kwargs):
+        key, usage = self.pool.acquire(self._system_tokens + estimate_tokens(contents))
+        tokens = None
+        try:
+            response = key.model(self.model_name, self.system_instruction).generate_content(contents, **kwargs)
+            tokens = _usage_tokens(response)
+            return response
+        except QUOTA_ERRORS as e:
+            self.pool.bench(key, e)
+            raise
+        finally:
+            self.pool.release(key, usage, tokens)
+
+    async def generate_content_async(self, contents, **kwargs):
+        key, usage = self.pool.acquire(self._system_tokens + estimate_tokens(contents))
+        tokens = None
+        stream = None
+        try:
+            response = await key.amodel(self.model_name, self.system_instruction).generate_content_async(contents, **kwargs)
+            if kwargs.get('stream'):
+                # La llamada sigue en curso mientras se leen los fragmentos
+                stream = PooledStream(response, self.pool, key, usage)
+                return stream
+            tokens = _usage_tokens(response)
+            return response
+        except QUOTA_ERRORS as e:
+            self.pool.bench(key, e)
+            raise
+        finally:
+            if stream is None:
+                self.pool.release(key, usage, tokens)
+
+
+class PooledStream:
+    """
+    Respuesta en streaming de un PooledModel
+
+    La key se libera al terminar de leer los fragmentos (o al descartar el
+    stream), con los tokens del usage_metadata del último fragmento. El
+    resto de atributos (text, candidates...) son los de la respuesta.
+    """
+
+    def __init__(self, response, pool: KeyPool, key: ApiKey, usage: list):
+        self._response = response
+        self._pool = pool
+        self._key = key
+        self._usage = usage
+        self._released = False
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._response, name)
+
+    async def __aiter__(self):
+        chunk = None
+        try:
+            async for chunk in self._response:
+                yield chunk
+        except QUOTA_ERRORS as e:
+            self._pool.bench(self._key, e)
+            raise
+        finally:
+            self._release(_usage_tokens(chunk) if chunk is not None else None)
+
+    def _release(self, tokens: int = None):
+        if not self._released:
+            self._released = True
+            self._pool.release(self._key, self._usage, tokens)
+
+    def __del__(self):
+        # Stream que nunca se leyó hasta el final
+        if '_released' in self.__dict__:
+            self._release()
+
+
+_pools = {
+    'text': KeyPool('text', _split_keys(os.getenv('GEMINI_API_KEYS'), os.getenv('GEMINI_API_KEY'))),
+    'image': KeyPool('image', _split_keys(os.getenv('GEMINI_IMAGE_API_KEYS'), os.getenv('GEMINI_API_KEY_2'))),
+}
+
+
+def get_key_pool(purpose: str) -> KeyPool:
+    """Pool de keys de un propósito ('text' o 'image')"""
+    return _pools[purpose]
+
+
+def get_pooled_model(model_name: str, purpose: str = 'text', system_instruction: str = None):
+    """
+    Modelo que usa el pool de keys del propósito
+
+    Returns:
+        PooledModel, o None si no hay keys configuradas para ese propósito
+    """
+    pool = get_key_pool(purpose)
+    return PooledModel(model_name, pool, system_instruction) if pool else None
+
+
+registry.gauge(
+    'recruitment_gemini_key_rpm', 'Peticiones del último minuto por key', ('key',),
+    callback=lambda: {
+        (name,): stats['rpm'] for pool in _pools.values() for name, stats in pool.stats().items()
+    },
+)
+registry.gauge(
+    'recruitment_gemini_key_benched', 'Keys en pausa por cuota (1 = en pausa)', ('key',),
+    callback=lambda: {
+        (name,): int(stats['benched']) for pool in _pools.values() for name, stats in pool.stats().items()
+    },
+)
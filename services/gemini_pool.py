@@ -0,0 +1,117 @@
+"""
+Pool de clientes de Gemini compartido por todo el proceso
+Evita reconstruir GenerativeModel y el prompt del sistema en cada mensaje
+y limita el número de llamadas concurrentes a la API
+"""
+import os
+import asyncio
+import logging
+import threading
+import weakref
+from dotenv import load_dotenv
+
+from services.gemini_client import GeminiClient, MODEL_NAME, GEMINI_FALLBACK_MODELS
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Máximo de llamadas simultáneas a Gemini por proceso
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', '16'))
+
+
+class ConcurrencyLimiter:
+    """
+    Limita las llamadas concurrentes a Gemini
+
+    Funciona como context manager síncrono (threads de Django/Celery) y
+    asíncrono (bot). Los semáforos asyncio se crean uno por event loop,
+    porque no se pueden compartir entre loops.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._thread_semaphore = threading.BoundedSemaphore(limit)
+        self._loop_semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _async_semaphore(self) -> asyncio.Semaphore:
+        """Obtiene el semáforo del event loop actual"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._loop_semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.limit)
+                self._loop_semaphores[loop] = semaphore
+        return semaphore
+
+    def __enter__(self):
+        self._thread_semaphore.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._thread_semaphore.release()
+        return False
+
+    async def __aenter__(self):
+        await self._async_semaphore().acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self._async_semaphore().release()
+        return False
+
+
+class GeminiPool:
+    """Registro thread-safe de clientes de Gemini (uno por modelo)"""
+
+    def __init__(self, max_concurrency: int = GEMINI_MAX_CONCURRENCY):
+        self.limiter = ConcurrencyLimiter(max_concurrency)
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get_client(self, model_name: str = MODEL_NAME) -> GeminiClient:
+        """
+        Obtiene el cliente compartido para un modelo
+
+        Args:
+            model_name: Nombre del modelo de Gemini
+
+        Returns:
+            GeminiClient reutilizable entre threads y corutinas
+        """
+        client = self._clients.get(model_name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(model_name)
+                if client is None:
+                    client = GeminiClient(
+                        model_name=model_name, limiter=self.limiter, fallback_models=GEMINI_FALLBACK_MODELS
+                    )
+                    self._clients[model_name] = client
+                    logger.info(f"[GeminiPool] Cliente creado para modelo {model_name}")
+        return client
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_gemini_pool() -> GeminiPool:
+    """Obtiene el pool de Gemini del proceso (se crea la primera vez)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = GeminiPool()
+    return _pool
+
+
+def get_gemini_client(model_name: str = MODEL_NAME) -> GeminiClient:
+    """
+    Función helper para obtener el cliente compartido de un modelo
+
+    Ejemplo:
+        from services.gemini_pool import get_gemini_client
+        result = get_gemini_client().get_response("¿Cómo aplico?")
+    """
+    return get_gemini_pool().get_client(model_name)
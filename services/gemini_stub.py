@@ -0,0 +1,100 @@
+"""
+Modelo simulado de Gemini para benchmarks y pruebas de carga
+Imita la interfaz de genai.GenerativeModel sin llamar a la API real
+"""
+import time
+import random
+import asyncio
+from google.api_core import exceptions as google_exceptions
+
+
+class StubImagePart:
+    """Parte de imagen (como las que devuelve el modelo de Gemini2Client)"""
+
+    def __init__(self, data: bytes, mime_type: str = 'image/png'):
+        self.data = data
+        self.mime_type = mime_type
+
+
+class StubResponse:
+    """Respuesta mínima compatible con GenerateContentResponse"""
+
+    def __init__(self, text: str, image: bytes = None):
+        self.text = text
+        self.prompt_feedback = None
+        self.parts = [StubImagePart(image)] if image else []
+
+
+class StubChunk(StubResponse):
+    """Fragmento de una respuesta en streaming"""
+
+    def __init__(self, text: str):
+        super().__init__(text)
+        self.parts = [text] if text else []
+
+
+class StubStreamResponse:
+    """Respuesta en streaming: entrega el texto por fragmentos repartiendo la latencia"""
+
+    def __init__(self, text: str, latency: float, chunks: int = 5):
+        self.text = text
+        self.prompt_feedback = None
+        self._latency = latency
+        size = max(1, len(text) // chunks)
+        self._fragments = [text[i:i + size] for i in range(0, len(text), size)]
+
+    async def __aiter__(self):
+        delay = self._latency / max(1, len(self._fragments))
+        for fragment in self._fragments:
+            await asyncio.sleep(delay)
+            yield StubChunk(fragment)
+
+
+class StubGenerativeModel:
+    """Modelo falso con latencia y tasa de errores configurables"""
+
+    def __init__(self, latency: float = 0.5, reply: str = None, error_rate: float = 0.0,
+                 jitter: float = 0.0, image: bytes = None):
+        """
+        Args:
+            latency: Segundos que tarda cada llamada en "responder"
+            reply: Texto fijo de respuesta (por defecto uno genérico)
+            error_rate: Fracción de llamadas que fallan con un error de la API (0 a 1)
+            jitter: Variación aleatoria de la latencia (fracción, p. ej. 0.2 = ±20%)
+            image: Bytes de imagen a devolver (para simular el modelo de Gemini2Client)
+        """
+        self.latency = latency
+        self.reply = reply or 'Respuesta simulada del modelo. ' * 4
+        self.error_rate = error_rate
+        self.jitter = jitter
+        self.image = image
+        self.calls = 0
+        self.errors = 0
+
+    def _delay(self) -> float:
+        if not self.jitter:
+            return self.latency
+        return max(0.0, self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def _maybe_fail(self):
+        """Simula un error transitorio de la API según error_rate"""
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            raise google_exceptions.ServiceUnavailable('Error simulado del modelo stub')
+
+    def generate_content(self, prompt, **kwargs):
+        """Llamada bloqueante (como generate_content del SDK)"""
+        self.calls += 1
+        time.sleep(self._delay())
+        self._maybe_fail()
+        return StubResponse(self.reply, self.image)
+
+    async def generate_content_async(self, prompt, stream: bool = False, **kwargs):
+        """Llamada asíncrona (como generate_content_async del SDK)"""
+        self.calls += 1
+        if stream:
+            self._maybe_fail()
+            return StubStreamResponse(self.reply, self._delay())
+        await asyncio.sleep(self._delay())
+        self._maybe_fail()
+        return StubResponse(self.reply, self.image)
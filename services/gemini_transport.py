@@ -0,0 +1,212 @@
+"""
+Transporte de las llamadas a Gemini: plazo por intento, reintentos con backoff
+exponencial y jitter ("full jitter") ante errores transitorios (429, 5xx,
+timeouts) y un tope de tiempo total por llamada, para que un upstream lento
+no retenga un worker indefinidamente. Cada intento fallido que se reintenta
+cuenta para el circuit breaker del modelo, y si el circuito se abre se deja
+de reintentar (el cliente pasa al modelo de respaldo). Los intentos,
+reintentos y latencias se exportan en /metrics.
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+from dotenv import load_dotenv
+from google.api_core import exceptions as google_exceptions
+
+from services.circuit_breaker import OPEN
+from utils.metrics import registry
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+GEMINI_TIMEOUT = float(os.getenv('GEMINI_TIMEOUT', '30'))                # Plazo de cada intento (s)
+GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '3'))           # Reintentos tras el primer intento
+GEMINI_BACKOFF_BASE = float(os.getenv('GEMINI_BACKOFF_BASE', '0.5'))     # Espera base del backoff (s)
+GEMINI_BACKOFF_MAX = float(os.getenv('GEMINI_BACKOFF_MAX', '8'))         # Espera máxima entre intentos (s)
+GEMINI_RETRY_BUDGET = float(os.getenv('GEMINI_RETRY_BUDGET', '45'))      # Tiempo total de la llamada (s)
+# La generación de imágenes tarda más: plazos propios
+GEMINI_IMAGE_TIMEOUT = float(os.getenv('GEMINI_IMAGE_TIMEOUT', '60'))
+GEMINI_IMAGE_RETRY_BUDGET = float(os.getenv('GEMINI_IMAGE_RETRY_BUDGET', '90'))
+
+# Errores transitorios: se reintentan. El resto (400, 403, bloqueos...) falla de inmediato
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+    ConnectionError,
+)
+
+CALL_SECONDS = registry.histogram(
+    'recruitment_gemini_call_seconds',
+    'Duración total de las llamadas a Gemini, reintentos incluidos',
+    ('model', 'operation'),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0, 120.0),
+)
+CALLS = registry.counter(
+    'recruitment_gemini_calls_total',
+    'Llamadas a Gemini por resultado final (ok, error, timeout)',
+    ('model', 'operation', 'outcome'),
+)
+RETRIES = registry.counter(
+    'recruitment_gemini_retries_total',
+    'Reintentos de llamadas a Gemini por tipo de error',
+    ('model', 'operation', 'reason'),
+)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Indica si el error es transitorio (vale la pena reintentar)"""
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+class GeminiTransport:
+    """Ejecuta las llamadas a un modelo de Gemini con plazo y reintentos"""
+
+    def __init__(self, model_name: str, timeout: float = GEMINI_TIMEOUT,
+                 max_retries: int = GEMINI_MAX_RETRIES, backoff_base: float = GEMINI_BACKOFF_BASE,
+                 backoff_max: float = GEMINI_BACKOFF_MAX, retry_budget: float = GEMINI_RETRY_BUDGET,
+                 breaker=None):
+        """
+        Args:
+            model_name: Modelo (label de las métricas)
+            timeout: Plazo de cada intento en segundos
+            max_retries: Reintentos máximos tras el primer intento
+            backoff_base: Espera base; el intento n espera entre 0 y base * 2^n
+            backoff_max: Tope de la espera entre intentos
+            retry_budget: Tiempo total máximo de la llamada, reintentos incluidos
+            breaker: CircuitBreaker del modelo; registra los intentos que se
+                reintentan (el fallo final lo registra quien llama)
+        """
+        self.model_name = model_name
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_budget = retry_budget
+        self.breaker = breaker
+
+    def _backoff(self, attempt: int) -> float:
+        """Espera antes del reintento `attempt` (full jitter)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _next_delay(self, error: Exception, attempt: int, deadline: float, operation: str):
+        """
+        Decide si se reintenta tras un error
+
+        Returns:
+            Segundos a esperar, o None si hay que propagar el error
+        """
+        if not is_retryable(error) or attempt >= self.max_retries:
+            return None
+        delay = self._backoff(attempt)
+        if time.monotonic() + delay >= deadline:
+            return None
+        reason = type(error).__name__
+        if self.breaker is not None:
+            self.breaker.record_failure()
+            if self.breaker.state == OPEN:
+                logger.warning(
+                    f"[GeminiTransport] {reason} en {operation}, circuito abierto: sin más reintentos",
+                    extra={'model': self.model_name},
+                )
+                return None
+        RETRIES.inc(model=self.model_name, operation=operation, reason=reason)
+        logger.warning(
+            f"[GeminiTransport] {reason} en {operation}, reintento {attempt + 1}/{self.max_retries} "
+            f"en {delay:.2f}s",
+            extra={'model': self.model_name},
+        )
+        return delay
+
+    def _attempt_timeout(self, deadline: float) -> float:
+        """Plazo del intento, recortado al tiempo que queda de la llamada"""
+        return max(0.1, min(self.timeout, deadline - time.monotonic()))
+
+    def _finish(self, operation: str, start: float, error: Exception = None):
+        """Registra la duración y el resultado final de la llamada"""
+        if error is None:
+            outcome = 'ok'
+        elif isinstance(error, (google_exceptions.DeadlineExceeded, google_exceptions.GatewayTimeout)):
+            outcome = 'timeout'
+        else:
+            outcome = 'error'
+        CALL_SECONDS.observe(time.perf_counter() - start, model=self.model_name, operation=operation)
+        CALLS.inc(model=self.model_name, operation=operation, outcome=outcome)
+
+    def generate(self, model, contents, operation: str = 'generate', **kwargs):
+        """
+        Llama a model.generate_content con plazo y reintentos (bloqueante)
+
+        Args:
+            model: GenerativeModel (o el stub de las pruebas)
+            contents: Prompt o lista de partes
+            operation: Nombre de la operación (label de las métricas)
+            **kwargs: Argumentos de generate_content (generation_config, ...)
+
+        Returns:
+            La respuesta de Gemini
+
+        Raises:
+            El último error si no es transitorio o se agotaron los reintentos
+        """
+        start = time.perf_counter()
+        deadline = time.monotonic() + self.retry_budget
+        attempt = 0
+        while True:
+            try:
+                response = model.generate_content(
+                    contents, request_options={'timeout': self._attempt_timeout(deadline)}, **kwargs
+                )
+            except Exception as e:
+                delay = self._next_delay(e, attempt, deadline, operation)
+                if delay is None:
+                    self._finish(operation, start, e)
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self._finish(operation, start)
+            return response
+
+    async def agenerate(self, model, contents, operation: str = 'generate', **kwargs):
+        """
+        Versión asíncrona de generate (model.generate_content_async)
+
+        Con stream=True solo se reintenta la apertura del stream: una vez que
+        llegan fragmentos, un error se propaga al consumidor.
+        """
+        start = time.perf_counter()
+        deadline = time.monotonic() + self.retry_budget
+        attempt = 0
+        while True:
+            timeout = self._attempt_timeout(deadline)
+            try:
+                response = await asyncio.wait_for(
+                    model.generate_content_async(contents, request_options={'timeout': timeout}, **kwargs),
+                    timeout,
+                )
+            except asyncio.TimeoutError:
+                error = google_exceptions.DeadlineExceeded(f'Gemini no respondió en {timeout:.1f}s')
+                delay = self._next_delay(error, attempt, deadline, operation)
+                if delay is None:
+                    self._finish(operation, start, error)
+                    raise error
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except Exception as e:
+                delay = self._next_delay(e, attempt, deadline, operation)
+                if delay is None:
+                    self._finish(operation, start, e)
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self._finish(operation, start)
+            return response
@@ -0,0 +1,134 @@
+"""
+Armado del prompt de Gemini con presupuesto de tokens
+El prompt del sistema no va aquí: es fijo y se envía como system_instruction
+del modelo (services.gemini_keys), así que cada llamada solo lleva la parte
+variable. Esa parte se recorta a PROMPT_TOKEN_BUDGET tokens: el mensaje del
+usuario siempre entra, las ofertas ocupan como máximo PROMPT_JOBS_SHARE del
+presupuesto y el historial usa el resto, empezando por lo más reciente.
+"""
+import os
+import logging
+from dotenv import load_dotenv
+
+from services.gemini_keys import estimate_tokens
+from utils.metrics import registry
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '1500'))
+PROMPT_JOBS_SHARE = float(os.getenv('PROMPT_JOBS_SHARE', '0.4'))
+PROMPT_HISTORY_MESSAGES = int(os.getenv('PROMPT_HISTORY_MESSAGES', '10'))  # Últimos 5 intercambios
+
+CONVERSATION_HEADER = "\n\n--- CONVERSACIÓN ---\n"
+HISTORY_HEADER = "\n--- HISTORIAL RECIENTE ---\n"
+JOBS_HEADER = "\n--- OFERTAS DISPONIBLES ---\n"
+
+PROMPT_TOKENS = registry.histogram(
+    'recruitment_gemini_prompt_tokens',
+    'Tokens estimados de la parte variable del prompt',
+    ('section',),
+    buckets=(25, 50, 100, 250, 500, 750, 1000, 1500, 2000, 3000, 5000),
+)
+TRIMMED = registry.counter(
+    'recruitment_gemini_prompt_trimmed_total',
+    'Líneas de historial u ofertas que no entraron en el presupuesto del prompt',
+    ('section',),
+)
+
+
+def _fit_lines(lines: list, budget: int, newest_first: bool = False) -> list:
+    """
+    Líneas que entran en el presupuesto
+
+    Args:
+        lines: Líneas en el orden en que van en el prompt
+        budget: Tokens disponibles
+        newest_first: Llenar desde el final (historial: se descartan las más antiguas)
+
+    Returns:
+        Las líneas elegidas, en el orden original
+    """
+    chosen = []
+    used = 0
+    for line in (reversed(lines) if newest_first else lines):
+        tokens = estimate_tokens(line)
+        if used + tokens > budget:
+            break
+        chosen.append(line)
+        used += tokens
+    return chosen[::-1] if newest_first else chosen
+
+
+class PromptBuilder:
+    """Arma la parte variable del prompt dentro de un presupuesto de tokens"""
+
+    def __init__(self, budget: int = PROMPT_TOKEN_BUDGET, jobs_share: float = PROMPT_JOBS_SHARE,
+                 history_messages: int = PROMPT_HISTORY_MESSAGES):
+        """
+        Args:
+            budget: Tokens para historial, ofertas y mensaje del usuario
+            jobs_share: Fracción máxima del presupuesto para las ofertas
+            history_messages: Mensajes de historial considerados como máximo
+        """
+        self.budget = budget
+        self.jobs_share = jobs_share
+        self.history_messages = history_messages
+
+    def build(self, user_message: str, context: dict = None) -> str:
+        """
+        Construye el prompt de un mensaje
+
+        Args:
+            user_message: Mensaje del usuario (nunca se recorta)
+            context: recent_messages, jobs_prompt_block o available_jobs
+
+        Returns:
+            Prompt sin el prompt del sistema
+        """
+        context = context or {}
+        message_part = f"\nUsuario: {user_message}\nAsistente:"
+        remaining = max(0, self.budget - estimate_tokens(message_part))
+
+        job_lines = self._job_lines(context)
+        jobs = _fit_lines(job_lines, int(remaining * self.jobs_share))
+        jobs_part = JOBS_HEADER + ''.join(jobs) if jobs else ''
+        remaining -= estimate_tokens(jobs_part)
+
+        history_lines = self._history_lines(context)
+        history = _fit_lines(history_lines, remaining, newest_first=True)
+        history_part = HISTORY_HEADER + ''.join(history) if history else ''
+
+        if len(jobs) < len(job_lines):
+            TRIMMED.inc(len(job_lines) - len(jobs), section='jobs')
+        if len(history) < len(history_lines):
+            TRIMMED.inc(len(history_lines) - len(history), section='history')
+        PROMPT_TOKENS.observe(estimate_tokens(history_part), section='history')
+        PROMPT_TOKENS.observe(estimate_tokens(jobs_part), section='jobs')
+
+        prompt = CONVERSATION_HEADER + history_part + jobs_part + message_part
+        PROMPT_TOKENS.observe(estimate_tokens(prompt), section='total')
+        return prompt
+
+    def _history_lines(self, context: dict) -> list:
+        lines = []
+        for msg in (context.get('recent_messages') or [])[-self.history_messages:]:
+            speaker = 'Asistente' if msg.get('role') == 'assistant' else 'Usuario'
+            lines.append(f"{speaker}: {msg['content']}\n")
+        return lines
+
+    def _job_lines(self, context: dict) -> list:
+        if context.get('jobs_prompt_block'):
+            # Bloque ya renderizado por apps.jobs.snapshot: una oferta por línea tras el encabezado
+            block = context['jobs_prompt_block']
+            if block.startswith(JOBS_HEADER):
+                block = block[len(JOBS_HEADER):]
+            return block.splitlines(keepends=True)
+        return [
+            f"• {job['title']} en {job['company']} - {job['location']}\n"
+            for job in (context.get('available_jobs') or [])[:3]  # Top 3 ofertas
+        ]
+
+
+# Armador compartido del proceso
+prompt_builder = PromptBuilder()
@@ -0,0 +1,126 @@
+"""
+Caché de respuestas de Gemini para preguntas repetidas
+La clave es el mensaje normalizado (minúsculas, sin tildes ni signos) más una
+huella del bloque de ofertas del prompt, así una respuesta deja de servirse en
+cuanto cambian las ofertas publicadas. Los mensajes personales o que dependen
+de la conversación anterior no se cachean.
+"""
+import os
+import re
+import hashlib
+import logging
+import unicodedata
+from typing import Optional
+from dotenv import load_dotenv
+
+from utils.cache import TTLCache
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '1000'))
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', '3600'))        # segundos
+RESPONSE_CACHE_MAX_WORDS = int(os.getenv('RESPONSE_CACHE_MAX_WORDS', '12'))
+
+# Primera persona, datos de contacto o números: la respuesta es para ese usuario
+_PERSONAL_WORDS = {
+    'yo', 'mi', 'mis', 'me', 'conmigo', 'mio', 'mia', 'tengo', 'soy', 'estoy',
+    'trabaje', 'estudie', 'vivo', 'busco', 'quiero', 'llamo', 'edad', 'anos',
+}
+# Preguntas de seguimiento que solo tienen sentido con el historial
+_FOLLOW_UP_WORDS = {
+    'y', 'eso', 'esa', 'ese', 'esos', 'esas', 'esto', 'tambien', 'entonces',
+    'anterior', 'otra', 'otro', 'mas', 'cual', 'primera', 'segunda', 'ultima',
+}
+_FOLLOW_UP_FIRST_WORDS = {'y', 'entonces', 'pero', 'tambien'}
+_PERSONAL_PATTERN = re.compile(r'\d|@|https?://')
+_NON_WORD = re.compile(r'[^\w\s]')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_message(text: str) -> str:
+    """Normaliza un mensaje para comparar preguntas equivalentes"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = _NON_WORD.sub(' ', text)
+    return _SPACES.sub(' ', text).strip()
+
+
+def is_personalized(text: str, normalized: str = None) -> bool:
+    """True si la respuesta depende del usuario o de la conversación anterior"""
+    if _PERSONAL_PATTERN.search(text):
+        return True
+    words = (normalized if normalized is not None else normalize_message(text)).split()
+    if not words or len(words) > RESPONSE_CACHE_MAX_WORDS:
+        return True
+    if words[0] in _FOLLOW_UP_FIRST_WORDS:
+        return True
+    if len(words) <= 3 and _FOLLOW_UP_WORDS.intersection(words):
+        return True
+    return bool(_PERSONAL_WORDS.intersection(words))
+
+
+def jobs_fingerprint(context: dict = None) -> str:
+    """Huella del bloque de ofertas que se envía en el prompt"""
+    if not context:
+        return ''
+    block = context.get('jobs_prompt_block')
+    if block is None:
+        block = repr([
+            (job['title'], job['company'], job['location'])
+            for job in context.get('available_jobs') or []
+        ])
+    return hashlib.sha1(block.encode('utf-8')).hexdigest()[:16]
+
+
+class ResponseCache:
+    """Caché LRU + TTL de resultados de GeminiClient"""
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE, ttl: int = RESPONSE_CACHE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.bypassed = 0
+
+    def make_key(self, user_message: str, context: dict = None, model_name: str = '') -> Optional[tuple]:
+        """
+        Calcula la clave de un mensaje
+
+        Returns:
+            Tupla (modelo, huella de ofertas, mensaje normalizado) o None si el
+            mensaje no se debe cachear
+        """
+        normalized = normalize_message(user_message or '')
+        if is_personalized(user_message or '', normalized):
+            self.bypassed += 1
+            return None
+        return (model_name, jobs_fingerprint(context), normalized)
+
+    def get(self, key: tuple) -> Optional[dict]:
+        result = self._cache.get(key)
+        if result is None:
+            return None
+        return dict(result, cached=True)
+
+    def get_stale(self, key: tuple) -> Optional[dict]:
+        """Resultado guardado aunque haya expirado (respaldo si Gemini no responde)"""
+        result = self._cache.peek(key)
+        if result is None:
+            return None
+        return dict(result, cached=True)
+
+    def set(self, key: tuple, result: dict):
+        """Guarda un resultado exitoso (los errores nunca se cachean)"""
+        if result.get('error'):
+            return
+        self._cache.set(key, dict(result))
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        stats = self._cache.stats()
+        stats['bypassed'] = self.bypassed
+        return stats
+
+
+# Caché compartida del proceso
+response_cache = ResponseCache()
@@ -1,9 +1,13 @@
 import os
+import base64
+import asyncio
 import logging
-from telegram import Bot
-from telegram.error import TelegramError
 from dotenv import load_dotenv
 
+from services.telegram_rate import (
+    send_api_request, asend_api_request, async_http_client, PRIORITY_BULK, BROADCAST_CONCURRENCY,
+)
+
 load_dotenv()
 logger = logging.getLogger(__name__)
 
@@ -17,8 +21,6 @@ def publish_job_offer(job):
         return False
     
     try:
-        bot = Bot(token=TOKEN)
-        
         message = (
             f"💼 <b>{job.title}</b>\n"
             f"🏢 {job.company}\n"
@@ -28,95 +30,91 @@ def publish_job_offer(job):
             f"👉 <a href='{job.apply_link}'>APLICAR AQUÍ</a>"
         )
         
-        bot.send_message(chat_id=CHANNEL_ID, text=message, parse_mode='HTML')
+        response = send_api_request(
+            'sendMessage',
+            {'chat_id': CHANNEL_ID, 'text': message, 'parse_mode': 'HTML'},
+            token=TOKEN,
+        )
+        if response.status_code != 200:
+            logger.error(f"Error publishing offer: {response.status_code} {response.text[:200]}")
+            return False
         logger.info(f"Offer published: {job.title}")
         return True
-    except TelegramError as e:
-        logger.error(f"Error publishing offer: {str(e)}")
-        return False
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         return False
 
 
-def publish_generated_image(image_base64: str, theme: str, description: str):
-    """Publica una imagen generada a todos los usuarios activos del bot"""
+def _decode_image(image_base64: str):
+    """Bytes de una imagen en base64 (acepta el prefijo data:image/...;base64,)"""
+    image_data = image_base64.split(',')[1] if ',' in image_base64 else image_base64
+    try:
+        return base64.b64decode(image_data)
+    except Exception as e:
+        logger.error(f'[publish_generated_image] Error decodificando base64: {str(e)}')
+        return None
+
+
+def _image_caption(theme: str, description: str) -> str:
+    return f"<b>{theme.title()}</b>\n\n{description}\n\n📱 Generado con IA - Magneto Empleos"
+
+
+async def apublish_generated_image(image_base64: str, theme: str, description: str) -> bool:
+    """
+    Publica una imagen generada a todos los usuarios activos del bot
+
+    Lee los usuarios con el ORM async y envía las fotos en paralelo con httpx
+    (BROADCAST_CONCURRENCY en vuelo; el rate limiter marca el ritmo real).
+
+    Returns:
+        True si al menos un envío fue exitoso
+    """
     if not TOKEN:
         logger.warning('TELEGRAM_TOKEN not configured')
         return False
-    
-    try:
-        import io
-        import base64
-        import requests
-        from apps.telegram_agent.models import TelegramUser
-        
-        # Obtener todos los usuarios activos
-        active_users = TelegramUser.objects.filter(is_active=True)
-        
-        if not active_users.exists():
-            logger.warning('[publish_generated_image] No hay usuarios activos para enviar imagen')
-            return False
-        
-        logger.info(f'[publish_generated_image] Enviando imagen a {active_users.count()} usuarios')
-        
-        # Decodificar base64 una sola vez
-        if ',' in image_base64:
-            image_data = image_base64.split(',')[1]
-        else:
-            image_data = image_base64
-        
-        try:
-            image_bytes = base64.b64decode(image_data)
-        except Exception as e:
-            logger.error(f'[publish_generated_image] Error decodificando base64: {str(e)}')
-            return False
-        
-        # Crear mensaje
-        caption = f"<b>{theme.title()}</b>\n\n{description}\n\n📱 Generado con IA - Magneto Empleos"
-        
-        # Usar API REST de Telegram
-        url = f"https://api.telegram.org/bot{TOKEN}/sendPhoto"
-        
-        # Enviar a cada usuario
-        success_count = 0
-        error_count = 0
-        
-        for user in active_users:
+
+    from apps.telegram_agent.models import TelegramUser
+
+    image_bytes = _decode_image(image_base64)
+    if image_bytes is None:
+        return False
+
+    chat_ids = [
+        telegram_id async for telegram_id in
+        TelegramUser.objects.filter(is_active=True).values_list('telegram_id', flat=True)
+    ]
+    if not chat_ids:
+        logger.warning('[publish_generated_image] No hay usuarios activos para enviar imagen')
+        return False
+
+    logger.info(f'[publish_generated_image] Enviando imagen a {len(chat_ids)} usuarios')
+    caption = _image_caption(theme, description)
+    semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+
+    async def send(client, chat_id) -> bool:
+        async with semaphore:
             try:
-                # Crear BytesIO fresh para cada usuario
-                image_io = io.BytesIO(image_bytes)
-                
-                files = {'photo': ('image.png', image_io, 'image/png')}
-                data = {
-                    'chat_id': user.telegram_id,
-                    'caption': caption,
-                    'parse_mode': 'HTML'
-                }
-                
-                logger.info(f'[publish_generated_image] Enviando a usuario {user.telegram_id}...')
-                
-                response = requests.post(url, files=files, data=data, timeout=30)
-                
-                if response.status_code == 200:
-                    logger.info(f'[publish_generated_image] ✅ Enviada a usuario {user.username or user.telegram_id}')
-                    success_count += 1
-                else:
-                    logger.error(f'[publish_generated_image] ❌ Error enviando a {user.telegram_id}: {response.status_code}')
-                    logger.error(f'[publish_generated_image] Response: {response.text[:200]}')
-                    error_count += 1
-            
+                response = await asend_api_request(
+                    'sendPhoto',
+                    {'chat_id': chat_id, 'caption': caption, 'parse_mode': 'HTML'},
+                    files={'photo': ('image.png', image_bytes, 'image/png')},
+                    priority=PRIORITY_BULK,
+                    token=TOKEN,
+                    client=client,
+                )
             except Exception as e:
-                logger.error(f'[publish_generated_image] Error enviando a usuario {user.telegram_id}: {str(e)}')
-                error_count += 1
-        
-        logger.info(f'[publish_generated_image] Resumen: {success_count} exitosas, {error_count} fallidas')
-        
-        # Retornar True si al menos una fue exitosa
-        return success_count > 0
-    
-    except Exception as e:
-        logger.error(f'[publish_generated_image] Error inesperado: {str(e)}')
-        import traceback
-        logger.error(traceback.format_exc())
-        return False
\ No newline at end of file
+                logger.error(f'[publish_generated_image] Error enviando a usuario {chat_id}: {str(e)}')
+                return False
+            if response.status_code != 200:
+                logger.error(f'[publish_generated_image] Error enviando a {chat_id}: '
+                             f'{response.status_code} {response.text[:200]}')
+                return False
+            return True
+
+    # Un cliente (y su pool de conexiones) para todo el envío, cerrado al terminar
+    async with async_http_client() as client:
+        results = await asyncio.gather(*(send(client, chat_id) for chat_id in chat_ids))
+    success_count = sum(results)
+    logger.info(f'[publish_generated_image] Resumen: {success_count} exitosas, '
+                f'{len(results) - success_count} fallidas')
+    return success_count > 0
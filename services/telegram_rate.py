@@ -0,0 +1,287 @@
+"""
+Planificador global de envíos a Telegram
+Todos los envíos (respuestas del bot, broadcasts, publicaciones) pasan por aquí
+para respetar los límites de la Bot API: ~30 msg/s globales, ~1 msg/s por chat
+y 20 msg/min por grupo. Las respuestas interactivas tienen prioridad sobre los
+envíos masivos y un 429 (retry_after) pausa los envíos el tiempo indicado.
+
+Los límites son por proceso: si el bot y Celery envían a la vez, repartir
+TELEGRAM_GLOBAL_RATE entre ambos.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+import httpx
+from dotenv import load_dotenv
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))          # msg/s
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '1'))               # msg/s por chat
+TELEGRAM_GROUP_RATE = float(os.getenv('TELEGRAM_GROUP_RATE', '20')) / 60       # msg/min por grupo
+TELEGRAM_CHAT_BURST = int(os.getenv('TELEGRAM_CHAT_BURST', '3'))               # ráfaga por chat
+TELEGRAM_BULK_HEADROOM = int(os.getenv('TELEGRAM_BULK_HEADROOM', '5'))         # ráfaga reservada a lo interactivo
+TELEGRAM_MAX_RETRIES = int(os.getenv('TELEGRAM_MAX_RETRIES', '3'))
+# Envíos masivos en vuelo a la vez (broadcasts, publicación de imágenes)
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', str(int(TELEGRAM_GLOBAL_RATE))))
+
+# Prioridades (pasar como rate_limit_args en las llamadas de PTB)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+# Métodos que no son mensajes y no cuentan para los límites de envío
+UNLIMITED_METHODS = frozenset({'sendChatAction'})
+# Ediciones: no consumen el cupo de mensajes del chat, solo el límite global
+GLOBAL_ONLY_METHODS = frozenset({
+    'editMessageText', 'editMessageCaption', 'editMessageMedia', 'editMessageReplyMarkup',
+})
+
+# Tamaño del registro de chats a partir del cual se limpian los inactivos
+_CHAT_PRUNE_SIZE = 10000
+
+
+def _bucket_chat(method: str, chat_id):
+    """Chat cuyo bucket consume la llamada (None = solo el bucket global)"""
+    return None if method in GLOBAL_ONLY_METHODS else chat_id
+
+
+class _Bucket:
+    """
+    Token bucket en forma GCRA: guarda el "tiempo teórico de llegada" (tat)
+    en lugar del número de tokens
+    """
+
+    __slots__ = ('interval', 'tolerance', 'tat')
+
+    def __init__(self, rate: float, burst: int):
+        self.interval = 1 / rate
+        self.tolerance = (max(1, burst) - 1) * self.interval
+        self.tat = 0.0
+
+    def delay(self, now: float, reserve: int = 0) -> float:
+        """Segundos hasta poder enviar dejando `reserve` envíos de ráfaga libres"""
+        return max(0.0, self.tat - (self.tolerance - reserve * self.interval) - now)
+
+    def consume(self, now: float):
+        self.tat = max(self.tat, now) + self.interval
+
+
+class TelegramRateScheduler:
+    """
+    Token buckets global y por chat, compartidos por código sync y async
+
+    Los envíos masivos solo toman un token si quedan TELEGRAM_BULK_HEADROOM
+    libres en la ráfaga global, y no reservan turno mientras esperan: una
+    respuesta interactiva que llega después sale antes que la cola de broadcast.
+    """
+
+    def __init__(self, global_rate: float = TELEGRAM_GLOBAL_RATE,
+                 chat_rate: float = TELEGRAM_CHAT_RATE,
+                 group_rate: float = TELEGRAM_GROUP_RATE,
+                 chat_burst: int = TELEGRAM_CHAT_BURST,
+                 bulk_headroom: int = TELEGRAM_BULK_HEADROOM):
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.bulk_headroom = bulk_headroom
+        self.throttled = 0
+        self.retries = 0
+        self._global = _Bucket(global_rate, int(global_rate))
+        self._chats = {}
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _chat_bucket(self, chat_id, now: float) -> _Bucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= _CHAT_PRUNE_SIZE:
+                # Un bucket con tat vencido está lleno: equivale a no tenerlo
+                self._chats = {key: b for key, b in self._chats.items() if b.tat > now}
+            is_group = str(chat_id).startswith('-')
+            bucket = self._chats[chat_id] = _Bucket(
+                self.group_rate if is_group else self.chat_rate, self.chat_burst
+            )
+        return bucket
+
+    def try_acquire(self, chat_id=None, priority: int = PRIORITY_INTERACTIVE) -> float:
+        """
+        Toma un turno de envío si está disponible
+
+        Returns:
+            0 si se puede enviar ya; si no, segundos a esperar antes de reintentar
+        """
+        now = time.monotonic()
+        with self._lock:
+            reserve = self.bulk_headroom if priority >= PRIORITY_BULK else 0
+            wait = max(self._paused_until - now, self._global.delay(now, reserve))
+            chat_bucket = self._chat_bucket(chat_id, now) if chat_id is not None else None
+            if chat_bucket is not None:
+                wait = max(wait, chat_bucket.delay(now))
+            if wait > 0:
+                return wait
+            self._global.consume(now)
+            if chat_bucket is not None:
+                chat_bucket.consume(now)
+            return 0.0
+
+    async def acquire(self, chat_id=None, priority: int = PRIORITY_INTERACTIVE):
+        """Espera (sin bloquear el loop) hasta tener turno de envío"""
+        wait = self.try_acquire(chat_id, priority)
+        if wait:
+            self.throttled += 1
+        while wait:
+            await asyncio.sleep(wait)
+            wait = self.try_acquire(chat_id, priority)
+
+    def acquire_sync(self, chat_id=None, priority: int = PRIORITY_INTERACTIVE):
+        """Espera (bloqueando el thread) hasta tener turno de envío"""
+        wait = self.try_acquire(chat_id, priority)
+        if wait:
+            self.throttled += 1
+        while wait:
+            time.sleep(wait)
+            wait = self.try_acquire(chat_id, priority)
+
+    def pause(self, retry_after: float):
+        """Detiene todos los envíos tras un 429 de Telegram"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        logger.warning(f"[TelegramRate] 429 recibido, envíos pausados {retry_after}s")
+
+    def stats(self) -> dict:
+        return {
+            'throttled': self.throttled,
+            'retries': self.retries,
+            'tracked_chats': len(self._chats),
+        }
+
+
+# Planificador compartido del proceso
+scheduler = TelegramRateScheduler()
+
+
+class TelegramRateLimiter(BaseRateLimiter):
+    """
+    Rate limiter de python-telegram-bot que usa el planificador compartido
+
+    Uso: ApplicationBuilder().rate_limiter(TelegramRateLimiter()) o
+    ExtBot(token, rate_limiter=TelegramRateLimiter()). La prioridad se indica
+    con rate_limit_args=PRIORITY_BULK (por defecto interactiva). sendChatAction
+    no se limita y las ediciones solo cuentan para el límite global.
+    """
+
+    def __init__(self, rate_scheduler: TelegramRateScheduler = None,
+                 max_retries: int = TELEGRAM_MAX_RETRIES):
+        self.scheduler = rate_scheduler or scheduler
+        self.max_retries = max_retries
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        priority = rate_limit_args if rate_limit_args is not None else PRIORITY_INTERACTIVE
+
+        for attempt in range(self.max_retries + 1):
+            # getUpdates, setWebhook, etc. no van a un chat y no se limitan
+            if chat_id is not None and endpoint not in UNLIMITED_METHODS:
+                await self.scheduler.acquire(_bucket_chat(endpoint, chat_id), priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                self.scheduler.retries += 1
+                self.scheduler.pause(float(e.retry_after))
+
+
+def send_api_request(method: str, data: dict, files: dict = None,
+                     priority: int = PRIORITY_INTERACTIVE, token: str = None,
+                     timeout: float = 30):
+    """
+    Llama a un método de la Bot API con requests respetando los límites (sincrónico)
+
+    Args:
+        method: Método de la Bot API (sendMessage, sendPhoto...)
+        data: Parámetros del método (incluye chat_id)
+        files: Archivos a subir (se rebobinan en cada reintento)
+        priority: PRIORITY_INTERACTIVE o PRIORITY_BULK
+        token: Token del bot (por defecto TELEGRAM_TOKEN)
+
+    Returns:
+        requests.Response de la última llamada
+    """
+    import requests
+
+    url = f"https://api.telegram.org/bot{token or os.getenv('TELEGRAM_TOKEN')}/{method}"
+    for attempt in range(TELEGRAM_MAX_RETRIES + 1):
+        if method not in UNLIMITED_METHODS:
+            scheduler.acquire_sync(_bucket_chat(method, data.get('chat_id')), priority)
+        for _, file_tuple in (files or {}).items():
+            file_tuple[1].seek(0)
+        response = requests.post(url, data=data, files=files, timeout=timeout)
+        if response.status_code != 429 or attempt >= TELEGRAM_MAX_RETRIES:
+            return response
+        try:
+            retry_after = response.json().get('parameters', {}).get('retry_after', 1)
+        except ValueError:
+            retry_after = 1
+        scheduler.retries += 1
+        scheduler.pause(float(retry_after))
+    return response
+
+
+def async_http_client() -> httpx.AsyncClient:
+    """
+    Cliente httpx para varios envíos seguidos (usar con async with)
+
+    Se abre por operación y no se cachea: con WSGI cada request async corre
+    en su propio event loop y un cliente guardado por loop nunca se cerraba.
+    """
+    return httpx.AsyncClient(limits=httpx.Limits(max_connections=BROADCAST_CONCURRENCY * 2))
+
+
+async def asend_api_request(method: str, data: dict, files: dict = None,
+                            priority: int = PRIORITY_INTERACTIVE, token: str = None,
+                            timeout: float = 30, client: httpx.AsyncClient = None) -> httpx.Response:
+    """
+    Versión asíncrona de send_api_request (httpx, no bloquea el event loop)
+
+    Args:
+        method: Método de la Bot API (sendMessage, sendPhoto...)
+        data: Parámetros del método (incluye chat_id)
+        files: Archivos a subir {campo: (nombre, bytes, mime)}
+        priority: PRIORITY_INTERACTIVE o PRIORITY_BULK
+        token: Token del bot (por defecto TELEGRAM_TOKEN)
+        client: Cliente de async_http_client() abierto por quien llama (envíos
+            masivos); si no se pasa, se abre y cierra uno para esta llamada
+
+    Returns:
+        httpx.Response de la última llamada
+    """
+    if client is None:
+        async with async_http_client() as client:
+            return await asend_api_request(method, data, files, priority, token, timeout, client)
+
+    url = f"https://api.telegram.org/bot{token or os.getenv('TELEGRAM_TOKEN')}/{method}"
+    for attempt in range(TELEGRAM_MAX_RETRIES + 1):
+        if method not in UNLIMITED_METHODS:
+            await scheduler.acquire(_bucket_chat(method, data.get('chat_id')), priority)
+        response = await client.post(url, data=data, files=files, timeout=timeout)
+        if response.status_code != 429 or attempt >= TELEGRAM_MAX_RETRIES:
+            return response
+        try:
+            retry_after = response.json().get('parameters', {}).get('retry_after', 1)
+        except ValueError:
+            retry_after = 1
+        scheduler.retries += 1
+        scheduler.pause(float(retry_after))
+    return response
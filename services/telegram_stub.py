@@ -0,0 +1,190 @@
+"""
+Bot API de Telegram simulada para pruebas de carga
+Servidor HTTP local (stdlib) que entrega updates por getUpdates y acepta los
+envíos del bot (sendMessage, sendPhoto, editMessageText...) sin salir a internet.
+Se usa con ApplicationBuilder().base_url(server.base_url).
+"""
+import json
+import time
+import logging
+import threading
+from collections import Counter
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {
+    'id': 1,
+    'is_bot': True,
+    'first_name': 'LoadTestBot',
+    'username': 'loadtest_bot',
+    'can_join_groups': False,
+    'can_read_all_group_messages': False,
+    'supports_inline_queries': False,
+}
+
+# Métodos cuyo resultado es un mensaje enviado al chat
+MESSAGE_METHODS = {'sendMessage', 'sendPhoto', 'editMessageText'}
+
+
+def _parse_body(content_type: str, body: bytes) -> dict:
+    """Lee los parámetros de la petición (json, urlencoded o multipart)"""
+    if not body:
+        return {}
+    if content_type.startswith('application/json'):
+        return json.loads(body)
+    if content_type.startswith('multipart/form-data'):
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        params = {}
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if name and part.get_filename() is None:
+                params[name] = part.get_content()
+        return params
+    return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+
+class FakeTelegramServer:
+    """
+    Bot API falsa con cola de updates y registro de envíos
+
+    Args:
+        on_send: Callback on_send(chat_id, method, text) por cada mensaje del bot.
+            Se llama desde el thread del servidor.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, on_send=None):
+        self.on_send = on_send
+        self.requests = Counter()
+        self._updates = []
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._cond = threading.Condition()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"[FakeTelegram] Escuchando en {self.base_url}")
+
+    def stop(self):
+        with self._cond:
+            self._cond.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+
+    # ---------- Updates ----------
+
+    def push_message(self, user_id: int, text: str, username: str = None):
+        """Encola un mensaje de texto de un usuario (privado) como update"""
+        with self._cond:
+            message = {
+                'message_id': self._next_message_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {
+                    'id': user_id,
+                    'is_bot': False,
+                    'first_name': 'Usuario',
+                    'username': username or f"user{user_id}",
+                },
+                'text': text,
+            }
+            if text.startswith('/'):
+                command = text.split()[0]
+                message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+            self._updates.append({'update_id': self._next_update_id, 'message': message})
+            self._next_update_id += 1
+            self._next_message_id += 1
+            self._cond.notify_all()
+
+    def _get_updates(self, params: dict) -> list:
+        offset = int(params.get('offset') or 0)
+        timeout = float(params.get('timeout') or 0)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            # Los updates con id menor al offset ya fueron confirmados
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._server_running():
+                    break
+                self._cond.wait(remaining)
+            return list(self._updates[:int(params.get('limit') or 100)])
+
+    def _server_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # ---------- Envíos del bot ----------
+
+    def _sent_message(self, method: str, params: dict) -> dict:
+        chat_id = int(params.get('chat_id'))
+        text = params.get('text') or params.get('caption') or ''
+        if method == 'editMessageText':
+            message_id = int(params.get('message_id'))
+        else:
+            with self._cond:
+                message_id = self._next_message_id
+                self._next_message_id += 1
+        if self.on_send:
+            self.on_send(chat_id, method, text)
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': text,
+        }
+
+    def dispatch(self, method: str, params: dict):
+        """Resultado de un método de la Bot API"""
+        self.requests[method] += 1
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'getUpdates':
+            return self._get_updates(params)
+        if method in MESSAGE_METHODS:
+            return self._sent_message(method, params)
+        # sendChatAction, deleteWebhook, setMyCommands, etc.
+        return True
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                method = self.path.rstrip('/').rsplit('/', 1)[-1]
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    params = _parse_body(self.headers.get('Content-Type', ''), self.rfile.read(length))
+                    payload = {'ok': True, 'result': server.dispatch(method, params)}
+                    status = 200
+                except Exception as e:
+                    logger.error(f"[FakeTelegram] Error en {method}: {str(e)}")
+                    payload = {'ok': False, 'error_code': 400, 'description': str(e)}
+                    status = 400
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
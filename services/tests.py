@@ -0,0 +1,264 @@
+import gc
+import asyncio
+from unittest import mock
+
+import google.generativeai as genai
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase
+from google.api_core import exceptions as google_exceptions
+
+from services import circuit_breaker, gemini_keys, gemini_transport
+from services.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from services.gemini_client import GeminiClient
+from services.gemini_keys import ApiKey, KeyPool, PooledModel
+from services.gemini_transport import GeminiTransport
+
+
+class FakeClock:
+    """time.monotonic controlable desde la prueba"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class FailingModel:
+    """Modelo que siempre falla con el error indicado"""
+
+    def __init__(self, error: Exception):
+        self.error = error
+        self.calls = 0
+
+    def generate_content(self, contents, **kwargs):
+        self.calls += 1
+        raise self.error
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    """Estados del circuito: cerrado, abierto y llamada de prueba"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(circuit_breaker.time, 'monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker('modelo', failure_threshold=3, window=60, cooldown=30)
+
+    def _fail(self, times: int):
+        for _ in range(times):
+            self.breaker.record_failure()
+
+    def test_opens_after_threshold_within_window(self):
+        self._fail(2)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+        self._fail(1)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_failures_outside_window_do_not_open(self):
+        self._fail(2)
+        self.clock.advance(61)
+        self._fail(2)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_single_probe_after_cooldown_then_closes(self):
+        self._fail(3)
+        self.clock.advance(29)
+        self.assertFalse(self.breaker.allow())
+
+        self.clock.advance(1)
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        # Solo una llamada de prueba a la vez
+        self.assertFalse(self.breaker.allow())
+
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_probe_reopens(self):
+        self._fail(3)
+        self.clock.advance(30)
+        self.assertTrue(self.breaker.allow())
+
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_stale_probe_allows_a_new_one(self):
+        self._fail(3)
+        self.clock.advance(30)
+        self.assertTrue(self.breaker.allow())
+
+        # La prueba nunca informó su resultado (p. ej. cancelada)
+        self.clock.advance(29)
+        self.assertFalse(self.breaker.allow())
+        self.clock.advance(1)
+        self.assertTrue(self.breaker.allow())
+
+
+@mock.patch.object(gemini_transport.time, 'sleep', lambda seconds: None)
+class TransportBreakerTests(SimpleTestCase):
+    """Cada intento reintentado cuenta para el circuito"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        for module in (circuit_breaker, gemini_transport):
+            patcher = mock.patch.object(module.time, 'monotonic', self.clock)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker('modelo', failure_threshold=3, window=60, cooldown=30)
+        self.transport = GeminiTransport('modelo', max_retries=10, breaker=self.breaker)
+
+    def test_retries_stop_once_circuit_opens(self):
+        model = FailingModel(google_exceptions.ServiceUnavailable('caído'))
+
+        with self.assertRaises(google_exceptions.ServiceUnavailable):
+            self.transport.generate(model, 'hola')
+
+        self.assertEqual(model.calls, 3)
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_non_retryable_error_is_not_counted(self):
+        model = FailingModel(google_exceptions.InvalidArgument('prompt inválido'))
+
+        with self.assertRaises(google_exceptions.InvalidArgument):
+            self.transport.generate(model, 'hola')
+
+        self.assertEqual(model.calls, 1)
+        self.assertEqual(self.breaker.stats()['recent_failures'], 0)
+
+
+class FakeStreamChunk:
+    def __init__(self, tokens: int):
+        self.usage_metadata = mock.Mock(total_token_count=tokens)
+
+
+class FakeStreamResponse:
+    """Respuesta en streaming con fragmentos que informan sus tokens"""
+
+    text = 'hola'
+
+    def __init__(self, *tokens):
+        self.tokens = tokens
+
+    async def __aiter__(self):
+        for tokens in self.tokens:
+            yield FakeStreamChunk(tokens)
+
+
+class KeyPoolTests(SimpleTestCase):
+    """Selección de keys, cupos del último minuto, pausas por cuota y streaming"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(gemini_keys.time, 'monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = KeyPool('text', ['a', 'b'], rpm=2, tpm=1000, bench_seconds=60)
+
+    def test_picks_least_loaded_key(self):
+        first, _ = self.pool.acquire(100)
+        second, _ = self.pool.acquire(100)
+        self.assertNotEqual(first.name, second.name)
+
+    def test_rpm_and_tpm_window(self):
+        key, usage = self.pool.acquire(100)
+        self.pool.release(key, usage, tokens=300)
+        self.assertEqual(self.pool.stats()[key.name], {'rpm': 1, 'tpm': 300, 'in_flight': 0, 'benched': False})
+
+        self.clock.advance(61)
+        self.assertEqual(self.pool.stats()[key.name]['rpm'], 0)
+        self.assertEqual(self.pool.stats()[key.name]['tpm'], 0)
+
+    def test_key_over_tpm_is_skipped(self):
+        busy, usage = self.pool.acquire(1000)
+        self.pool.release(busy, usage)
+        for _ in range(2):
+            key, usage = self.pool.acquire(10)
+            self.assertNotEqual(key.name, busy.name)
+            self.pool.release(key, usage)
+
+    def test_quota_error_benches_key(self):
+        model = PooledModel('modelo', self.pool)
+        failing = FailingModel(google_exceptions.ResourceExhausted('cuota'))
+        with mock.patch.object(ApiKey, 'model', return_value=failing):
+            with self.assertRaises(google_exceptions.ResourceExhausted):
+                model.generate_content('hola')
+
+        benched = [name for name, stats in self.pool.stats().items() if stats['benched']]
+        self.assertEqual(len(benched), 1)
+        self.assertEqual(self.pool.stats()[benched[0]]['in_flight'], 0)
+        # Mientras dure la pausa se usa la otra key
+        for _ in range(2):
+            key, _ = self.pool.acquire()
+            self.assertNotEqual(key.name, benched[0])
+
+        self.clock.advance(61)
+        self.assertFalse(any(stats['benched'] for stats in self.pool.stats().values()))
+
+    def _stream(self, response):
+        model = PooledModel('modelo', KeyPool('text', ['a'], rpm=0, tpm=0))
+        async_model = mock.Mock()
+        async_model.generate_content_async = mock.AsyncMock(return_value=response)
+        with mock.patch.object(ApiKey, 'amodel', return_value=async_model):
+            stream = async_to_sync(model.generate_content_async)('hola', stream=True)
+        return model.pool, stream
+
+    def test_stream_releases_key_after_last_chunk(self):
+        pool, stream = self._stream(FakeStreamResponse(5, 42))
+        self.assertEqual(pool.stats()['text-1']['in_flight'], 1)
+
+        async def consume():
+            return [chunk async for chunk in stream]
+
+        self.assertEqual(len(async_to_sync(consume)()), 2)
+        self.assertEqual(pool.stats()['text-1'], {'rpm': 1, 'tpm': 42, 'in_flight': 0, 'benched': False})
+        self.assertEqual(stream.text, 'hola')
+
+    def test_discarded_stream_releases_key(self):
+        pool, stream = self._stream(FakeStreamResponse(5))
+        del stream
+        gc.collect()
+        self.assertEqual(pool.stats()['text-1']['in_flight'], 0)
+
+    def test_generative_model_client_attributes(self):
+        # ApiKey.model/amodel asignan estos atributos privados (google-generativeai 0.7.2)
+        model = genai.GenerativeModel('modelo')
+        self.assertTrue(hasattr(model, '_client'))
+        self.assertTrue(hasattr(model, '_async_client'))
+
+
+class StalledStreamModel:
+    """Modelo cuyo stream envía un fragmento y luego se detiene"""
+
+    async def generate_content_async(self, contents, **kwargs):
+        return self
+
+    async def __aiter__(self):
+        yield mock.Mock(parts=[1], text='Hola')
+        await asyncio.sleep(60)
+
+
+class ResponseStreamDeadlineTests(SimpleTestCase):
+    """Un stream detenido termina al vencer el tiempo total de la llamada"""
+
+    def test_stalled_stream_ends_with_error(self):
+        client = GeminiClient(fallback_models=[])
+        client.model = StalledStreamModel()
+        client.transport = GeminiTransport('modelo', retry_budget=0.2)
+        stream = client.astream_response('hola')
+
+        async def consume():
+            return [fragment async for fragment in stream]
+
+        self.assertEqual(async_to_sync(consume)(), ['Hola'])
+        self.assertTrue(stream.result['error'])
+        self.assertIn('stream', stream.result['error_detail'])
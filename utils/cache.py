@@ -0,0 +1,80 @@
+"""
+Caché en memoria acotada (LRU + TTL) con contadores de aciertos y fallos
+Thread-safe: se usa tanto desde el bot (threads de BD) como desde Django
+"""
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Caché LRU con expiración por tiempo"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        """
+        Args:
+            maxsize: Número máximo de entradas (se expulsa la menos usada)
+            ttl: Segundos que vive cada entrada (0 o None = sin expiración)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Obtiene un valor (cuenta acierto o fallo)"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                # La entrada expirada se conserva (ver peek) hasta que la expulse el LRU
+            self.misses += 1
+            return default
+
+    def peek(self, key, default=None):
+        """Obtiene un valor aunque haya expirado, sin contar acierto ni fallo"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def set(self, key, value):
+        """Guarda un valor, expulsando la entrada menos usada si está llena"""
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Elimina una entrada (invalidación)"""
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        """Vacía la caché (no reinicia los contadores)"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Estadísticas de uso de la caché"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hit_rate': (self.hits / total) if total else 0.0,
+        }
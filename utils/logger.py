@@ -1,8 +1,168 @@
+"""
+Configuración de logs sin bloquear el event loop
+Los handlers reales (consola y archivo) se ejecutan en un thread aparte
+(QueueListener); los loggers solo encolan el registro. Las líneas INFO de rutina
+de los módulos por mensaje pueden muestrearse con LOG_SAMPLE_RATE.
+Se activa desde settings con LOGGING_CONFIG = 'utils.logger.configure_logging'.
+"""
+import os
+import queue
+import atexit
+import random
 import logging
+from logging.handlers import QueueHandler, QueueListener
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Los handlers los define settings.LOGGING (este logger propaga a root)
 logger = logging.getLogger('recruitment_bot')
-if not logger.handlers:
-    h = logging.StreamHandler()
-    formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
-    h.setFormatter(formatter)
-    logger.addHandler(h)
-    logger.setLevel(logging.INFO)
+
+# '0' escribe los logs en el mismo thread (útil para depurar la configuración)
+LOG_QUEUE = os.getenv('LOG_QUEUE', '1') == '1'
+# Registros en espera antes de descartar (nunca se bloquea al loguear)
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+# Fracción de líneas INFO/DEBUG que se conservan en los módulos muestreados
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1.0'))
+LOG_SAMPLED_LOGGERS = tuple(
+    name.strip() for name in os.getenv(
+        'LOG_SAMPLED_LOGGERS',
+        'apps.telegram_agent.bot,apps.telegram_agent.views,services.gemini_client'
+    ).split(',') if name.strip()
+)
+
+# Atributos propios de LogRecord (el resto son campos de extra={...})
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listeners = []
+_replaced = []  # (logger, handlers originales)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Conserva una fracción de las líneas de rutina de los módulos por mensaje
+
+    WARNING o superior y los registros con excepción se conservan siempre.
+    """
+
+    def __init__(self, rate: float = LOG_SAMPLE_RATE, loggers: tuple = LOG_SAMPLED_LOGGERS):
+        super().__init__()
+        self.rate = rate
+        self.loggers = tuple(loggers)
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1 or record.levelno > logging.INFO or record.exc_info:
+            return True
+        if not any(record.name == name or record.name.startswith(name + '.') for name in self.loggers):
+            return True
+        if random.random() < self.rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+class KeyValueFormatter(logging.Formatter):
+    """
+    Formato clave=valor, incluyendo los campos pasados con extra={...}
+
+    Ejemplo:
+        ts=2024-05-01T10:00:00 level=INFO logger=services.gemini_client msg="Respuesta generada" user_id=42 chars=512
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                fields[key] = value
+        line = ' '.join(f"{key}={_quote(value)}" for key, value in fields.items())
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+def _quote(value) -> str:
+    text = str(value)
+    if not text or any(char in text for char in ' "=\n'):
+        return '"' + text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+    return text
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler que descarta en vez de esperar si la cola está llena"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # La cola es del mismo proceso: se conserva exc_info para que el
+        # traceback se formatee en el thread del listener
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def stop_logging():
+    """Detiene los listeners (escribiendo los registros pendientes) y restaura los handlers"""
+    while _listeners:
+        _listeners.pop().stop()
+    while _replaced:
+        item, handlers = _replaced.pop()
+        item.handlers = handlers
+
+
+def _use_queue(sampling: SamplingFilter):
+    """Reemplaza los handlers de cada logger por un QueueHandler"""
+    loggers = [logging.getLogger()] + [
+        item for item in logging.Logger.manager.loggerDict.values()
+        if isinstance(item, logging.Logger)
+    ]
+    # Loggers con los mismos handlers comparten cola y listener
+    queued = {}
+    for item in loggers:
+        handlers = tuple(item.handlers)
+        if not handlers or any(isinstance(h, QueueHandler) for h in handlers):
+            continue
+        key = tuple(id(h) for h in handlers)
+        if key not in queued:
+            handler = _NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+            handler.addFilter(sampling)
+            listener = QueueListener(handler.queue, *handlers, respect_handler_level=True)
+            listener.start()
+            _listeners.append(listener)
+            queued[key] = handler
+        _replaced.append((item, list(handlers)))
+        item.handlers = [queued[key]]
+
+
+def configure_logging(logging_settings: dict):
+    """
+    LOGGING_CONFIG de Django: aplica settings.LOGGING y mueve la escritura a un thread
+
+    Args:
+        logging_settings: Diccionario de settings.LOGGING
+    """
+    from django.utils.log import configure_logging as django_configure_logging
+
+    # django.setup() puede llamarse más de una vez en el mismo proceso
+    stop_logging()
+    django_configure_logging('logging.config.dictConfig', logging_settings)
+    if LOG_QUEUE:
+        _use_queue(SamplingFilter())
+
+
+atexit.register(stop_logging)
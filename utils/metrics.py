@@ -0,0 +1,282 @@
+"""
+Métricas en memoria (contadores, gauges e histogramas) en formato Prometheus
+Sin dependencias externas: cada proceso (web, bot, worker de Celery) tiene su
+propio registro y lo expone como texto en /metrics.
+"""
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Token opcional para leer las métricas (Authorization: Bearer <token>)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Límites (segundos) pensados para etapas de 1 ms a 30 s
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labelnames: tuple, labels: dict) -> tuple:
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Contador monótono"""
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = self.header()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Valor instantáneo; puede leerse de una función al exportar"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), callback=None):
+        """
+        Args:
+            callback: Función sin argumentos que devuelve el valor, o un dict
+                {tupla de valores de labels: valor} si la métrica tiene labels
+        """
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(self.labelnames, labels)] = value
+
+    def render(self) -> list:
+        lines = self.header()
+        values = dict(self._values)
+        if self.callback is not None:
+            try:
+                result = self.callback()
+            except Exception as e:
+                logger.warning(f"[Metrics] No se pudo leer {self.name}: {str(e)}")
+                return lines
+            if isinstance(result, dict):
+                values.update({tuple(str(v) for v in key): val for key, val in result.items()})
+            else:
+                values[()] = result
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Histograma acumulado (buckets, suma y cantidad) por combinación de labels"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = entry[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Mide la duración del bloque (también dentro de corutinas)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list:
+        lines = self.header()
+        with self._lock:
+            items = sorted((key, (list(e[0]), e[1], e[2])) for key, e in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            plain = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{plain} {_format_value(total)}")
+            lines.append(f"{self.name}_count{plain} {count}")
+        return lines
+
+
+class Registry:
+    """Registro de métricas del proceso"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames=(), callback=None) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames, callback)
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets)
+
+    def render(self) -> str:
+        """Todas las métricas en formato de texto de Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Registro compartido del proceso
+registry = Registry()
+
+# ---------- Métricas comunes ----------
+
+STAGE_SECONDS = registry.histogram(
+    'recruitment_stage_seconds',
+    'Duración de cada etapa del procesamiento de un mensaje',
+    ('flow', 'stage'),
+)
+TASK_SECONDS = registry.histogram(
+    'recruitment_task_seconds',
+    'Duración de las tareas de Celery',
+    ('task', 'status'),
+    buckets=DEFAULT_BUCKETS + (60.0, 300.0, 900.0),
+)
+
+
+def stage_timer(stage: str, flow: str = 'bot'):
+    """
+    Mide una etapa del procesamiento
+
+    Ejemplo:
+        with stage_timer('gemini_call', flow='webhook'):
+            ai_result = gemini.get_response(...)
+    """
+    return STAGE_SECONDS.time(flow=flow, stage=stage)
+
+
+def timed_task(func):
+    """Decorador para tareas de Celery: registra duración y resultado (ok/error)"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        status = 'ok'
+        try:
+            result = func(*args, **kwargs)
+            # Las tareas del proyecto devuelven "Error: ..." en vez de lanzar
+            if isinstance(result, str) and result.startswith('Error'):
+                status = 'error'
+            return result
+        except Exception:
+            status = 'error'
+            raise
+        finally:
+            TASK_SECONDS.observe(time.perf_counter() - start, task=func.__name__, status=status)
+    return wrapper
+
+
+def is_authorized(authorization_header: str) -> bool:
+    """Valida el token de METRICS_TOKEN (sin token configurado, acceso libre)"""
+    return not METRICS_TOKEN or authorization_header == f"Bearer {METRICS_TOKEN}"
+
+
+def start_metrics_server(port: int, host: str = '0.0.0.0'):
+    """
+    Expone /metrics en un thread aparte (para procesos sin Django web: bot y Celery)
+
+    Returns:
+        El servidor, o None si el puerto no está disponible
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0].rstrip('/') != '/metrics':
+                self.send_error(404)
+                return
+            if not is_authorized(self.headers.get('Authorization', '')):
+                self.send_error(401)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), Handler)
+    except OSError as e:
+        logger.warning(f"[Metrics] No se pudo abrir el puerto {port}: {str(e)}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"[Metrics] Métricas en http://{host}:{port}/metrics")
+    return server